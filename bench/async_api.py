@@ -0,0 +1,98 @@
+"""Compare concurrent throughput of the bridged (sync) and native (async) VT APIs.
+
+A local HTTP server stands in for the CF worker and answers every request after a fixed
+delay, so the numbers only reflect how many upstream calls run at the same time.
+
+    python -m bench.async_api --requests 50 --delay 0.2
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+import orjson
+
+from engines import VT, session_pool
+
+BODY = orjson.dumps({"analyse": {"data": {"id": "bench", "attributes": {}}}})
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, delay: float) -> None:
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            if length:
+                await reader.readexactly(length)
+            await asyncio.sleep(delay)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(BODY), BODY))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def start_server(delay: float) -> str:
+    """Run the fake upstream on its own loop thread and return its URL."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    port = []
+
+    async def _serve() -> None:
+        server = await asyncio.start_server(lambda r, w: _handle(r, w, delay), "127.0.0.1", 0)
+        port.append(server.sockets[0].getsockname()[1])
+        ready.set()
+
+    loop.create_task(_serve())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{port[0]}/"
+
+
+async def run_bridged(end_point: str, n: int) -> float:
+    # 与改造前的路由一致：在async函数里调用同步API，阻塞当前事件循环
+    async def _one(i: int) -> None:
+        with VT(timeout=30, cf_end_point=end_point) as vt:
+            vt.cf_api(input_str=f"{i:064x}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_one(i) for i in range(n)])
+    return time.perf_counter() - start
+
+
+async def run_native(end_point: str, n: int) -> float:
+    async def _one(i: int) -> None:
+        async with VT(timeout=30, cf_end_point=end_point) as vt:
+            await vt.acf_api(input_str=f"{i:064x}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_one(i) for i in range(n)])
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="concurrent requests per run")
+    parser.add_argument("--delay", type=float, default=0.2, help="upstream latency in seconds")
+    args = parser.parse_args()
+
+    end_point = start_server(args.delay)
+
+    async def _bench(runner) -> float:
+        try:
+            return await runner(end_point, args.requests)
+        finally:
+            await session_pool.aclose()
+
+    for name, runner in (("bridged", run_bridged), ("native", run_native)):
+        elapsed = asyncio.run(_bench(runner))
+        print(f"{name:8s} {args.requests} requests in {elapsed:.2f}s -> {args.requests / elapsed:.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
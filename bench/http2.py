@@ -0,0 +1,59 @@
+"""Compare HTTP/1.1 and HTTP/2 for the VT report fan-out: connections opened and latency per report.
+
+Each mode starts from an empty session pool, then fetches the same report `--rounds` times in a
+row; every report fans out 5-12 concurrent requests to one host.
+
+    python -m bench.http2 --ioc 275a021bbfb6489e54d471899f7db9d1663fc695ec2fe2a2c4538aabf651fd0f --rounds 5
+    python -m bench.http2 --vt-end-point https://vtcdn.darkqiank.work/ --ioc baidu.com
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from urllib.parse import urlparse
+
+from engines import VT, session_pool
+from engines.metrics import CONNECTIONS_OPENED, REQUEST_SECONDS
+
+
+def _total(metric, host: str, position: int = 1) -> float:
+    """Sum a counter, or a histogram's count, over the label sets of `host`."""
+    values = metric.snapshot()["values"]
+    return sum(v if not isinstance(v, list) else v[-1] for labels, v in values if labels[position] == host)
+
+
+async def run(http_version: str, end_point: str, ioc: str, rounds: int, proxies) -> None:
+    host = urlparse(end_point).hostname
+    connects_before = _total(CONNECTIONS_OPENED, host)
+    requests_before = _total(REQUEST_SECONDS, host)
+    latencies = []
+    try:
+        for _ in range(rounds):
+            async with VT(vt_end_point=end_point, proxies=proxies, timeout=30, http_version=http_version) as vt:
+                start = time.perf_counter()
+                await vt.aapi(ioc)
+                latencies.append(time.perf_counter() - start)
+    finally:
+        await session_pool.aclose()
+    connects = _total(CONNECTIONS_OPENED, host) - connects_before
+    sent = _total(REQUEST_SECONDS, host) - requests_before
+    print(f"HTTP/{http_version:3s} {rounds} reports, {sent:.0f} requests, {connects:.0f} connections opened "
+          f"({connects / rounds:.1f}/report), latency per report: median {statistics.median(latencies):.2f}s "
+          f"max {max(latencies):.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vt-end-point", default="https://www.virustotal.com/")
+    parser.add_argument("--ioc", default="275a021bbfb6489e54d471899f7db9d1663fc695ec2fe2a2c4538aabf651fd0f",
+                        help="hash, domain or IP to report on (a SHA-256 gives the widest fan-out)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--proxy", default=os.getenv("PROXY_URL"))
+    args = parser.parse_args()
+    for http_version in ("1.1", "2"):
+        asyncio.run(run(http_version, args.vt_end_point, args.ioc, args.rounds, args.proxy))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 import logging
 
-from .client import Client
-from .client_async import AsyncClient
+from .client import Client, LoopPool, loop_pool
+from .client_async import AsyncClient, SessionPool, session_pool
+from .ratelimit import TokenBucket, RateLimiterRegistry, rate_limits
+from .singleflight import SingleFlight
+from .retry import RetryPolicy, CircuitBreaker, breakers
+from .endpoint_pool import EndpointPool
+from .hedging import HedgePolicy, hedge_budget
+from .proxy_pool import ProxyPool
+from .bulk import bounded_map
 from engines.search.duckduckgo import DDGS
 from engines.search.duckduckgo_v2 import DDGS_V2
 from engines.search.bing import BING
@@ -11,6 +18,6 @@ from engines.devs.pconline import PCOnline
 from engines.devs.zol import ZOL
 from engines.read.url_read import URLRead
 
-__all__ = ["Client", "AsyncClient", "DDGS", "BING", "GITHUB", "VT", "PCOnline", "ZOL", "URLRead", "DDGS_V2"]
+__all__ = ["Client", "LoopPool", "loop_pool", "AsyncClient", "SessionPool", "session_pool", "TokenBucket", "RateLimiterRegistry", "rate_limits", "SingleFlight", "RetryPolicy", "CircuitBreaker", "breakers", "EndpointPool", "HedgePolicy", "hedge_budget", "ProxyPool", "bounded_map", "DDGS", "BING", "GITHUB", "VT", "PCOnline", "ZOL", "URLRead", "DDGS_V2"]
 
 logging.getLogger("engines").addHandler(logging.NullHandler())
\ No newline at end of file
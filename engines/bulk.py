@@ -0,0 +1,86 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple, TypeVar, Union
+
+from .deadline import remaining
+from .exceptions import ClientSearchException, DeadlineExceededException
+
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+
+# 批量查询默认同时进行的查询数
+BULK_CONCURRENCY = int(os.getenv("ENGINES_BULK_CONCURRENCY", "16"))
+
+
+async def bounded_map(
+    func: Callable[[K], Awaitable[T]],
+    items: Iterable[K],
+    concurrency: int = BULK_CONCURRENCY,
+    ordered: bool = False,
+    normalize: Optional[Callable[[K], K]] = None,
+) -> AsyncIterator[Tuple[K, Union[T, Exception]]]:
+    """Run `func` over `items` with at most `concurrency` calls in flight, yielding (item, result | error).
+
+    Items are normalised with `normalize` (if given) and deduplicated; `items` is consumed
+    lazily, so a generator over a large file is fine. Results are yielded as calls finish, or
+    in input order with ordered=True (then a slow item holds back at most `concurrency` results).
+    A failed call yields its exception instead of stopping the iteration; a call cancelled from
+    outside yields DeadlineExceededException (deadline passed) or ClientSearchException. Closing
+    the iterator early cancels the calls still in flight.
+    """
+    concurrency = max(1, concurrency)
+    source = iter(items)
+    seen: Set[K] = set()
+    running: Dict["asyncio.Future[T]", Tuple[int, K]] = {}
+    finished: Dict[int, Tuple[K, Union[T, Exception]]] = {}
+    next_index = 0
+    next_yield = 0
+    exhausted = False
+
+    def _fill() -> None:
+        nonlocal next_index, exhausted
+        # 有序输出时，最多领先尚未输出的第一项 concurrency 个位置，避免结果无限堆积
+        while not exhausted and len(running) < concurrency and \
+                (not ordered or next_index < next_yield + concurrency):
+            try:
+                item = next(source)
+            except StopIteration:
+                exhausted = True
+                return
+            if normalize is not None:
+                item = normalize(item)
+            if item in seen:
+                continue
+            seen.add(item)
+            running[asyncio.ensure_future(func(item))] = (next_index, item)
+            next_index += 1
+
+    try:
+        _fill()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, item = running.pop(task)
+                # 被取消的调用（如事件循环关闭、截止时间到）和其他失败一样作为结果返回，不中断迭代
+                error = _cancelled_error(item) if task.cancelled() else task.exception()
+                if error is not None and not isinstance(error, Exception):
+                    raise error
+                result: Union[T, Exception] = error if error is not None else task.result()
+                if not ordered:
+                    yield item, result
+                    continue
+                finished[index] = (item, result)
+            while next_yield in finished:
+                yield finished.pop(next_yield)
+                next_yield += 1
+            _fill()
+    finally:
+        for task in running:
+            task.cancel()
+
+
+def _cancelled_error(item: Any) -> Exception:
+    left = remaining()
+    if left is not None and left <= 0:
+        return DeadlineExceededException(f"Deadline exceeded, lookup of {item!r} cancelled")
+    return ClientSearchException(f"Lookup of {item!r} was cancelled")
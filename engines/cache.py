@@ -0,0 +1,453 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import suppress
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import orjson
+
+from .metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows：不做跨进程互斥，各进程各自清理
+    fcntl = None
+
+logger = logging.getLogger("engines.cache")
+
+CACHE_DIR = os.getenv("CACHE_DIR", "./cache")
+# 缓存目录的容量上限，超出后按最近访问时间淘汰到上限的 CACHE_LOW_WATERMARK
+CACHE_MAX_BYTES = int(os.getenv("ENGINES_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+CACHE_LOW_WATERMARK = 0.9
+CACHE_SWEEP_INTERVAL = float(os.getenv("ENGINES_CACHE_SWEEP", "300"))
+# 各类IOC报告的有效期（秒），0 表示不过期
+CACHE_TTLS = {
+    "file": float(os.getenv("ENGINES_CACHE_TTL_FILE", str(30 * 86400))),
+    "domain": float(os.getenv("ENGINES_CACHE_TTL_DOMAIN", str(86400))),
+    "ip": float(os.getenv("ENGINES_CACHE_TTL_IP", str(86400))),
+}
+CACHE_DEFAULT_TTL = float(os.getenv("ENGINES_CACHE_TTL", str(7 * 86400)))
+
+# 进程内热点缓存的容量（按JSON编码后的字节数计）和最长保留时间
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("ENGINES_MEMORY_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+MEMORY_CACHE_TTL = float(os.getenv("ENGINES_MEMORY_CACHE_TTL", "600"))
+
+CACHE_EVENTS = registry.counter(
+    "engines_cache_events_total", "Cache lookups and maintenance by outcome.", ("cache", "event"))
+# 每个worker有自己的进程内缓存，汇总时相加得到整个部署的占用
+CACHE_BYTES = registry.gauge("engines_cache_bytes", "Bytes held by in-memory caches.", ("cache",), merge="sum")
+CACHE_ENTRIES = registry.gauge("engines_cache_entries", "Entries held by in-memory caches.", ("cache",), merge="sum")
+
+_SUFFIX = ".gz"
+
+
+class FileCache:
+    """Gzip JSON entries on disk, sharded by key hash, with per-kind TTLs and LRU size eviction.
+
+    An entry lives at <directory>/<h[0:2]>/<h[2:4]>/<quoted key>.gz where h is the SHA-256 of
+    the key, so no directory holds more than a few thousand files. Writes go to a temp file in
+    the same directory and are renamed into place, so readers (and racing writers in other
+    workers) only ever see whole files. The TTL of an entry depends on `kind_of(key)` and is
+    measured from its last write; the access time is bumped on every hit and drives eviction.
+
+    Files from the old flat layout (<directory>/<key>.gz) are moved into their shard the first
+    time they are looked up.
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        kind_of: Optional[Callable[[str], str]] = None,
+        ttls: Mapping[str, float] = CACHE_TTLS,
+        default_ttl: float = CACHE_DEFAULT_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+        name: str = "reports",
+    ) -> None:
+        self.directory = directory
+        self.kind_of = kind_of
+        self.ttls = dict(ttls)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_pid: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:4], quote(key, safe="") + _SUFFIX)
+
+    def ttl(self, key: str) -> float:
+        if self.kind_of is None:
+            return self.default_ttl
+        try:
+            kind = self.kind_of(key)
+        except Exception:
+            return self.default_ttl
+        return self.ttls.get(kind, self.default_ttl)
+
+    def _count(self, event: str) -> None:
+        with self._lock:
+            setattr(self, event, getattr(self, event) + 1)
+        CACHE_EVENTS.inc(self.name, event)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """The cached value of `key`, or None when missing, expired or unreadable."""
+        return await asyncio.to_thread(self.get_sync, key)
+
+    async def set(self, key: str, value: Any) -> int:
+        """Store `value`; returns the size of its JSON encoding."""
+        return await asyncio.to_thread(self.set_sync, key, value)
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        return self.load_sync(key)[0]
+
+    def load_sync(self, key: str) -> Tuple[Optional[Any], int]:
+        """The cached value of `key` (None on a miss) and the size of its JSON encoding."""
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = self._migrate(key, path)
+            if stat is None:
+                self._count("misses")
+                return None, 0
+        ttl = self.ttl(key)
+        now = time.time()
+        if ttl and now - stat.st_mtime > ttl:
+            self._count("expired")
+            self._count("misses")
+            with suppress(OSError):
+                os.remove(path)
+            return None, 0
+        try:
+            with open(path, "rb") as f:
+                data = gzip.decompress(f.read())
+            value = orjson.loads(data)
+        except FileNotFoundError:
+            # 读取前被淘汰
+            self._count("misses")
+            return None, 0
+        except Exception as ex:
+            logger.warning(f"Dropping unreadable cache entry {path}: {type(ex).__name__}: {ex}")
+            self._count("errors")
+            self._count("misses")
+            with suppress(OSError):
+                os.remove(path)
+            return None, 0
+        # 只更新访问时间，修改时间仍是写入时间，用于判断过期
+        with suppress(OSError):
+            os.utime(path, (now, stat.st_mtime))
+        self._count("hits")
+        return value, len(data)
+
+    def set_sync(self, key: str, value: Any) -> int:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        data = orjson.dumps(value)
+        try:
+            with open(tmp, "wb") as f:
+                f.write(gzip.compress(data))
+            os.replace(tmp, path)
+        except BaseException:
+            with suppress(OSError):
+                os.remove(tmp)
+            raise
+        self._count("writes")
+        return len(data)
+
+    def delete(self, key: str) -> None:
+        with suppress(FileNotFoundError):
+            os.remove(self.path(key))
+
+    def _migrate(self, key: str, path: str) -> Optional[os.stat_result]:
+        """Move a file of the old flat layout into its shard; the stat of the moved file, or None."""
+        legacy = os.path.join(self.directory, key + _SUFFIX)
+        if os.sep in key or (os.altsep and os.altsep in key) or not os.path.isfile(legacy):
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(legacy, path)
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def start(self, interval: float = CACHE_SWEEP_INTERVAL) -> None:
+        """Start the background sweeper of this process (safe to call again after fork)."""
+        if self._sweeper is not None and self._sweeper_pid == os.getpid():
+            return
+        self._sweeper_pid = os.getpid()
+        self._sweeper = threading.Thread(target=self._sweep_loop, args=(interval,),
+                                         name=f"engines-cache-{self.name}", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as ex:
+                logger.warning(f"Cache sweep of {self.directory} failed: {type(ex).__name__}: {ex}")
+
+    def sweep(self) -> Dict[str, int]:
+        """Delete expired entries and stale temp files, then evict least recently used entries
+        until the cache is below CACHE_LOW_WATERMARK of max_bytes.
+
+        Only one process sweeps a directory at a time; the others skip their turn.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".sweep.lock"), "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return {"skipped": 1}
+            return self._sweep()
+
+    def _sweep(self) -> Dict[str, int]:
+        now = time.time()
+        entries: List[Tuple[float, int, str]] = []
+        total = expired = evicted = 0
+        for path, stat in self._scan():
+            if path.endswith(".tmp"):
+                # 写入中途崩溃留下的临时文件
+                if now - stat.st_mtime > 3600:
+                    with suppress(OSError):
+                        os.remove(path)
+                continue
+            ttl = self.ttl(unquote(os.path.basename(path)[:-len(_SUFFIX)]))
+            if ttl and now - stat.st_mtime > ttl:
+                with suppress(OSError):
+                    os.remove(path)
+                expired += 1
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+        if total > self.max_bytes:
+            target = self.max_bytes * CACHE_LOW_WATERMARK
+            entries.sort()
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                with suppress(OSError):
+                    os.remove(path)
+                    total -= size
+                    evicted += 1
+        with self._lock:
+            self.expired += expired
+            self.evictions += evicted
+        CACHE_EVENTS.inc(self.name, "expired", amount=expired)
+        CACHE_EVENTS.inc(self.name, "evictions", amount=evicted)
+        if expired or evicted:
+            logger.info(f"Cache sweep of {self.directory}: {expired} expired, {evicted} evicted, "
+                        f"{total} bytes in {len(entries) - evicted} entries")
+        return {"entries": len(entries) - evicted, "bytes": total, "expired": expired, "evicted": evicted}
+
+    def _scan(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for sub in os.scandir(shard.path):
+                if not sub.is_dir():
+                    continue
+                for entry in os.scandir(sub.path):
+                    with suppress(OSError):
+                        yield entry.path, entry.stat()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "expired": self.expired, "writes": self.writes,
+                    "evictions": self.evictions, "errors": self.errors,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else None}
+
+
+class FrequencySketch:
+    """Count-min sketch of how often keys were requested recently.
+
+    Counters saturate at 15 and are all halved every `sample_size` increments, so the
+    popularity of keys that stopped being requested fades out.
+    """
+
+    def __init__(self, width: int = 8192, depth: int = 4, sample_size: Optional[int] = None) -> None:
+        self.width = width
+        self.sample_size = sample_size or 10 * width
+        self._rows = [[0] * width for _ in range(depth)]
+        self._additions = 0
+
+    def _indexes(self, key: Hashable):
+        return [hash((seed, key)) % self.width for seed in range(len(self._rows))]
+
+    def increment(self, key: Hashable) -> None:
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < 15:
+                row[index] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            for row in self._rows:
+                row[:] = [c >> 1 for c in row]
+            self._additions //= 2
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+
+class MemoryCache:
+    """In-process LRU of decoded objects, bounded by bytes, with TinyLFU admission.
+
+    When a new entry does not fit, it only gets in if it has been requested more often
+    recently than every least-recently-used entry it would push out, so a scan of one-off
+    keys cannot flush the hot set. Sizes default to the length of the JSON encoding, a proxy
+    for the real footprint. Cached objects are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_bytes: int = MEMORY_CACHE_MAX_BYTES, ttl: float = MEMORY_CACHE_TTL,
+                 name: str = "memory") -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.name = name
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._sketch = FrequencySketch()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.admissions = 0
+        self.rejections = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        CACHE_EVENTS.inc(self.name, "misses" if entry is None else "hits")
+        return None if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None, ttl: Optional[float] = None) -> bool:
+        """Cache `value` if the admission policy lets it in; returns whether it was admitted."""
+        if size is None:
+            size = len(orjson.dumps(value))
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        evicted = 0
+        with self._lock:
+            # 已缓存的键直接更新，不走准入判断
+            updating = key in self._entries
+            if updating:
+                self._remove(key)
+            admitted = size <= self.max_bytes
+            victims = []
+            freed = 0
+            now = time.monotonic()
+            candidates = iter(self._entries.items())
+            while admitted and self.bytes - freed + size > self.max_bytes:
+                victim, (_, victim_size, expires) = next(candidates)
+                if not updating and expires >= now and \
+                        self._sketch.estimate(key) <= self._sketch.estimate(victim):
+                    admitted = False
+                    break
+                victims.append(victim)
+                freed += victim_size
+            if admitted:
+                for victim in victims:
+                    self._remove(victim)
+                evicted = len(victims)
+                self.evictions += evicted
+                self._entries[key] = (value, size, now + ttl)
+                self.bytes += size
+                self.admissions += 1
+            else:
+                self.rejections += 1
+            CACHE_BYTES.set(self.bytes, self.name)
+            CACHE_ENTRIES.set(len(self._entries), self.name)
+        CACHE_EVENTS.inc(self.name, "admissions" if admitted else "rejections")
+        if evicted:
+            CACHE_EVENTS.inc(self.name, "evictions", amount=evicted)
+        return admitted
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: Hashable) -> None:
+        """Caller holds the lock."""
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "admissions": self.admissions,
+                    "rejections": self.rejections, "evictions": self.evictions, "entries": len(self._entries),
+                    "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else None}
+
+
+class TieredCache:
+    """A MemoryCache in front of a disk tier (FileCache or SegmentStore): hot keys are served
+    decoded, without touching the disk."""
+
+    def __init__(self, memory: MemoryCache, disk: Any) -> None:
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value, size = await asyncio.to_thread(self.disk.load_sync, key)
+        if value is not None:
+            self.memory.set(key, value, size, ttl=self.disk.ttl(key) or None)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        size = await self.disk.set(key, value)
+        self.memory.set(key, value, size, ttl=self.disk.ttl(key) or None)
+
+    async def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        await asyncio.to_thread(self.disk.delete, key)
+
+    def start(self) -> None:
+        self.disk.start()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
+
+
+class DerivedView:
+    """A versioned transform of a cached report, cached next to it under "<key>#<name>@v<version>".
+
+    Bump `version` whenever `transform` changes: entries of older versions are never read again
+    and age out of the cache like any other entry.
+    """
+
+    def __init__(self, name: str, version: int, transform: Callable[[Any], Any]) -> None:
+        self.name = name
+        self.version = version
+        self.transform = transform
+
+    def key(self, key: str) -> str:
+        return f"{key}#{self.name}@v{self.version}"
@@ -1,23 +1,113 @@
 import asyncio
+import os
 from concurrent.futures import Future
-from threading import Thread
+from threading import Lock, Thread
 from types import TracebackType
-from typing import Any, Awaitable, Dict, Optional, Type, Union
-from .client_async import AsyncClient
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, List, Optional, Sequence, Type, Union
+from .client_async import HTTP_VERSION, AsyncClient
+from .deadline import current_deadline, run_with_deadline
+from .proxy_pool import ProxyPool
+
+# 同步桥接使用的事件循环线程数
+LOOP_THREADS = int(os.getenv("ENGINES_LOOP_THREADS", str(min(4, os.cpu_count() or 1))))
+
+
+class LoopPool:
+    """Pool of event loops, each running forever on its own daemon thread.
+
+    Sync callers are spread over the loops so that I/O callbacks and the parsing done in the
+    engines do not all queue behind a single loop. Loops are started on first use.
+    """
+
+    def __init__(self, size: int = LOOP_THREADS) -> None:
+        self.size = max(1, size)
+        self._loops: List[asyncio.AbstractEventLoop] = []
+        self._pending: List[int] = []
+        self._max_pending: List[int] = []
+        self._submitted: List[int] = []
+        self._lock = Lock()
+        self._next = 0
+
+    def _ensure_started(self) -> None:
+        """Start the loop threads. Caller holds the lock."""
+        if self._loops:
+            return
+        for i in range(self.size):
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, name=f"engines-loop-{i}", daemon=True).start()
+            self._loops.append(loop)
+        self._pending = [0] * self.size
+        self._max_pending = [0] * self.size
+        self._submitted = [0] * self.size
+
+    def resize(self, size: int) -> None:
+        """Change the number of loops. Only allowed before the first Client is created."""
+        with self._lock:
+            if self._loops:
+                raise RuntimeError("LoopPool already started")
+            self.size = max(1, size)
+
+    def pick(self) -> int:
+        """Index of the least busy loop, ties broken round-robin."""
+        with self._lock:
+            self._ensure_started()
+            start = self._next
+            self._next = (self._next + 1) % self.size
+            order = [(start + i) % self.size for i in range(self.size)]
+            return min(order, key=lambda i: self._pending[i])
+
+    def loop(self, index: int) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            self._ensure_started()
+            return self._loops[index]
+
+    def submit(self, index: int, coro: Awaitable[Any]) -> "Future[Any]":
+        """Schedule a coroutine on the given loop and track it in the queue-depth stats."""
+        with self._lock:
+            self._ensure_started()
+            self._pending[index] += 1
+            self._submitted[index] += 1
+            self._max_pending[index] = max(self._max_pending[index], self._pending[index])
+            loop = self._loops[index]
+        future: Future[Any] = asyncio.run_coroutine_threadsafe(coro, loop)  # type: ignore[arg-type]
+        future.add_done_callback(lambda _: self._done(index))
+        return future
+
+    def _done(self, index: int) -> None:
+        with self._lock:
+            self._pending[index] -= 1
+
+    def stats(self) -> List[Dict[str, int]]:
+        """Per-loop queue depth: in-flight coroutines, their peak and the total submitted."""
+        with self._lock:
+            return [
+                {
+                    "loop": i,
+                    "pending": self._pending[i],
+                    "max_pending": self._max_pending[i],
+                    "submitted": self._submitted[i],
+                    "ready_callbacks": len(getattr(loop, "_ready", ())),
+                }
+                for i, loop in enumerate(self._loops)
+            ]
+
+
+loop_pool = LoopPool()
 
 
 class Client(AsyncClient):
-    _loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
-    Thread(target=_loop.run_forever, daemon=True).start()  # Start the event loop run in a separate thread.
 
     def __init__(
             self,
             headers: Optional[Dict[str, str]] = None,
-            proxies: Union[Dict[str, str], str, None] = None,
+            proxies: Union[Dict[str, str], str, Sequence[str], ProxyPool, None] = None,
             timeout: Optional[int] = 10,
+            http_version: Optional[str] = HTTP_VERSION,
     ) -> None:
-        # self._exit_done = False  # 确保最先设置此属性
-        super().__init__(headers=headers, proxies=proxies, timeout=timeout,)
+        super().__init__(headers=headers, proxies=proxies, timeout=timeout, http_version=http_version)
+        # 每个实例固定在一个事件循环上，其借用的会话也绑定在该循环
+        self._loop_index = loop_pool.pick()
+        self._loop = loop_pool.loop(self._loop_index)
 
     def __enter__(self) -> "Client":
         return self
@@ -28,18 +118,36 @@ class Client(AsyncClient):
         exc_val: Optional[BaseException],
         exc_tb: Optional[TracebackType],
     ) -> None:
-        self._close_session()
+        # 会话归session_pool所有，由其统一关闭
+        pass
 
-    def __del__(self) -> None:
-        self._close_session()
-
-    def _close_session(self) -> None:
-        """Close the curl-cffi async session."""
-        if hasattr(self, "_asession") and self._asession._closed is False:
-            self._run_async_in_thread(self._asession.close())  # type: ignore
+    @staticmethod
+    def loop_stats() -> List[Dict[str, int]]:
+        """Queue-depth stats of the loops backing the sync bridge."""
+        return loop_pool.stats()
 
     def _run_async_in_thread(self, coro: Awaitable[Any]) -> Any:
-        """Runs an async coroutine in a separate thread."""
-        future: Future[Any] = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        """Runs an async coroutine on this client's loop thread and waits for the result."""
+        at = current_deadline.get()
+        if at is not None:
+            # contextvar不会跨线程传递，把调用方的截止时间带到事件循环线程上
+            coro = run_with_deadline(coro, at)
+        future = loop_pool.submit(self._loop_index, coro)
         result = future.result()
-        return result
\ No newline at end of file
+        return result
+
+    def _iter_async_in_thread(self, agen: AsyncIterator[Any]) -> Iterator[Any]:
+        """Drive an async iterator on this client's loop thread, one item per step, as a sync generator."""
+        try:
+            while True:
+                try:
+                    yield self._run_async_in_thread(_anext(agen))
+                except StopAsyncIteration:
+                    return
+        finally:
+            # 调用方提前停止迭代时，在事件循环上关闭异步生成器，取消其进行中的请求
+            self._run_async_in_thread(agen.aclose())
+
+
+async def _anext(agen: AsyncIterator[Any]) -> Any:
+    return await agen.__anext__()
@@ -1,20 +1,152 @@
 import asyncio
+import atexit
 import logging
+import os
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from types import TracebackType
-from typing import Dict, Optional, Union
+from typing import Any, Awaitable, Dict, Iterable, Optional, Sequence, Tuple, Union
 import platform
+from urllib.parse import urlparse
 
-from cffi.commontypes import resolve_common_type
-
-from .exceptions import ClientSearchException, RatelimitException, TimeoutException, NotFoundException
+from .deadline import wait_within_deadline
+from .endpoint_pool import EndpointPool
+from .hedging import HedgePolicy, path_kind
+from .metrics import CONNECTIONS_OPENED, REQUEST_EXCEPTIONS, REQUEST_SECONDS, RESPONSE_BYTES, current_relationship, status_class
+from .proxy_pool import ProxyPool, proxy_pool
+from .random_tools import fingerprint_pool
+from .exceptions import (CircuitOpenException, ClientSearchException, RatelimitException, TimeoutException,
+                         NotFoundException)
+from .ratelimit import OVERLOAD_STATUS, rate_limits
+from .retry import breakers
+from .singleflight import SingleFlight, freeze
 from curl_cffi import requests
+from curl_cffi.const import CurlHttpVersion, CurlInfo, CurlMOpt, CurlOpt
 import gzip
-import io
 
 logger = logging.getLogger("engines.AsyncClient")
 
+# 单个会话同时进行的传输数上限，以及每个host的连接数上限
+SESSION_MAX_CLIENTS = int(os.getenv("ENGINES_SESSION_MAX_CLIENTS", "32"))
+SESSION_MAX_PER_HOST = int(os.getenv("ENGINES_SESSION_MAX_PER_HOST", "8"))
+# 合并进程内相同的并发请求，设为0关闭
+SINGLE_FLIGHT = os.getenv("ENGINES_SINGLE_FLIGHT", "1") != "0"
+# HTTP版本："2" 通过ALPN协商并优先使用HTTP/2（同host的并发请求复用一个连接），"1.1" 强制HTTP/1.1
+HTTP_VERSION = os.getenv("ENGINES_HTTP_VERSION", "2")
+_HTTP_VERSIONS = {"1.1": CurlHttpVersion.V1_1, "2": CurlHttpVersion.V2TLS}
+# curl的CURL_HTTP_VERSION_*取值 -> 指标标签
+_HTTP_VERSION_LABELS = {1: "1.0", 2: "1.1", 3: "2", 30: "3"}
+# libcurl的CURLPIPE_MULTIPLEX
+_PIPE_MULTIPLEX = 2
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+class SessionPool:
+    """Process-wide pool of curl-cffi async sessions borrowed by engine instances.
+
+    Sessions are keyed by event loop, proxies, impersonation profile and HTTP version: a
+    curl-cffi AsyncSession is bound to the loop it first runs on, and the others are
+    session-level settings (the timeout is passed per request). Keeping the sessions alive lets
+    every engine reuse warm TLS connections. With HTTP/2 concurrent requests to one host wait for and multiplex over a
+    single connection instead of opening one each.
+    """
+
+    def __init__(self, max_clients: int = SESSION_MAX_CLIENTS, max_per_host: int = SESSION_MAX_PER_HOST) -> None:
+        self.max_clients = max_clients
+        self.max_per_host = max_per_host
+        self._sessions: Dict[Tuple[Any, ...], requests.AsyncSession] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _proxy_key(proxies: Optional[Dict[str, str]]) -> Optional[Tuple[Tuple[str, str], ...]]:
+        return tuple(sorted(proxies.items())) if proxies else None
+
+    def get(
+        self,
+        proxies: Optional[Dict[str, str]] = None,
+        impersonate: Optional[str] = "chrome",
+        http_version: Optional[str] = HTTP_VERSION,
+    ) -> requests.AsyncSession:
+        """Borrow the session for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        key = (loop, self._proxy_key(proxies), impersonate, http_version)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None or session._closed:
+                self._prune()
+                session = self._new_session(proxies, impersonate, http_version)
+                self._sessions[key] = session
+        return session
+
+    def _new_session(
+        self,
+        proxies: Optional[Dict[str, str]],
+        impersonate: Optional[str],
+        http_version: Optional[str] = HTTP_VERSION,
+    ) -> requests.AsyncSession:
+        curl_options = {CurlOpt.TCP_KEEPALIVE: 1}
+        version = _HTTP_VERSIONS.get(http_version or "")
+        if version == CurlHttpVersion.V2TLS:
+            # 连接还在握手时，新的请求等待它确认能否多路复用，而不是再开一个连接
+            curl_options[CurlOpt.PIPEWAIT] = 1
+        session = requests.AsyncSession(
+            proxies=proxies,
+            impersonate=impersonate,
+            allow_redirects=True,
+            verify=False,
+            max_clients=self.max_clients,
+            curl_options=curl_options,
+            curl_infos=[CurlInfo.NUM_CONNECTS],
+            http_version=version,
+        )
+        # 限制每个host的并发连接数，超出的请求在multi句柄中排队而不是新建连接
+        setopt = getattr(session.acurl, "setopt", None)
+        if setopt is not None:
+            with suppress(Exception):
+                setopt(CurlMOpt.MAX_HOST_CONNECTIONS, self.max_per_host)
+            if version == CurlHttpVersion.V2TLS:
+                with suppress(Exception):
+                    setopt(CurlMOpt.PIPELINING, _PIPE_MULTIPLEX)
+        return session
+
+    def _prune(self) -> None:
+        """Forget sessions whose event loop has been closed. Caller holds the lock."""
+        for key in [k for k in self._sessions if k[0].is_closed()]:
+            del self._sessions[key]
+
+    async def aclose(self) -> None:
+        """Close the sessions bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            keys = [k for k in self._sessions if k[0] is loop]
+            sessions = [self._sessions.pop(k) for k in keys]
+        for session in sessions:
+            with suppress(Exception):
+                await session.close()
+
+    def close(self, timeout: float = 5) -> None:
+        """Close every pooled session on its own loop. Registered to run at interpreter exit."""
+        with self._lock:
+            items = list(self._sessions.items())
+            self._sessions.clear()
+        for (loop, *_), session in items:
+            if loop.is_closed() or not loop.is_running():
+                continue
+            with suppress(Exception):
+                asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+session_pool = SessionPool()
+atexit.register(session_pool.close)
+
+# 进程内所有引擎实例共享的请求合并表
+request_flights = SingleFlight()
+
 
 class AsyncClient:
     _executor: Optional[ThreadPoolExecutor] = None
@@ -22,22 +154,24 @@ class AsyncClient:
     def __init__(
         self,
         headers: Optional[Dict[str, str]] = None,
-        proxies: Union[Dict[str, str], str, None] = None,
-        timeout: Optional[int] = 10
+        proxies: Union[Dict[str, str], str, Sequence[str], ProxyPool, None] = None,
+        timeout: Optional[int] = 10,
+        http_version: Optional[str] = HTTP_VERSION,
     ) -> None:
+        # 多个代理（列表或逗号分隔的字符串）组成代理池，每个请求按健康度选择出口
+        self.proxy_pool: Optional[ProxyPool] = None
+        if isinstance(proxies, ProxyPool) or isinstance(proxies, (list, tuple)) or \
+                (isinstance(proxies, str) and "," in proxies):
+            self.proxy_pool = proxy_pool(proxies)
+            proxies = None
         self.proxies = {"all": proxies} if isinstance(proxies, str) else proxies
-        self._asession = requests.AsyncSession(
-            headers=headers,
-            proxies=self.proxies,
-            timeout=timeout,
-            impersonate="chrome",
-            allow_redirects=True,
-            verify=False
-        )
+        self.timeout = timeout
+        self.impersonate = "chrome"
+        self.http_version = http_version
+        # 会话在实例间共享，实例级别的请求头在每次请求时合并
+        self.headers: Dict[str, str] = dict(headers or {})
         # 获取当前操作系统
         self.current_os = platform.system().lower()
-        self._exception_event = asyncio.Event()
-        # self._exit_done = False
 
     async def __aenter__(self) -> "AsyncClient":
         return self
@@ -48,15 +182,20 @@ class AsyncClient:
         exc_val: Optional[BaseException] = None,
         exc_tb: Optional[TracebackType] = None,
     ) -> None:
-        # await self._session_close()
-        await self._asession.__aexit__(exc_type, exc_val, exc_tb)  # type: ignore
+        # 会话归session_pool所有，这里不关闭
+        pass
 
-    def __del__(self) -> None:
-        if hasattr(self, "_asession") and self._asession._closed is False:
-            with suppress(RuntimeError, RuntimeWarning):
-                asyncio.create_task(self._asession.close())  # type: ignore
-        # if self._exit_done is False:
-        #     asyncio.create_task(self._session_close())
+    def _get_session(self, proxy: Optional[str] = None, impersonate: Optional[str] = None) -> requests.AsyncSession:
+        """Borrow the pooled session matching this client's settings, or the one for `proxy`/`impersonate`."""
+        return session_pool.get({"all": proxy} if proxy else self.proxies, impersonate or self.impersonate,
+                                self.http_version)
+
+    def _merge_headers(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the client-level headers and timeout underneath the per-request ones."""
+        kwargs.setdefault("timeout", self.timeout)
+        if self.headers:
+            kwargs["headers"] = {**self.headers, **(kwargs.get("headers") or {})}
+        return kwargs
 
     @classmethod
     def _get_executor(cls, max_workers: int = 1) -> ThreadPoolExecutor:
@@ -69,55 +208,193 @@ class AsyncClient:
     def executor(cls) -> Optional[ThreadPoolExecutor]:
         return cls._get_executor()
 
+    @staticmethod
+    def _request_url(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+        return str(args[1] if len(args) > 1 else kwargs.get("url", ""))
+
+    def _metric_labels(self, url: str) -> Tuple[str, str, str]:
+        """engine, host and VT relationship labels of a request."""
+        return type(self).__name__, urlparse(url).hostname or "", current_relationship.get()
+
+    async def _request(self, *args, **kwargs) -> requests.Response:
+        """Send one request through the pooled session, honouring the host's rate limit and the deadline."""
+        return await wait_within_deadline(self._request_limited(*args, **kwargs), self._request_url(args, kwargs))
+
+    async def _request_limited(self, *args, **kwargs) -> requests.Response:
+        url = self._request_url(args, kwargs)
+        limiter = rate_limits.get(url)
+        start = time.monotonic()
+        if limiter is None:
+            resp = await self._send(*args, **kwargs)
+        else:
+            async with limiter:
+                # 不计入在限流器中排队的时间
+                start = time.monotonic()
+                try:
+                    resp = await self._send(*args, **kwargs)
+                except Exception as ex:
+                    limiter.record_error(ex)
+                    raise
+                limiter.record(resp.status_code, time.monotonic() - start)
+        labels = self._metric_labels(url)
+        REQUEST_SECONDS.observe(time.monotonic() - start, *labels, status_class(resp.status_code))
+        connects = getattr(resp, "infos", {}).get(CurlInfo.NUM_CONNECTS)
+        if connects:
+            CONNECTIONS_OPENED.inc(labels[0], labels[1], _HTTP_VERSION_LABELS.get(resp.http_version, "other"),
+                                   amount=connects)
+        return resp
+
+    async def _send(self, *args, **kwargs) -> requests.Response:
+        """Send on the session of the chosen egress proxy and report the outcome to the proxy pool.
+
+        A per-request `impersonate` selects the pooled session of that fingerprint instead of
+        overriding it on a shared session, so its TLS connections stay reusable.
+        """
+        impersonate = kwargs.pop("impersonate", None)
+        if self.proxy_pool is None:
+            return await self._get_session(impersonate=impersonate).request(*args, **self._merge_headers(kwargs))
+        proxy = self.proxy_pool.choose()
+        session = self._get_session(proxy, impersonate)
+        start = time.monotonic()
+        try:
+            resp = await session.request(*args, **self._merge_headers(kwargs))
+        except Exception:
+            self.proxy_pool.record(proxy, ok=False)
+            raise
+        # 被上游限流说明这个出口IP已被盯上，同样计为失败
+        self.proxy_pool.record(proxy, time.monotonic() - start, ok=resp.status_code not in OVERLOAD_STATUS)
+        return resp
+
+    async def warm_up(self, urls: Iterable[str], impersonates: Optional[Iterable[str]] = None,
+                      timeout: float = 5.0) -> Dict[str, Any]:
+        """Open the pooled sessions and connections that the first real requests will use.
+
+        Sends a HEAD to every url through the session of every egress proxy and impersonate
+        target, so DNS lookups and TLS handshakes happen here instead of inside a user request.
+        Failures are logged and reported, never raised. Returns {"<proxy> <target> <url>": status or error}.
+        """
+        targets = dict.fromkeys([self.impersonate, *(impersonates or fingerprint_pool.impersonates())])
+        proxies = self.proxy_pool.urls if self.proxy_pool is not None else [None]
+        probes = [(proxy, target, url) for proxy in proxies for target in targets for url in dict.fromkeys(urls)]
+
+        async def _probe(proxy: Optional[str], target: str, url: str) -> Any:
+            session = self._get_session(proxy, target)
+            try:
+                resp = await session.request("HEAD", url, timeout=timeout, allow_redirects=False)
+                return resp.status_code
+            except Exception as ex:
+                logger.info(f"Warm-up {url} via {proxy or 'direct'} ({target}) failed: {type(ex).__name__}: {ex}")
+                return f"{type(ex).__name__}: {ex}"
+
+        results = await asyncio.gather(*(_probe(*probe) for probe in probes))
+        return {f"{proxy or 'direct'} {target} {url}": result for (proxy, target, url), result in zip(probes, results)}
+
+    @staticmethod
+    def _join_url(end_point: str, path: str) -> str:
+        if path and not end_point.endswith("/") and not path.startswith("/"):
+            return f"{end_point}/{path}"
+        return f"{end_point}{path}"
+
+    async def _aget_end_point(self, pool: EndpointPool, path: str, method: str = "GET",
+                              hedge: Optional[HedgePolicy] = None, **kwargs) -> bytes:
+        """Request `path` on the best end point of `pool`.
+
+        End points whose circuit breaker is open are skipped. With a `hedge` policy a slow
+        request is duplicated to the next best end point (or the same one when the pool has
+        only one) and the first answer wins.
+        """
+        allowed = (end_point for end_point in pool.candidates() if breakers.get(end_point).allow())
+        first = next(allowed, None)
+        if first is None:
+            raise CircuitOpenException(f"{path}: no healthy end point in {pool.urls}")
+        if hedge is None:
+            return await self._aget_pool_url(pool, first, path, method, **kwargs)
+
+        def _hedge() -> Awaitable[bytes]:
+            second = next(allowed, first)
+            # 同一个URL的对冲请求不能并入主请求的single-flight
+            return self._aget_pool_url(pool, second, path, method,
+                                       **{**kwargs, "coalesce": False} if second == first else kwargs)
+
+        return await hedge.run(lambda: self._aget_pool_url(pool, first, path, method, **kwargs), _hedge,
+                               key=(method, path_kind(path)))
+
+    async def _aget_pool_url(self, pool: EndpointPool, end_point: str, path: str, method: str, **kwargs) -> bytes:
+        """Request one end point and feed the outcome to its pool score and breaker; 404 counts as healthy."""
+        breaker = breakers.get(end_point)
+        start = time.monotonic()
+        try:
+            res = await self._aget_url(method, self._join_url(end_point, path), **kwargs)
+        except NotFoundException:
+            breaker.record_success()
+            pool.record(end_point, time.monotonic() - start)
+            raise
+        except Exception:
+            breaker.record_failure()
+            pool.record(end_point, ok=False)
+            raise
+        breaker.record_success()
+        pool.record(end_point, time.monotonic() - start)
+        return res
+
     async def _aget_url(
+        self,
+            *args, coalesce: Optional[bool] = None, **kwargs
+    ) -> bytes:
+        """Fetch a URL and return the body, coalescing identical in-flight requests.
+
+        GET/HEAD requests are coalesced by default; pass coalesce=True for POSTs that are
+        reads (e.g. the CF worker) or coalesce=False to always send the request.
+        """
+        method = str(args[0] if args else kwargs.get("method", "GET")).upper()
+        if coalesce is None:
+            coalesce = method in ("GET", "HEAD")
+        if not (coalesce and SINGLE_FLIGHT):
+            return await self._aget_url_once(*args, **kwargs)
+        key = (method, self._request_url(args, kwargs), freeze(kwargs.get("params")),
+               freeze(kwargs.get("data")), freeze(kwargs.get("json")))
+        return await request_flights.do(key, lambda: self._aget_url_once(*args, **kwargs))
+
+    async def _aget_url_once(
         self,
             *args, **kwargs
     ) -> bytes:
+        labels = self._metric_labels(self._request_url(args, kwargs))
         try:
-            resp = await self._asession.request(*args, **kwargs)
+            resp = await self._request(*args, **kwargs)
             resp_content: bytes = resp.content
-            if resp.headers.get('Content-Encoding') == 'gzip':
+            # curl已按Content-Encoding解压过响应；只有正文本身仍是gzip（上游压缩了两次）时才再解压
+            if resp_content[:2] == _GZIP_MAGIC:
                 try:
-                    with gzip.GzipFile(fileobj=io.BytesIO(resp.content)) as decompressed_file:
-                        resp_content = decompressed_file.read()
+                    resp_content = gzip.decompress(resp_content)
                 except OSError:
-                    print("Warning: Failed to decompress gzip, using raw content")
+                    logger.warning("Failed to decompress gzip, using raw content")
         except Exception as ex:
-            if "time" in str(ex).lower():
-                raise TimeoutException(f"{type(ex).__name__}: {ex}") from ex
-            raise ClientSearchException(f"{type(ex).__name__}: {ex}") from ex
-        # print(f"_aget_url() {resp.url} {resp.status_code} {resp.elapsed:.2f} {len(resp_content)}")
-        print(f"_aget_url() {resp.url} {resp.status_code} {resp.elapsed} {len(resp_content)}")
+            error = self._transport_error(ex)
+            raise self._count_exception(labels, error) from (None if error is ex else ex)
+        RESPONSE_BYTES.inc(*labels, amount=len(resp.content))
+        logger.debug("_aget_url() %s %s %s %d", resp.url, resp.status_code, resp.elapsed, len(resp_content))
         if resp.status_code in (200, 302):
             return resp_content
-        if resp.status_code in (202, 301, 403, 429):
-            raise RatelimitException(f"{resp.url} {resp.status_code}")
-        if resp.status_code in (404,):
-            raise NotFoundException(f"{resp.url} {resp.status_code} not Found")
-        raise ClientSearchException(f"{resp.url} {resp.status_code} return None.")
+        raise self._count_exception(labels, self._status_error(resp))
 
-    async def _aget_url_stream(
-        self,
-            *args, **kwargs
-    ) -> bytes:
-        if self._exception_event.is_set():
-            raise ClientSearchException("Exception occurred in previous call.")
-        try:
-            resp = await self._asession.request(*args, **kwargs)
-            # resp = await self._asession.request(method, url, data=data, params=params, stream=True, headers=headers)
-            resp_content: bytes = await resp.acontent()
-        except Exception as ex:
-            self._exception_event.set()
-            if "time" in str(ex).lower():
-                raise TimeoutException(f"{type(ex).__name__}: {ex}") from ex
-            raise ClientSearchException(f"{type(ex).__name__}: {ex}") from ex
-        # logger.debug(f"_aget_url() {resp.url} {resp.status_code} {resp.elapsed:.2f} {len(resp_content)}")
-        print(f"_aget_url() {resp.url} {resp.status_code} {resp.elapsed:.2f} {len(resp_content)}")
-        if resp.status_code in (200, 302):
-            return resp_content
-        self._exception_event.set()
+    @staticmethod
+    def _transport_error(ex: Exception) -> ClientSearchException:
+        if isinstance(ex, ClientSearchException):
+            return ex
+        if "time" in str(ex).lower():
+            return TimeoutException(f"{type(ex).__name__}: {ex}")
+        return ClientSearchException(f"{type(ex).__name__}: {ex}")
+
+    @staticmethod
+    def _status_error(resp: requests.Response) -> ClientSearchException:
         if resp.status_code in (202, 301, 403, 429):
-            raise RatelimitException(f"{resp.url} {resp.status_code}")
+            return RatelimitException(f"{resp.url} {resp.status_code}")
         if resp.status_code in (404,):
-            raise NotFoundException(f"{resp.url} {resp.status_code} not Found")
-        raise ClientSearchException(f"{resp.url} {resp.status_code} return None.")
\ No newline at end of file
+            return NotFoundException(f"{resp.url} {resp.status_code} not Found")
+        return ClientSearchException(f"{resp.url} {resp.status_code} return None.")
+
+    @staticmethod
+    def _count_exception(labels: Tuple[str, str, str], ex: Exception) -> Exception:
+        REQUEST_EXCEPTIONS.inc(*labels, type(ex).__name__)
+        return ex
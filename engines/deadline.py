@@ -0,0 +1,105 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+from .exceptions import DeadlineExceededException
+
+T = TypeVar("T")
+
+# 当前调用的截止时间（time.monotonic() 的绝对值），None 表示不限
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("engines_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """Bound every engine request, retry and fan-out inside the block by `seconds` of wall clock.
+
+    Nested deadlines can only tighten the outer one.
+
+        with deadline(2.5):
+            report = await vt.aapi(sha256)
+    """
+    if seconds is None:
+        yield current_deadline.get()
+        return
+    at = time.monotonic() + seconds
+    outer = current_deadline.get()
+    token = current_deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield current_deadline.get()
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    at = current_deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check_deadline(what: str = "") -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededException(f"Deadline exceeded {what}".strip())
+
+
+async def wait_within_deadline(aw: Awaitable[T], what: str = "") -> T:
+    """Await `aw`, cancelling it and raising DeadlineExceededException when the deadline passes."""
+    left = remaining()
+    if left is None:
+        return await aw
+    check_deadline(what)
+    try:
+        return await asyncio.wait_for(aw, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceededException(f"Deadline exceeded {what}".strip()) from None
+
+
+async def run_with_deadline(aw: Awaitable[T], at: Optional[float]) -> T:
+    """Run `aw` under an absolute deadline; used to carry the deadline onto another loop thread."""
+    current_deadline.set(at)
+    return await aw
+
+
+async def gather_until_deadline(*aws: Awaitable[Any],
+                                fail_fast: Optional[Callable[[int, BaseException], bool]] = None) -> List[Any]:
+    """Like gather(..., return_exceptions=True), but sub-tasks still running at the deadline are
+    cancelled so the caller can return what has finished.
+
+    When `fail_fast(index, exc)` is true for a failed sub-task, the siblings still in flight are
+    cancelled right away, releasing their connections. Slots of sub-tasks cancelled at the
+    deadline hold DeadlineExceededException, those cancelled by fail_fast hold CancelledError.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    index = {task: i for i, task in enumerate(tasks)}
+    pending = set(tasks)
+    expired = False
+    try:
+        while pending:
+            left = remaining()
+            if left is not None and left <= 0:
+                expired = True
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=left, return_when=asyncio.FIRST_EXCEPTION if fail_fast else asyncio.ALL_COMPLETED)
+            if fail_fast and any(not t.cancelled() and t.exception() is not None
+                                 and fail_fast(index[t], t.exception()) for t in done):
+                break
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    results: List[Any] = []
+    for task in tasks:
+        if task.cancelled():
+            results.append(DeadlineExceededException("Deadline exceeded, sub-task cancelled") if expired
+                           else asyncio.CancelledError())
+        else:
+            results.append(task.exception() or task.result())
+    return results
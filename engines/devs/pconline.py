@@ -3,16 +3,21 @@ import urllib.parse
 from bs4 import BeautifulSoup
 import re
 import time
+import logging
+
+from engines.log import log_payload
+
+logger = logging.getLogger("engines.PCOnline")
 
 
 class PCOnline(Client):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._asession.headers["sec-ch-ua-mobile"] = "?0"
-        self._asession.headers[
+        self.headers["sec-ch-ua-mobile"] = "?0"
+        self.headers[
             "accept"] = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7"
-        self._asession.headers["Referer"] = "https://www.pconline.com.cn/"
-        self._asession.headers["Accept-Ianguage"] = "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
+        self.headers["Referer"] = "https://www.pconline.com.cn/"
+        self.headers["Accept-Ianguage"] = "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
 
         # 中关村在线报价网
         self.base_url = "https://product.pconline.com.cn/"
@@ -34,7 +39,7 @@ class PCOnline(Client):
             q_word = urllib.parse.quote(dev_name.encode("GBK"))
             small_type_word = urllib.parse.quote(small_type.encode("GBK"))
             search_url = f"https://ks.pconline.com.cn/product.shtml?q={q_word}&smallType={small_type_word}"
-            print(search_url)
+            logger.debug("pconline search %s", search_url)
             html = await self._aget_url("GET", search_url)
             # print(html)
             soup = BeautifulSoup(html, 'html.parser')
@@ -48,7 +53,7 @@ class PCOnline(Client):
                 details = [v.strip() for v in desc.split("|")]
                 detail_url = item.find("a", class_="item-name")['href']
                 more_url = "https:" + detail_url.rsplit(".", 1)[0] + "_detail.html"
-                print(more_url)
+                logger.debug("pconline more %s", more_url)
                 # price = item.find("div", class_="price price-now").text
                 # price_url = item.find("div", class_="price price-now")['href']
                 price_box = item.find("div", attrs={"class": re.compile(r"price(\s\w+).")})
@@ -69,7 +74,7 @@ class PCOnline(Client):
                     time.sleep(0.2)
             return dict_list
         except Exception as e:
-            print("爬取失败 _search_dev", e, "行号：", e.__traceback__.tb_lineno, "dev_name：", dev_name)
+            logger.warning("爬取失败 _search_dev %s 行号：%s dev_name：%s", e, e.__traceback__.tb_lineno, dev_name)
             return None
 
     def get_page_info(self, *args, **kwargs):
@@ -91,24 +96,24 @@ class PCOnline(Client):
             for item in items:
                 a = item.find("a", class_="item-title-name")
                 title = str(a.text).strip()
-                print(title)
+                logger.debug("pconline title %s", title)
                 more_url = 'https:' + str(item.find("a", class_="more-specs")['href'])
-                print(more_url)
+                logger.debug("pconline more %s", more_url)
                 p = item.find("div", class_="price price-now")
                 price = None
                 if p is not None:
                     price = p.text
-                    print(price)
+                    logger.debug("pconline price %s", price)
                 more_details = await self._parse_more(more_url)
                 dict_list.append({"title": title,
                                   "more_details": more_details,
                                   "price": price,
                                   "more_url": more_url
                                   })
-            print(dict_list)
+            log_payload("pconline page info", dict_list)
             return dict_list
         except Exception as e:
-            print("爬取失败 _get_page_info", e, "行号：", e.__traceback__.tb_lineno)
+            logger.warning("爬取失败 _get_page_info %s 行号：%s", e, e.__traceback__.tb_lineno)
             return None
 
     async def _parse_more(self, detail_url):
@@ -136,7 +141,7 @@ class PCOnline(Client):
             # print(dict_)
             return dict_
         except Exception as e:
-            print("爬取失败 _parse_more", e, "行号：", e.__traceback__.tb_lineno)
+            logger.warning("爬取失败 _parse_more %s 行号：%s", e, e.__traceback__.tb_lineno)
             return None
 
     @staticmethod
@@ -1,5 +1,8 @@
 import requests
 from bs4 import BeautifulSoup
+import logging
+
+logger = logging.getLogger("engines.TPLink")
 
 
 class TPLink():
@@ -19,7 +22,7 @@ class TPLink():
         data_list = []
         for p in product_list:
             title = 'TP-LINK ' + p.get("productModel")
-            print(title)
+            logger.debug("tplink title %s", title)
             details = [p.get("productName")]
             pro_id = p.get("id")
             more_url = f'https://www.tp-link.com.cn/product_{pro_id}.html?v=specification'
@@ -27,7 +30,7 @@ class TPLink():
             # print(more_url)
             more_details = self.parse_more(more_url)
             if not more_details:
-                print("爬取第二次", more_url_v2)
+                logger.debug("爬取第二次 %s", more_url_v2)
                 more_details = self.parse_more_v2(more_url_v2)
             data_list.append({
                 "title": title,
@@ -51,7 +54,7 @@ class TPLink():
                 dict_[dataTitle] = dataDetail
             return dict_
         except Exception as e:
-            print("爬取失败", e, "行号：", e.__traceback__.tb_lineno)
+            logger.warning("爬取失败 %s 行号：%s", e, e.__traceback__.tb_lineno)
             return None
 
     def parse_more_v2(self, detail_url):
@@ -70,7 +73,7 @@ class TPLink():
                     dict_[h] = d
             return dict_
         except Exception as e:
-            print("爬取失败", e, "行号：", e.__traceback__.tb_lineno)
+            logger.warning("爬取失败 %s 行号：%s", e, e.__traceback__.tb_lineno)
             return None
 
 
@@ -2,16 +2,19 @@ from engines.client import Client
 import urllib.parse
 from bs4 import BeautifulSoup
 import time
+import logging
+
+logger = logging.getLogger("engines.ZOL")
 
 
 class ZOL(Client):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._asession.headers["sec-ch-ua-mobile"] = "?0"
-        self._asession.headers["accept"] = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7"
-        self._asession.headers["Referer"] = "https://www.zol.com.cn/"
-        self._asession.headers["Accept-Ianguage"] = "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
-        self._asession.headers["Cookie"] = f"ip_ck=5cCJ5vj2j7QuMjc4MTIxLjE3MjI0ODg2MDE%3D; lv={int(time.time())}; vn=1; z_day=rdetail=1; z_pro_city=s_provice%3Dzhejiang%26s_city%3Dhangzhou; questionnaire_pv={int(time.time())}"
+        self.headers["sec-ch-ua-mobile"] = "?0"
+        self.headers["accept"] = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7"
+        self.headers["Referer"] = "https://www.zol.com.cn/"
+        self.headers["Accept-Ianguage"] = "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
+        self.headers["Cookie"] = f"ip_ck=5cCJ5vj2j7QuMjc4MTIxLjE3MjI0ODg2MDE%3D; lv={int(time.time())}; vn=1; z_day=rdetail=1; z_pro_city=s_provice%3Dzhejiang%26s_city%3Dhangzhou; questionnaire_pv={int(time.time())}"
 
         # 中关村在线报价网
         self.base_url = "https://detail.zol.com.cn"
@@ -55,7 +58,7 @@ class ZOL(Client):
             #                 time.sleep(1)
             return dict_list
         except Exception as e:
-            print("爬取失败 _search_dev", e, "行号：", e.__traceback__.tb_lineno, "dev_name：", dev_name)
+            logger.warning("爬取失败 _search_dev %s 行号：%s dev_name：%s", e, e.__traceback__.tb_lineno, dev_name)
             return None
 
     def get_page_info(self, *args, **kwargs):
@@ -94,7 +97,7 @@ class ZOL(Client):
                 time.sleep(0.2)
             return dict_list
         except Exception as e:
-            print("爬取失败 _get_page_info", e, "行号：", e.__traceback__.tb_lineno)
+            logger.warning("爬取失败 _get_page_info %s 行号：%s", e, e.__traceback__.tb_lineno)
             return None
 
     async def _parse_more(self, detail_url):
@@ -113,7 +116,7 @@ class ZOL(Client):
                         dict_[th.text.strip()] = td.text.strip().strip("纠错").replace("\r", " ").replace("\n", " ")
             return dict_
         except Exception as e:
-            print("获取详情失败 _parse_more")
+            logger.warning("获取详情失败 _parse_more")
             return None
 
     @staticmethod
@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Union
+
+# 延迟和错误分数的半衰期（秒），旧的观测随时间衰减
+DEFAULT_HALF_LIFE = 60.0
+
+
+class EndpointStats:
+    """Live, time-decayed latency and error score of one end point URL."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.latency: Optional[float] = None
+        self.errors = 0.0
+        self.successes = 0.0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        # 剔除期结束后进入探测状态，只放行一个试探请求
+        self.probing = False
+        self.probe_sent = 0.0
+        self._updated = time.monotonic()
+
+    def decay(self, now: float, half_life: float) -> None:
+        factor = 0.5 ** ((now - self._updated) / half_life)
+        self.errors *= factor
+        self.successes *= factor
+        self._updated = now
+
+    @property
+    def error_rate(self) -> float:
+        total = self.errors + self.successes
+        return self.errors / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": round(self.latency, 4) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "consecutive_failures": self.consecutive_failures,
+            "ejected": self.ejected_until > time.monotonic(),
+            "probing": self.probing,
+            "ejections": self.ejections,
+        }
+
+
+# 同一URL的统计在进程内所有池之间共享，所有池都用这一把锁读写统计
+_stats: Dict[str, EndpointStats] = {}
+_stats_lock = threading.RLock()
+
+
+def endpoint_stats(url: str) -> EndpointStats:
+    with _stats_lock:
+        stats = _stats.get(url)
+        if stats is None:
+            stats = _stats[url] = EndpointStats(url)
+        return stats
+
+
+class EndpointPool:
+    """Routes requests over mirror end points by live latency and error score.
+
+    Each request goes to the better of two weighted random picks (power of two choices), so
+    traffic drifts away from slow or failing mirrors without herding onto a single one.
+    An end point that fails `eject_after` times in a row is ejected for `eject_for` seconds
+    (doubling on repeated ejections, up to `max_eject_for`); when that expires it is re-probed
+    with a single trial request. Backup end points only get traffic when every primary one is
+    ejected.
+
+        pool = EndpointPool({"https://vtfastlycdn.451964719.xyz/": 1, "https://vtcdn.darkqiank.work/": 1})
+        VT(vt_end_point=pool)
+    """
+
+    def __init__(
+        self,
+        end_points: Union[Mapping[str, float], Iterable[str]],
+        backups: Sequence[str] = (),
+        half_life: float = DEFAULT_HALF_LIFE,
+        eject_after: int = 3,
+        eject_for: float = 30.0,
+        max_eject_for: float = 600.0,
+        error_penalty: float = 10.0,
+    ) -> None:
+        weights = dict(end_points) if isinstance(end_points, Mapping) else {url: 1.0 for url in end_points}
+        self.weights: Dict[str, float] = {url: float(w) for url, w in weights.items() if w > 0}
+        self.backups: List[str] = [url for url in backups if url not in self.weights]
+        if not self.weights and not self.backups:
+            raise ValueError("EndpointPool needs at least one end point with a positive weight")
+        self.half_life = half_life
+        self.eject_after = eject_after
+        self.eject_for = eject_for
+        self.max_eject_for = max_eject_for
+        self.error_penalty = error_penalty
+
+    @classmethod
+    def coerce(cls, value: Union["EndpointPool", str, Mapping[str, float], Iterable[str]],
+               backups: Sequence[str] = ()) -> "EndpointPool":
+        """Accept an existing pool, a single URL, a URL list or a URL -> weight mapping."""
+        if isinstance(value, EndpointPool):
+            return value
+        if isinstance(value, str):
+            value = [value]
+        return cls(value, backups=backups)
+
+    @property
+    def primary(self) -> str:
+        return next(iter(self.weights), None) or self.backups[0]
+
+    @property
+    def urls(self) -> List[str]:
+        return [*self.weights, *self.backups]
+
+    def _score(self, stats: EndpointStats) -> float:
+        """Lower is better: expected latency inflated by the recent error rate."""
+        latency = stats.latency if stats.latency is not None else 0.0
+        return (latency + 0.05) * (1 + self.error_penalty * stats.error_rate)
+
+    def _available(self, stats: EndpointStats, now: float) -> bool:
+        # 试探请求发出后未回报结果（如被取消）时，超过eject_for再放行一次
+        return stats.ejected_until <= now and not (stats.probing and now - stats.probe_sent < self.eject_for)
+
+    def candidates(self) -> List[str]:
+        """End points to try for one request, best first. Ejected ones are left out."""
+        now = time.monotonic()
+        with _stats_lock:
+            primary = []
+            for url in self.weights:
+                stats = endpoint_stats(url)
+                stats.decay(now, self.half_life)
+                if self._available(stats, now):
+                    primary.append(url)
+            if not primary:
+                ordered = [url for url in self.backups if self._available(endpoint_stats(url), now)]
+            else:
+                # 加权随机取两个，选分数更低的作为首选；探测中的端点优先拿到它的试探请求
+                probes = [u for u in primary if endpoint_stats(u).probing]
+                picks = probes[:1] or random.choices(primary, weights=[self.weights[u] for u in primary], k=2)
+                first = min(picks, key=lambda u: self._score(endpoint_stats(u)))
+                rest = sorted((u for u in primary if u != first), key=lambda u: self._score(endpoint_stats(u)))
+                ordered = [first, *rest, *self.backups]
+            if ordered and endpoint_stats(ordered[0]).probing:
+                endpoint_stats(ordered[0]).probe_sent = now
+            return ordered
+
+    def choose(self) -> str:
+        candidates = self.candidates()
+        if not candidates:
+            # 全部被剔除时，选最早恢复的一个
+            return min(self.urls, key=lambda u: endpoint_stats(u).ejected_until)
+        return candidates[0]
+
+    def record(self, url: str, latency: Optional[float] = None, ok: bool = True) -> None:
+        """Report the outcome of a request sent to `url`."""
+        stats = endpoint_stats(url)
+        now = time.monotonic()
+        with _stats_lock:
+            stats.decay(now, self.half_life)
+            if ok:
+                stats.successes += 1
+                stats.consecutive_failures = 0
+                if stats.probing:
+                    stats.probing, stats.probe_sent = False, 0.0
+                    stats.ejections = 0
+                if latency is not None:
+                    stats.latency = latency if stats.latency is None else stats.latency + 0.2 * (latency - stats.latency)
+                return
+            stats.errors += 1
+            stats.consecutive_failures += 1
+            if stats.probing or stats.consecutive_failures >= self.eject_after:
+                stats.ejections += 1
+                stats.consecutive_failures = 0
+                stats.probing, stats.probe_sent = True, 0.0
+                eject_for = min(self.max_eject_for, self.eject_for * 2 ** (stats.ejections - 1))
+                stats.ejected_until = now + eject_for
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with _stats_lock:
+            return {url: endpoint_stats(url).as_dict() for url in self.urls}
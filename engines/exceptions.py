@@ -12,3 +12,11 @@ class TimeoutException(ClientSearchException):
 
 class NotFoundException(ClientSearchException):
     """Raised for timeout errors during API requests."""
+
+
+class CircuitOpenException(ClientSearchException):
+    """Raised when every end point of a request has its circuit breaker open."""
+
+
+class DeadlineExceededException(TimeoutException):
+    """Raised when the deadline attached to an engine call has passed."""
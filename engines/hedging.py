@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+from .exceptions import NotFoundException
+
+T = TypeVar("T")
+
+# 对冲请求的全局预算：额外请求数不超过主请求数的5%
+HEDGE_BUDGET = float(os.getenv("ENGINES_HEDGE_BUDGET", "0.05"))
+
+
+class HedgeBudget:
+    """Process-wide allowance for hedged requests.
+
+    Every primary request deposits `ratio` tokens (up to `burst`) and every hedge spends one,
+    so over time hedges stay below `ratio` of the primary traffic even when an upstream is
+    slow across the board.
+    """
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, burst: float = 10.0) -> None:
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.denied = 0
+        self.wins = 0
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                self.denied += 1
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+    def record_win(self) -> None:
+        with self._lock:
+            self.wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "hedges": self.hedges, "denied": self.denied,
+                "wins": self.wins, "tokens": round(self._tokens, 2)}
+
+
+hedge_budget = HedgeBudget()
+
+
+def path_kind(path: str) -> str:
+    """Latency bucket of a REST path: "ui/files/<id>/behaviours?limit=40" -> "ui/files/*/behaviours"."""
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    if len(parts) > 2:
+        parts[2] = "*"
+    return "/".join(parts)
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies with a percentile lookup."""
+
+    def __init__(self, size: int = 512) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class HedgePolicy:
+    """Send a duplicate of a slow request and take whichever answer arrives first.
+
+    The hedge is sent once the primary has been running longer than the `percentile` latency
+    of recent requests with the same key (or `initial_delay` until `min_samples` have been
+    seen), and only if the shared HedgeBudget allows it. A NotFoundException is an answer,
+    not a failure; any other error from one side waits for the other.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.05,
+        min_samples: int = 20,
+        budget: HedgeBudget = hedge_budget,
+    ) -> None:
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self._trackers: Dict[Hashable, LatencyTracker] = {}
+        self._lock = threading.Lock()
+
+    def _tracker(self, key: Hashable) -> LatencyTracker:
+        with self._lock:
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = LatencyTracker()
+            return tracker
+
+    def delay(self, key: Hashable = None) -> float:
+        tracker = self._tracker(key)
+        if len(tracker) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    async def run(self, primary: Callable[[], Awaitable[T]], hedge: Callable[[], Awaitable[T]],
+                  key: Hashable = None) -> T:
+        tracker = self._tracker(key)
+        self.budget.deposit()
+        start = time.monotonic()
+        first = asyncio.ensure_future(primary())
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.delay(key))
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done or not self.budget.try_spend():
+            try:
+                return await first
+            finally:
+                tracker.add(time.monotonic() - start)
+        second = asyncio.ensure_future(hedge())
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    ex = task.exception()
+                    if ex is None or isinstance(ex, NotFoundException):
+                        if task is second:
+                            self.budget.record_win()
+                        return task.result()
+                    if task is first or error is None:
+                        error = ex
+            raise error
+        finally:
+            # 主请求被对冲请求抢先时，已耗时只是它延迟的下界，仍计入窗口
+            tracker.add(time.monotonic() - start)
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            trackers = dict(self._trackers)
+        return {"budget": self.budget.stats(),
+                "delays": {str(key): round(self.delay(key), 4) for key in trackers}}
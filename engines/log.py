@@ -0,0 +1,65 @@
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+# 日志级别、INFO及以下级别的采样比例、是否输出完整的请求/响应内容
+LOG_LEVEL = os.getenv("ENGINES_LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE = float(os.getenv("ENGINES_LOG_SAMPLE", "1.0"))
+LOG_PAYLOADS = os.getenv("ENGINES_LOG_PAYLOADS", "0") == "1"
+
+payload_logger = logging.getLogger("engines.payload")
+
+_listener: Optional[QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random `rate` fraction of records at or below `max_level`; higher levels always pass."""
+
+    def __init__(self, rate: float = 1.0, max_level: int = logging.INFO) -> None:
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > self.max_level or self.rate >= 1.0 or random.random() < self.rate
+
+
+def log_payload(message: str, payload: Any) -> None:
+    """Dump a request/response body at DEBUG, only when ENGINES_LOG_PAYLOADS=1.
+
+    The payload is not formatted at all unless the dump is enabled.
+    """
+    if LOG_PAYLOADS and payload_logger.isEnabledFor(logging.DEBUG):
+        payload_logger.debug("%s %s", message, payload)
+
+
+def setup_logging(level: Optional[str] = None, sample_rate: Optional[float] = None,
+                  handler: Optional[logging.Handler] = None) -> QueueListener:
+    """Route the `engines` logger through a queue so callers never block on the output stream.
+
+    Records are sampled and enqueued on the calling thread; a QueueListener thread formats
+    and writes them to `handler` (stderr by default). Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    logger = logging.getLogger("engines")
+    logger.setLevel(level or LOG_LEVEL)
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s"))
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE if sample_rate is None else sample_rate))
+    logger.addHandler(queue_handler)
+    # 已经由队列输出，避免再经过root logger重复输出
+    logger.propagate = False
+    payload_logger.setLevel(logging.DEBUG if LOG_PAYLOADS else logging.WARNING)
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
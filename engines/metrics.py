@@ -0,0 +1,275 @@
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import suppress
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("engines.metrics")
+
+# 多worker部署时，每个进程定期把自己的指标快照写到这个目录，/metrics 汇总所有快照
+METRICS_DIR = os.getenv("ENGINES_METRICS_DIR", "/tmp/engines_metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("ENGINES_METRICS_FLUSH", "5"))
+# 超过这个时长没有更新的快照视为已退出的worker留下的（pid可能已被复用），忽略并删除
+METRICS_STALE_AFTER = max(60.0, 10 * METRICS_FLUSH_INTERVAL)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 当前请求所属的VT关系名（analyse、contacted_urls……），由引擎在发请求前设置
+current_relationship: contextvars.ContextVar[str] = contextvars.ContextVar("engines_relationship", default="")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [[list(k), v] for k, v in self._values.items()]
+        return {"type": "counter", "help": self.help, "labels": list(self.labelnames), "values": values}
+
+
+class Gauge:
+    """Current value per label set.
+
+    `merge` says how render() combines the workers' values: "pid" (default) keeps one series
+    per worker under a pid label, "sum" adds them up (for additive values such as bytes held
+    by per-process caches) and "max" takes the largest.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], merge: str = "pid") -> None:
+        if merge not in ("pid", "sum", "max"):
+            raise ValueError(f"Unknown gauge merge mode: {merge}")
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.merge = merge
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [[list(k), v] for k, v in self._values.items()]
+        return {"type": "gauge", "help": self.help, "labels": list(self.labelnames), "merge": self.merge,
+                "values": values}
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：各桶计数（非累计）+ 溢出桶, sum, count
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0.0] * (len(self.buckets) + 3)
+            row[index] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [[list(k), list(v)] for k, v in self._values.items()]
+        return {"type": "histogram", "help": self.help, "labels": list(self.labelnames),
+                "buckets": list(self.buckets), "values": values}
+
+
+class MetricsRegistry:
+    """In-process metrics with Prometheus text export, merged across worker processes.
+
+    Each process flushes a snapshot to METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL
+    seconds; render() sums the counters and histograms of every live process (gauges are
+    merged per their `merge` mode), so whichever gunicorn worker answers /metrics reports the
+    whole deployment. Snapshots of exited workers are deleted.
+    """
+
+    def __init__(self, directory: Optional[str] = METRICS_DIR) -> None:
+        self.directory = directory
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), merge: str = "pid") -> Gauge:
+        return self._register(Gauge(name, help, labelnames, merge))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric: Any) -> Any:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+    def start(self) -> None:
+        """Start the background flusher of this process (safe to call again after fork)."""
+        if self.directory is None or (self._flusher is not None and self._flusher_pid == os.getpid()):
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._flush_loop, name="engines-metrics", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as ex:
+                logger.warning(f"Failed to flush metrics snapshot: {type(ex).__name__}: {ex}")
+
+    def flush(self) -> None:
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _snapshots(self) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        """(pid, snapshot) of this process and of every other live worker."""
+        yield os.getpid(), self.snapshot()
+        if self.directory is None:
+            return
+        now = time.time()
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                pid = int(os.path.basename(path).split(".")[0])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                stale = now - os.path.getmtime(path) > METRICS_STALE_AFTER
+            except OSError:
+                continue
+            if stale or not _pid_alive(pid):
+                # 退出的worker：删除其快照，Prometheus会把计数回落当作重置处理
+                with suppress(OSError):
+                    os.remove(path)
+                continue
+            try:
+                with open(path) as f:
+                    yield pid, json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def render(self) -> str:
+        merged: Dict[str, Dict[str, Any]] = {}
+        for pid, snapshot in self._snapshots():
+            for name, metric in snapshot.items():
+                merge = metric.get("merge", "sum") if metric["type"] == "gauge" else "sum"
+                labelnames = [*metric["labels"], "pid"] if merge == "pid" else metric["labels"]
+                target = merged.setdefault(name, {**metric, "labels": labelnames, "values": {}})
+                for labels, value in metric["values"]:
+                    key = tuple(labels)
+                    if merge == "pid":
+                        target["values"][(*key, str(pid))] = value
+                    elif merge == "max":
+                        target["values"][key] = max(target["values"].get(key, value), value)
+                    elif metric["type"] != "histogram":
+                        target["values"][key] = target["values"].get(key, 0.0) + value
+                    else:
+                        row = target["values"].setdefault(key, [0.0] * len(value))
+                        for i, v in enumerate(value):
+                            row[i] += v
+        lines: List[str] = []
+        for name, metric in sorted(merged.items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in sorted(metric["values"].items()):
+                labels = list(zip(metric["labels"], key))
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0.0
+                for bound, count in zip([*metric["buckets"], "+Inf"], value[:-2]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels([*labels, ('le', le)])} {_format_value(cumulative)}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {_format_value(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    "engines_request_seconds", "Upstream request latency.", ("engine", "host", "relationship", "status"))
+RESPONSE_BYTES = registry.counter(
+    "engines_response_bytes_total", "Upstream response body bytes.", ("engine", "host", "relationship"))
+REQUEST_EXCEPTIONS = registry.counter(
+    "engines_request_exceptions_total", "Upstream request failures by exception type.",
+    ("engine", "host", "relationship", "exception"))
+CONNECTIONS_OPENED = registry.counter(
+    "engines_connections_opened_total", "New upstream connections opened by requests.",
+    ("engine", "host", "http_version"))
+RETRIES = registry.counter(
+    "engines_retries_total", "Retried engine tasks by task and exception type.", ("task", "exception"))
+ROUTE_SECONDS = registry.histogram(
+    "engines_route_seconds", "API route latency.", ("route", "method", "status"))
+HOST_IN_FLIGHT_LIMIT = registry.gauge(
+    "engines_host_in_flight_limit", "Current adaptive in-flight window per host or endpoint group.", ("host",))
+HOST_LIMIT_DECREASES = registry.counter(
+    "engines_host_limit_decreases_total", "Multiplicative decreases of the adaptive in-flight window.", ("host",))
+
+
+def status_class(status: int) -> str:
+    return f"{status // 100}xx"
@@ -0,0 +1,90 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Mapping, Optional, Tuple, Union
+
+from curl_cffi import requests
+
+from .endpoint_pool import EndpointPool, EndpointStats, _stats_lock, endpoint_stats
+
+logger = logging.getLogger("engines.proxy_pool")
+
+# 隔离中的代理在后台用这个地址重新测试
+PROXY_TEST_URL = os.getenv("ENGINES_PROXY_TEST_URL", "https://www.gstatic.com/generate_204")
+
+
+class ProxyPool(EndpointPool):
+    """Spreads requests over several egress proxies by per-proxy success rate and latency.
+
+    Selection, scoring and ejection work as in EndpointPool, but a quarantined proxy is not
+    re-probed with live traffic: a background thread re-tests it against PROXY_TEST_URL once
+    its quarantine expires and only a passing test puts it back into rotation.
+
+        PROXY_URL="socks5://10.0.0.1:1080,socks5://10.0.0.2:1080"
+    """
+
+    def __init__(self, proxies: Union[Mapping[str, float], Iterable[str]], test_url: str = PROXY_TEST_URL,
+                 test_timeout: float = 10.0, **kwargs) -> None:
+        super().__init__(proxies, **kwargs)
+        self.test_url = test_url
+        self.test_timeout = test_timeout
+        self._retesting = set()
+
+    def _available(self, stats: EndpointStats, now: float) -> bool:
+        return not stats.probing
+
+    def record(self, url: str, latency: Optional[float] = None, ok: bool = True) -> None:
+        super().record(url, latency, ok)
+        if not ok:
+            self._schedule_retest(url)
+
+    def _schedule_retest(self, url: str) -> None:
+        stats = endpoint_stats(url)
+        # 隔离状态是所有池共享的统计，和它一起用统计锁保护
+        with _stats_lock:
+            if not stats.probing or url in self._retesting:
+                return
+            self._retesting.add(url)
+            delay = max(0.0, stats.ejected_until - time.monotonic())
+        logger.warning(f"Proxy {url} quarantined, re-testing in {delay:.0f}s")
+        timer = threading.Timer(delay, self._retest, (url,))
+        timer.daemon = True
+        timer.start()
+
+    def _retest(self, url: str) -> None:
+        start = time.monotonic()
+        try:
+            resp = requests.get(self.test_url, proxies={"all": url}, timeout=self.test_timeout,
+                                impersonate="chrome", verify=False)
+            ok = resp.status_code < 400
+        except Exception as ex:
+            logger.info(f"Proxy {url} re-test failed: {type(ex).__name__}: {ex}")
+            ok = False
+        with _stats_lock:
+            self._retesting.discard(url)
+        if ok:
+            logger.info(f"Proxy {url} passed re-test, back in rotation")
+            self.record(url, time.monotonic() - start)
+        else:
+            # 再次失败会加倍隔离时间并重新安排测试
+            self.record(url, ok=False)
+
+
+# 相同代理列表的客户端共享一个池，保证统计和后台测试在进程内只有一份
+_pools: Dict[Tuple[str, ...], ProxyPool] = {}
+_pools_lock = threading.Lock()
+
+
+def proxy_pool(proxies: Union[ProxyPool, str, Iterable[str]]) -> ProxyPool:
+    """Return the shared pool for a proxy list or a comma-separated proxy string."""
+    if isinstance(proxies, ProxyPool):
+        return proxies
+    if isinstance(proxies, str):
+        proxies = proxies.split(",")
+    key = tuple(p.strip() for p in proxies if p and p.strip())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ProxyPool(key)
+        return pool
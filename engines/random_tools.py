@@ -1,4 +1,7 @@
+import os
 import random
+import threading
+import time
 
 # 定义常见的公网IP地址范围
 public_ip_ranges = [
@@ -18,7 +21,7 @@ def generate_random_public_ip():
     range_start, range_end = random.choice(public_ip_ranges)
     return generate_random_ip_from_range(range_start, range_end)
 
-print(generate_random_public_ip())
+# print(generate_random_public_ip())
 
 def random_impersonate():
     impersonate = random.choice(['chrome124', 'chrome123', 'chrome120', 'edge99', 'edge101', 'safari17_0'])
@@ -97,4 +100,68 @@ def random_ua(browser, major_version):
 # browser = 'safari'
 # major_version = '17'
 # user_agent = random_ua(browser, major_version)
-print("Generated User Agent:", random_impersonate())
+# print("Generated User Agent:", random_impersonate())
+
+
+# 指纹档案复用的请求数和秒数，以及池中同时存在的档案数
+FINGERPRINT_MAX_USES = int(os.getenv("ENGINES_FINGERPRINT_USES", "50"))
+FINGERPRINT_MAX_AGE = float(os.getenv("ENGINES_FINGERPRINT_TTL", "300"))
+FINGERPRINT_POOL_SIZE = int(os.getenv("ENGINES_FINGERPRINT_POOL", "4"))
+
+
+class FingerprintProfile:
+    """One browser identity: impersonate target, matching UA headers and a fake client IP.
+
+    AsyncClient sends every request of a profile through the pooled session of its impersonate
+    target, so requests that share a profile reuse warm connections with the same TLS fingerprint.
+    """
+
+    def __init__(self, max_uses=FINGERPRINT_MAX_USES, max_age=FINGERPRINT_MAX_AGE):
+        self.impersonate, self.ua_headers = random_impersonate()
+        self.fake_ip = generate_random_public_ip()
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.uses = 0
+        self.created = time.monotonic()
+
+    def expired(self):
+        return self.uses >= self.max_uses or time.monotonic() - self.created >= self.max_age
+
+    def headers(self):
+        headers = dict(self.ua_headers)
+        headers["X-Forwarded-For"] = self.fake_ip
+        headers["X-Real-IP"] = self.fake_ip
+        return headers
+
+
+class FingerprintPool:
+    """A few live profiles, each reused for `max_uses` requests or `max_age` seconds before rotating."""
+
+    def __init__(self, size=FINGERPRINT_POOL_SIZE, max_uses=FINGERPRINT_MAX_USES, max_age=FINGERPRINT_MAX_AGE):
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self._profiles = [None] * max(1, size)
+        self._lock = threading.Lock()
+        self.rotations = 0
+
+    def acquire(self):
+        with self._lock:
+            slot = random.randrange(len(self._profiles))
+            profile = self._profiles[slot]
+            if profile is None or profile.expired():
+                profile = self._profiles[slot] = FingerprintProfile(self.max_uses, self.max_age)
+                self.rotations += 1
+            profile.uses += 1
+            return profile
+
+    def impersonates(self):
+        """Impersonate targets of the live profiles, filling empty slots; does not count as a use."""
+        with self._lock:
+            for slot, profile in enumerate(self._profiles):
+                if profile is None or profile.expired():
+                    self._profiles[slot] = FingerprintProfile(self.max_uses, self.max_age)
+                    self.rotations += 1
+            return [profile.impersonate for profile in self._profiles]
+
+
+fingerprint_pool = FingerprintPool()
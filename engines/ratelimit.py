@@ -0,0 +1,313 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .metrics import HOST_IN_FLIGHT_LIMIT, HOST_LIMIT_DECREASES
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every event loop in the process.
+
+    Callers reserve a token up front and sleep until its slot comes, so concurrent callers
+    are paced evenly at `rate` per second instead of bursting and then backing off.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token and return how long the caller has to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self) -> None:
+        """Blocking acquire for thread-pool callers outside the engines."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            return min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+
+
+class InFlightLimiter:
+    """Semaphore that caps concurrent requests across event loops and threads."""
+
+    def __init__(self, limit: int) -> None:
+        self._limit = max(1, int(limit))
+        self._active = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def set_limit(self, limit: int) -> None:
+        with self._lock:
+            self._limit = max(1, int(limit))
+            self._wake_waiters()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self._limit and not self._waiters:
+                self._active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # 已经分配到名额但调用方被取消，归还名额
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        """Hand free slots to queued waiters on their own loops. Caller holds the lock."""
+        while self._waiters and self._active < self._limit:
+            loop, fut = self._waiters.popleft()
+            self._active += 1
+            loop.call_soon_threadsafe(self._grant, fut)
+
+    def _grant(self, fut: "asyncio.Future[None]") -> None:
+        if fut.done():
+            # 等待者已被取消，名额转给下一个
+            self.release()
+        else:
+            fut.set_result(None)
+
+
+class AdaptiveLimit:
+    """AIMD controller for an endpoint's concurrency window.
+
+    Every healthy response grows the window by 1/window (about +1 per window's worth of
+    responses); a rate-limit status, a timeout or a latency spike halves it. Decreases are
+    spaced by at least one smoothed RTT so one burst of 429s only counts once. The window is
+    exported as the engines_host_in_flight_limit gauge, labelled with `name`.
+    """
+
+    def __init__(self, in_flight: InFlightLimiter, min_limit: int = 1, max_limit: int = 64,
+                 backoff: float = 0.5, latency_factor: float = 3.0, smoothing: float = 0.1,
+                 name: str = "") -> None:
+        self.in_flight = in_flight
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.smoothing = smoothing
+        self.window = float(in_flight.limit)
+        self.latency: Optional[float] = None
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        HOST_IN_FLIGHT_LIMIT.set(in_flight.limit, name)
+
+    def on_success(self, latency: float) -> None:
+        with self._lock:
+            if self.latency is not None and latency > self.latency * self.latency_factor:
+                self._decrease()
+                return
+            self.window = min(self.max_limit, self.window + 1 / self.window)
+            self.latency = latency if self.latency is None else \
+                self.latency + self.smoothing * (latency - self.latency)
+            self._apply()
+
+    def on_overload(self) -> None:
+        with self._lock:
+            self._decrease()
+
+    def _decrease(self) -> None:
+        """Multiplicative decrease. Caller holds the lock."""
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or 1.0):
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        HOST_LIMIT_DECREASES.inc(self.name)
+        self.window = max(self.min_limit, self.window * self.backoff)
+        self._apply()
+
+    def _apply(self) -> None:
+        """Push the window to the in-flight limiter and the gauge. Caller holds the lock."""
+        limit = int(self.window)
+        if limit != self.in_flight.limit:
+            self.in_flight.set_limit(limit)
+            HOST_IN_FLIGHT_LIMIT.set(self.in_flight.limit, self.name)
+
+
+# 这些状态码表示上游在限流，与 AsyncClient 抛出 RatelimitException 的判断一致
+OVERLOAD_STATUS = (202, 403, 429)
+
+
+class HostLimiter:
+    """Token-bucket rate plus in-flight cap for one host or endpoint group.
+
+    With `max_limit` set the in-flight cap is adaptive: it starts at `max_in_flight` (or 4)
+    and is tuned by AdaptiveLimit between `min_in_flight` and `max_limit`. `name` labels its metrics.
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 max_in_flight: Optional[int] = None, max_limit: Optional[int] = None,
+                 min_in_flight: int = 1, name: str = "") -> None:
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        if max_limit:
+            self.in_flight: Optional[InFlightLimiter] = InFlightLimiter(max_in_flight or 4)
+            self.adaptive: Optional[AdaptiveLimit] = AdaptiveLimit(
+                self.in_flight, min_limit=min_in_flight, max_limit=max_limit, name=name)
+        else:
+            self.in_flight = InFlightLimiter(max_in_flight) if max_in_flight else None
+            self.adaptive = None
+
+    def record(self, status: int, latency: float) -> None:
+        """Feed a response back into the adaptive window."""
+        if self.adaptive is None:
+            return
+        if status in OVERLOAD_STATUS:
+            self.adaptive.on_overload()
+        elif status < 500:
+            self.adaptive.on_success(latency)
+
+    def record_error(self, ex: BaseException) -> None:
+        """Feed a transport error back into the adaptive window; only timeouts count."""
+        if self.adaptive is not None and "time" in str(ex).lower():
+            self.adaptive.on_overload()
+
+    async def __aenter__(self) -> "HostLimiter":
+        if self.in_flight is not None:
+            await self.in_flight.acquire()
+        if self.bucket is not None:
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                if self.in_flight is not None:
+                    self.in_flight.release()
+                raise
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self.in_flight is not None:
+            self.in_flight.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": self.bucket.rate if self.bucket else None,
+            "tokens": round(self.bucket.tokens, 2) if self.bucket else None,
+            "max_in_flight": self.in_flight.limit if self.in_flight else None,
+            "in_flight": self.in_flight.active if self.in_flight else None,
+            "waiting": self.in_flight.waiting if self.in_flight else None,
+            "adaptive_window": round(self.adaptive.window, 2) if self.adaptive else None,
+            "adaptive_latency": round(self.adaptive.latency, 4) if self.adaptive and self.adaptive.latency else None,
+            "adaptive_decreases": self.adaptive.decreases if self.adaptive else None,
+        }
+
+
+class RateLimiterRegistry:
+    """Process-wide host -> HostLimiter mapping used by AsyncClient.
+
+    Hosts configured together share one limiter (an endpoint group, e.g. several mirrors of
+    the same upstream account). The key "*" sets the default applied, per host, to every host
+    that is not configured explicitly.
+    Config comes from code via configure() or from the ENGINES_RATE_LIMITS env var:
+
+        ENGINES_RATE_LIMITS="www.virustotal.com,vtcdn.darkqiank.work=5/10/8;*=50"
+
+    where each value is rate/burst/max_in_flight[/max_limit] and any part may be left empty.
+    A fourth part makes the in-flight cap adaptive (AIMD) with max_in_flight as the start
+    value and max_limit as the ceiling.
+    """
+
+    def __init__(self) -> None:
+        self._limiters: Dict[str, HostLimiter] = {}
+        self._default: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def configure(self, hosts: Any, rate: Optional[float] = None, burst: Optional[float] = None,
+                  max_in_flight: Optional[int] = None, max_limit: Optional[int] = None,
+                  min_in_flight: int = 1) -> HostLimiter:
+        hosts = [hosts] if isinstance(hosts, str) else list(hosts)
+        spec = {"rate": rate, "burst": burst, "max_in_flight": max_in_flight,
+                "max_limit": max_limit, "min_in_flight": min_in_flight}
+        # 一组host共享一个限流器，指标标签用组内的host列表
+        limiter = HostLimiter(**spec, name=",".join(h.lower() for h in hosts if h != "*"))
+        with self._lock:
+            for host in hosts:
+                if host == "*":
+                    self._default = spec
+                else:
+                    self._limiters[host.lower()] = limiter
+        return limiter
+
+    def load_env(self, value: Optional[str] = None) -> None:
+        value = os.getenv("ENGINES_RATE_LIMITS", "") if value is None else value
+        for item in filter(None, (part.strip() for part in value.split(";"))):
+            hosts, _, spec = item.partition("=")
+            parts = (spec.split("/") + ["", "", "", ""])[:4]
+            rate, burst, max_in_flight, max_limit = (float(p) if p else None for p in parts)
+            self.configure([h.strip() for h in hosts.split(",") if h.strip()],
+                           rate=rate, burst=burst,
+                           max_in_flight=int(max_in_flight) if max_in_flight else None,
+                           max_limit=int(max_limit) if max_limit else None)
+
+    def get(self, url_or_host: str) -> Optional[HostLimiter]:
+        host = urlparse(url_or_host).hostname if "://" in url_or_host else url_or_host
+        host = (host or "").lower()
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None and self._default is not None and host:
+                limiter = self._limiters[host] = HostLimiter(**self._default, name=host)
+            return limiter
+
+    def clear(self) -> None:
+        with self._lock:
+            self._limiters.clear()
+            self._default = None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items: List[Tuple[str, HostLimiter]] = list(self._limiters.items())
+        return {host: limiter.stats() for host, limiter in items}
+
+
+rate_limits = RateLimiterRegistry()
+rate_limits.load_env()
@@ -3,6 +3,9 @@ import asyncio
 from readability import Document
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse, urlunparse
+import logging
+
+logger = logging.getLogger("engines.URLRead")
 
 class URLRead(Client):
     def __init__(self, *args, **kwargs):
@@ -21,14 +24,14 @@ class URLRead(Client):
 
         async def _read(url: str):
             try:
-                print(f"Reading {url}")
+                logger.debug("Reading %s", url)
                 response = await self._aget_url("GET", url)
                 response_str = response.decode('utf-8')
                 base_url = self._get_base_url(url)
                 content_data = self._read_html(response_str, base_url=base_url)
                 combined_results[url] = content_data
             except Exception as e:
-                print(f"Error reading {url}: {e}")
+                logger.warning("Error reading %s: %s", url, e)
 
         tasks = [_read(url) for url in urls]
         await asyncio.gather(*tasks)
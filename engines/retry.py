@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Type, TypeVar
+
+from .deadline import remaining
+from .exceptions import (CircuitOpenException, ClientSearchException, DeadlineExceededException, NotFoundException,
+                         RatelimitException, TimeoutException)
+from .metrics import RETRIES
+
+logger = logging.getLogger("engines.retry")
+
+T = TypeVar("T")
+
+# 每类错误允许的重试次数，按异常类的MRO匹配最具体的一项
+DEFAULT_RETRIES_PER_CLASS: Dict[Type[BaseException], int] = {
+    NotFoundException: 0,
+    CircuitOpenException: 0,
+    DeadlineExceededException: 0,
+    RatelimitException: 2,
+    TimeoutException: 1,
+    ClientSearchException: 2,
+    Exception: 1,
+}
+
+
+class RetryPolicy:
+    """Retry with full-jitter exponential backoff and a retry limit per error class."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base: float = 0.5,
+        cap: float = 8.0,
+        retries_per_class: Optional[Dict[Type[BaseException], int]] = None,
+    ) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.base = base
+        self.cap = cap
+        self.retries_per_class = retries_per_class if retries_per_class is not None else DEFAULT_RETRIES_PER_CLASS
+
+    def retries_for(self, ex: BaseException) -> int:
+        for cls in type(ex).__mro__:
+            if cls in self.retries_per_class:
+                return self.retries_per_class[cls]
+        return 0
+
+    def backoff(self, attempt: int) -> float:
+        """Sleep before retry number `attempt` (1-based)."""
+        return random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+    async def run(self, func: Callable[..., Awaitable[T]], *args: Any) -> T:
+        failures: Dict[Type[BaseException], int] = {}
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func(*args)
+            except Exception as ex:
+                failures[type(ex)] = failures.get(type(ex), 0) + 1
+                if attempt >= self.max_attempts or failures[type(ex)] > self.retries_for(ex):
+                    raise
+                wait = self.backoff(attempt)
+                left = remaining()
+                if left is not None and left <= wait:
+                    # 截止时间内等不到下一次尝试，直接放弃
+                    raise
+                RETRIES.inc(getattr(func, '__name__', str(func)).lstrip('_'), type(ex).__name__)
+                logger.info(f"Retrying {getattr(func, '__name__', func)} after {type(ex).__name__}: {ex} "
+                            f"(attempt {attempt}/{self.max_attempts}, wait {wait:.2f}s)")
+                await asyncio.sleep(wait)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: opens after consecutive failures, half-opens after a cool-down.
+
+    While open every call fails fast; once `reset_timeout` has passed a single trial call is
+    let through and its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures}
+
+
+class CircuitBreakerRegistry:
+    """Process-wide end point -> CircuitBreaker mapping."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, end_point: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(end_point)
+            if breaker is None:
+                breaker = self._breakers[end_point] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = list(self._breakers.items())
+        return {end_point: breaker.stats() for end_point, breaker in items}
+
+
+breakers = CircuitBreakerRegistry(
+    failure_threshold=int(os.getenv("ENGINES_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("ENGINES_BREAKER_RESET", "30")),
+)
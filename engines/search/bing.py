@@ -4,17 +4,24 @@ from typing import Dict, List, Optional, Any
 from fastapi.responses import HTMLResponse
 from engines.utils import _normalize, _normalize_url, json_loads
 from engines.exceptions import ClientSearchException
+import logging
+
+logger = logging.getLogger("engines.BING")
 
 
 class BING(Client):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._asession.headers["Referer"] = "https://www.bing.com/"
-        self._asession.headers["Accept-Language"] = "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
+        self.headers["Referer"] = "https://www.bing.com/"
+        self.headers["Accept-Language"] = "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6"
 
     def text(self, *args: Any, **kwargs: Any) -> Any:
         return self._run_async_in_thread(self._text_api(*args, **kwargs))
 
+    async def atext(self, *args: Any, **kwargs: Any) -> Any:
+        """Awaitable form of text(), runs on the caller's event loop."""
+        return await self._text_api(*args, **kwargs)
+
     async def _text_api(
             self,
             keywords: str
@@ -39,7 +46,7 @@ class BING(Client):
         extracted_data = []
         if html is not None:
             items = html.xpath('//li[contains(@class, "b_algo")]')
-            print(items)
+            logger.debug("BING %d results", len(items))
             for item in items:
                 # 提取标题
                 title = item.xpath('.//h2[1]//text()')
@@ -1,32 +1,40 @@
 from engines.client import Client
+from engines.deadline import gather_until_deadline
+from engines.endpoint_pool import EndpointPool
 from lxml import etree
 from urllib.parse import urlparse, parse_qs
 from engines.exceptions import ClientSearchException
 from typing import Dict, List, Optional, Any
-import asyncio
 from itertools import islice
 
-from engines.random_tools import random_impersonate, generate_random_public_ip
+from engines.random_tools import fingerprint_pool
 from engines.utils import _normalize, _normalize_url, json_loads
 
 
 class DDGS(Client):
 
     def __init__(self, *args, **kwargs):
-        self.ddgs_end_point = kwargs.pop('ddgs_end_point', 'https://duckduckgo.com')
-        self.ddgslink_end_point = kwargs.pop('ddgslink_end_point', 'https://links.duckduckgo.com')
+        # 端点可以是单个URL、URL列表/权重字典或 EndpointPool
+        self.ddgs_end_points = EndpointPool.coerce(kwargs.pop('ddgs_end_point', 'https://duckduckgo.com'))
+        self.ddgslink_end_points = EndpointPool.coerce(kwargs.pop('ddgslink_end_point', 'https://links.duckduckgo.com'))
+        self.ddgs_end_point = self.ddgs_end_points.primary
+        self.ddgslink_end_point = self.ddgslink_end_points.primary
         super().__init__(*args, **kwargs)
-        self._asession.headers["Referer"] = "https://duckduckgo.com/"
+        self.headers["Referer"] = "https://duckduckgo.com/"
 
     def text(self, *args: Any, **kwargs: Any) -> Any:
         return self._run_async_in_thread(self._text_api(*args, **kwargs))
 
+    async def atext(self, *args: Any, **kwargs: Any) -> Any:
+        """Awaitable form of text(), runs on the caller's event loop."""
+        return await self._text_api(*args, **kwargs)
+
     async def _get_preload_params(self, keywords: str, payload: dict) -> dict:
         """Get vqd value for a search query."""
         impersonate, headers = random_ddgs_ua_headers()
-        resp_content = await self._aget_url("GET", self.ddgs_end_point,
-                                            impersonate=impersonate, headers=headers,
-                                            params=payload)
+        resp_content = await self._aget_end_point(self.ddgs_end_points, "",
+                                                  impersonate=impersonate, headers=headers,
+                                                  params=payload)
         # 解析HTML字符串
         tree = etree.HTML(resp_content)
         href = tree.xpath('//*[@id="deep_preload_link"]/@href')
@@ -85,10 +93,10 @@ class DDGS(Client):
             params["s"] = f"{s}"
             # print(payload)
             impersonate, headers = random_ddgs_ua_headers()
-            resp_content = await self._aget_url("GET", f"{self.ddgslink_end_point}/d.js",
-                                                impersonate=impersonate,
-                                                headers=headers,
-                                                params=params)
+            resp_content = await self._aget_end_point(self.ddgslink_end_points, "/d.js",
+                                                      impersonate=impersonate,
+                                                      headers=headers,
+                                                      params=params)
             page_data = _text_extract_json(resp_content, keywords)
 
             for row in page_data:
@@ -109,7 +117,10 @@ class DDGS(Client):
         if max_results:
             max_results = min(max_results, 500)
             tasks.extend(_text_api_page(s, i, preload_params) for i, s in enumerate(range(23, max_results, 50), start=1))
-        await asyncio.gather(*tasks)
+        # 任一页失败就取消其余还在下载的页面
+        for res in await gather_until_deadline(*tasks, fail_fast=lambda index, ex: True):
+            if isinstance(res, Exception):
+                raise res
 
         return list(islice(filter(None, results), max_results))
 
@@ -127,9 +138,7 @@ def _text_extract_json(html_bytes: bytes, keywords: str) -> List[Dict[str, str]]
         raise ClientSearchException(f"_text_extract_json() {keywords=} {type(ex).__name__}: {ex}") from ex
 
 def random_ddgs_ua_headers():
-    impersonate, ua_headers = random_impersonate()
-    fake_ip = generate_random_public_ip()
-    ua_headers["X-Forwarded-For"] = fake_ip
-    ua_headers["X-Real-IP"] = fake_ip
+    profile = fingerprint_pool.acquire()
+    ua_headers = profile.headers()
     ua_headers["X-Forwarded-Host"] = "https://duckduckgo.com"
-    return impersonate, ua_headers
\ No newline at end of file
+    return profile.impersonate, ua_headers
\ No newline at end of file
@@ -1,8 +1,9 @@
 from engines.client import Client
+from engines.endpoint_pool import EndpointPool
 from typing import Dict, List, Optional, Any
 from urllib.parse import urljoin, urlparse, parse_qs, unquote
 
-from engines.random_tools import random_impersonate, generate_random_public_ip
+from engines.random_tools import fingerprint_pool
 
 from collections.abc import Mapping
 from typing import Any, ClassVar, TypeVar
@@ -14,9 +15,10 @@ T = TypeVar("T")
 class DDGS_V2(Client):
 
     def __init__(self, *args, **kwargs):
-        end_point = kwargs.pop('ddgs_end_point', 'https://html.duckduckgo.com')
+        # 端点可以是单个URL、URL列表/权重字典或 EndpointPool
+        self.ddgs_end_points = EndpointPool.coerce(kwargs.pop('ddgs_end_point', 'https://html.duckduckgo.com'))
         kwargs.pop('ddgslink_end_point', None)
-        self.ddgs_end_point = urljoin(end_point.rstrip('/') + '/', 'html/')
+        self.ddgs_end_point = urljoin(self.ddgs_end_points.primary.rstrip('/') + '/', 'html/')
         super().__init__(*args, **kwargs)
         self.items_xpath = "//div[contains(@class, 'body')]"
         self.elements_xpath: ClassVar[Mapping[str, str]] = {"title": ".//h2//text()", "href": "./a/@href", "body": "./a//text()"}
@@ -24,6 +26,10 @@ class DDGS_V2(Client):
     def text(self, *args: Any, **kwargs: Any) -> Any:
         return self._run_async_in_thread(self._text_api(*args, **kwargs))
 
+    async def atext(self, *args: Any, **kwargs: Any) -> Any:
+        """Awaitable form of text(), runs on the caller's event loop."""
+        return await self._text_api(*args, **kwargs)
+
 
     async def _text_api(
         self,
@@ -42,10 +48,11 @@ class DDGS_V2(Client):
         }
         impersonate, headers = random_ddgs_ua_headers()
 
-        resp_content = await self._aget_url("POST", self.ddgs_end_point,
-                                    impersonate=impersonate,
-                                    headers=headers,
-                                    params=payload)
+        resp_content = await self._aget_end_point(self.ddgs_end_points, "html/", "POST",
+                                                  impersonate=impersonate,
+                                                  headers=headers,
+                                                  params=payload,
+                                                  coalesce=True)
         return self.extract_results(resp_content)
 
     def parser(self) -> LHTMLParser:
@@ -96,9 +103,7 @@ class DDGS_V2(Client):
 
 
 def random_ddgs_ua_headers():
-    impersonate, ua_headers = random_impersonate()
-    fake_ip = generate_random_public_ip()
-    ua_headers["X-Forwarded-For"] = fake_ip
-    ua_headers["X-Real-IP"] = fake_ip
+    profile = fingerprint_pool.acquire()
+    ua_headers = profile.headers()
     ua_headers["X-Forwarded-Host"] = "https://duckduckgo.com"
-    return impersonate, ua_headers
\ No newline at end of file
+    return profile.impersonate, ua_headers
\ No newline at end of file
@@ -9,11 +9,15 @@ from engines.exceptions import ClientSearchException
 class GITHUB(Client):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._asession.headers["Referer"] = "https://github.com/"
+        self.headers["Referer"] = "https://github.com/"
 
     def text(self, *args: Any, **kwargs: Any) -> Any:
         return self._run_async_in_thread(self._text_api(*args, **kwargs))
 
+    async def atext(self, *args: Any, **kwargs: Any) -> Any:
+        """Awaitable form of text(), runs on the caller's event loop."""
+        return await self._text_api(*args, **kwargs)
+
     async def _text_api(
             self,
             keywords: str
@@ -4,79 +4,225 @@ import random
 import base64
 import orjson
 import asyncio
-from typing import Any
+import logging
+import os
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional, Tuple
 import tldextract
 import ipaddress
 import re
 from urllib.parse import quote
-from urllib.parse import urlparse, urlunparse, urlencode
+from urllib.parse import parse_qsl, urlparse, urlunparse, urlencode
 
-from engines.exceptions import NotFoundException
-from engines.random_tools import random_impersonate, generate_random_public_ip
+from engines.bulk import BULK_CONCURRENCY, bounded_map
+from engines.deadline import gather_until_deadline
+from engines.endpoint_pool import EndpointPool
+from engines.hedging import HedgePolicy
+from engines.log import log_payload
+from engines.metrics import current_relationship
+from engines.exceptions import ClientSearchException, NotFoundException
+from engines.random_tools import fingerprint_pool
+from engines.singleflight import SingleFlight
+from engines.retry import DEFAULT_RETRY_POLICY, RetryPolicy
+
+logger = logging.getLogger("engines.VT")
+
+# 相同IOC的并发查询共享一次上游请求和同一份解析后的报告
+report_flights = SingleFlight(partial_results=True)
+
+# VT子请求的对冲策略，延迟分位数按子请求类型在进程内共享统计
+vt_hedge_policy = HedgePolicy(percentile=float(os.getenv("ENGINES_VT_HEDGE_PERCENTILE", "0.95")))
+
+
+class VTReport(dict):
+    """A report assembled by aapi() from a relationship fan-out.
+
+    `complete` is False when a relationship failed or was cut off by the deadline, so the
+    report is missing parts and should not be cached as if it were whole.
+    """
+
+    complete = True
 
 
 class VT(Client):
 
     def __init__(self, *args, **kwargs):
-        self.vt_end_point = kwargs.pop('vt_end_point', 'https://www.virustotal.com/')
+        # vt_end_point 可以是单个URL、URL列表/权重字典或 EndpointPool
+        self.vt_end_points = EndpointPool.coerce(kwargs.pop('vt_end_point', 'https://www.virustotal.com/'),
+                                                 backups=kwargs.pop('vt_fallback_end_points', ()))
+        self.vt_end_point = self.vt_end_points.primary
         self.cf_end_point = kwargs.pop('cf_end_point', 'https://vt.451964719.xyz/')
+        self.retry_policy = kwargs.pop('retry_policy', DEFAULT_RETRY_POLICY)
+        # hedge=True 使用共享的 vt_hedge_policy，也可以传入自定义的 HedgePolicy
+        hedge = kwargs.pop('hedge', None)
+        self.hedge_policy = vt_hedge_policy if hedge is True else (hedge or None)
         super().__init__(*args, **kwargs)
-        self._asession.headers["sec-ch-ua-mobile"] = "?0"
-        self._asession.headers["content-type"] = "application/json"
-        self._asession.headers["accept"] = "application/json"
-        self._asession.headers["Referer"] = "https://www.virustotal.com/"
-        self._asession.headers["Accept-Ianguage"] = "en-US,en;q=0.9,es;q=0.8"
-        self._asession.headers[
+        self.headers["sec-ch-ua-mobile"] = "?0"
+        self.headers["content-type"] = "application/json"
+        self.headers["accept"] = "application/json"
+        self.headers["Referer"] = "https://www.virustotal.com/"
+        self.headers["Accept-Ianguage"] = "en-US,en;q=0.9,es;q=0.8"
+        self.headers[
             "X-VT-Anti-Abuse-Header"] = "MTE3NTMwOTMwOTQtWkc5dWRDQmlaU0JsZG1scy0xNzE2MzQ1MDI4LjQ1OQ=="
 
-    def api(self, input_str: str) -> Any:
+    def api(self, input_str: str, relationships: Optional[Iterable[str]] = None) -> Any:
+        """Report on an IOC. `relationships` limits a file/domain/IP report to those parts, e.g. ("analyse", "behaviour")."""
+        return self._run_async_in_thread(self.aapi(input_str, relationships))
+
+    def cf_api(self, input_str: str, dtype: str = None, cursor: str = None,
+               relationships: Optional[Iterable[str]] = None, page_size: Optional[int] = None) -> Any:
+        """Report on an IOC through the CF worker, optionally only the given `relationships`."""
+        return self._run_async_in_thread(self.acf_api(input_str, dtype, cursor, relationships, page_size))
+
+    async def aapi(self, input_str: str, relationships: Optional[Iterable[str]] = None) -> Any:
+        """Awaitable form of api(), runs on the caller's event loop.
+
+        File, domain and IP reports are VTReport: check `complete` before caching one.
+        """
+        relationships = relationship_key(relationships)
+        key = ("api", tuple(self.vt_end_points.urls), input_str, relationships)
+        return await report_flights.do(key, lambda: self._api(input_str, relationships))
+
+    async def acf_api(self, input_str: str, dtype: str = None, cursor: str = None,
+                      relationships: Optional[Iterable[str]] = None, page_size: Optional[int] = None) -> Any:
+        """Awaitable form of cf_api(), runs on the caller's event loop."""
+        relationships = relationship_key(relationships)
+        key = ("cf_api", self.cf_end_point, input_str, dtype, cursor, relationships, page_size)
+        return await report_flights.do(key, lambda: self._cf_api(input_str, dtype, cursor, relationships, page_size))
+
+    def api_many(self, iocs: Iterable[str], concurrency: int = BULK_CONCURRENCY, ordered: bool = False,
+                 relationships: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Any]]:
+        """Look up many IOCs, yielding (ioc, report | exception) as each finishes. See aapi_many()."""
+        return self._iter_async_in_thread(self.aapi_many(iocs, concurrency, ordered, relationships))
+
+    def cf_api_many(self, iocs: Iterable[str], concurrency: int = BULK_CONCURRENCY, ordered: bool = False,
+                    relationships: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Any]]:
+        """Look up many IOCs through the CF worker. See aapi_many()."""
+        return self._iter_async_in_thread(self.acf_api_many(iocs, concurrency, ordered, relationships))
+
+    async def aapi_many(self, iocs: Iterable[str], concurrency: int = BULK_CONCURRENCY, ordered: bool = False,
+                        relationships: Optional[Iterable[str]] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """Look up many IOCs with at most `concurrency` in flight, over this client's pooled sessions.
+
+        IOCs are normalised (see normalize_ioc) and deduplicated, blank lines are skipped. Yields
+        (normalised ioc, report) as lookups finish, or in input order with ordered=True; a failed
+        lookup yields (ioc, exception) and the batch carries on.
+
+            for ioc, res in vt.api_many(open("iocs.txt"), concurrency=32):
+                if isinstance(res, Exception): ...
+        """
+        relationships = relationship_key(relationships)
+        async for item in bounded_map(lambda ioc: self.aapi(ioc, relationships), _non_blank(iocs),
+                                      concurrency, ordered, normalize_ioc):
+            yield item
+
+    async def acf_api_many(self, iocs: Iterable[str], concurrency: int = BULK_CONCURRENCY, ordered: bool = False,
+                           relationships: Optional[Iterable[str]] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """cf_api() counterpart of aapi_many()."""
+        relationships = relationship_key(relationships)
+        async for item in bounded_map(lambda ioc: self.acf_api(ioc, relationships=relationships), _non_blank(iocs),
+                                      concurrency, ordered, normalize_ioc):
+            yield item
+
+    async def iter_relationship(self, input_str: str, relationship: str, limit: Optional[int] = None,
+                                page_size: Optional[int] = None, cf: bool = True) -> AsyncIterator[Any]:
+        """Yield the items of a paginated relationship, following meta.cursor page by page.
+
+        The next page is requested as soon as the current one arrives, so it downloads while
+        the caller consumes the current items. `limit` caps the number of items yielded,
+        `page_size` is passed to VT as the page limit. Pages come from the CF worker, or from
+        vt_end_points directly with cf=False.
+
+            async for item in vt.iter_relationship("1.2.3.4", "communicating_files", limit=2000):
+                ...
+        """
+        path = cf_api_endpoints(input_str).get(relationship)
+        if path is None:
+            raise ClientSearchException(f"Unsupported relationship {relationship!r} for {input_str}")
+
+        async def _page(cursor):
+            if cf:
+                res = await self.acf_api(input_str, dtype=relationship, cursor=cursor, page_size=page_size)
+                return relationship_page(res.get(relationship) or {}, f"{relationship} of {input_str}")
+            params = {"cursor": cursor, "limit": page_size}
+            page_path = add_query_to_endpoint(path, **{k: v for k, v in params.items() if v is not None})
+            return orjson.loads(await self._vt_get(page_path.lstrip('/')))
+
+        count = 0
+        page = asyncio.ensure_future(self.run_task_with_retries(_page, None))
+        try:
+            while page is not None:
+                res = await page
+                page = None
+                items = res.get("data") or []
+                cursor = (res.get("meta") or {}).get("cursor")
+                if cursor and items and (limit is None or count + len(items) < limit):
+                    # 先发出下一页请求，再交出本页数据
+                    page = asyncio.ensure_future(self.run_task_with_retries(_page, cursor))
+                for item in items:
+                    if limit is not None and count >= limit:
+                        return
+                    count += 1
+                    yield item
+        finally:
+            if page is not None:
+                page.cancel()
+
+    async def _api(self, input_str: str, relationships: Optional[Tuple[str, ...]] = None) -> Any:
         if input_str == "comments":
-            return self._run_async_in_thread(self._comments_api())
+            return await self._comments_api()
 
         if input_str.startswith('user/'):
             u = input_str[len('user/'):]
-            return self._run_async_in_thread(self._user_api(u))
+            return await self._user_api(u)
 
         if is_ip_address(input_str):
-            return self._run_async_in_thread(self._ip_api(input_str))
+            return await self._ip_api(input_str, relationships)
         elif is_domain(input_str):
-            return self._run_async_in_thread(self._domain_api(input_str))
+            return await self._domain_api(input_str, relationships)
         else:
             hash_type = identify_hash(input_str)
             if hash_type in ('MD5', 'SHA-1'):
-                return self._run_async_in_thread(self._search_api(input_str))
+                return await self._search_api(input_str)
             elif hash_type == 'SHA-256':
-                return self._run_async_in_thread(self._file_api(input_str))
-
-    def cf_api(self, input_str: str, dtype: str = None, cursor: str = None) -> Any:
-        return self._run_async_in_thread(self._cf_api(input_str, dtype, cursor))
-
-
-    @staticmethod
-    async def run_task_with_retries(task_func, *args, retries=3, retry_wait=2):
-        attempt = 0
-        while attempt < retries:
-            try:
-                return await task_func(*args)
-            except NotFoundException as ex:
-                # print(f"Task {task_func.__name__} failed with {ex}. Not retrying due to NotFoundException.")
-                raise
-            except Exception as ex:
-                attempt += 1
-                print(f"Retrying... Attempt {attempt}/{retries} Task {task_func.__name__} failed with {ex}.")
-                if attempt >= retries:
-                    raise
-                await asyncio.sleep(retry_wait)
-
-    async def _domain_api(self, domain: str):
-        report = {'id': domain,
-                  'dtype': 'domain'
-                  }
+                return await self._file_api(input_str, relationships)
+
+    async def run_task_with_retries(self, task_func, *args, retries=None, retry_wait=None):
+        policy = self.retry_policy
+        if retries is not None or retry_wait is not None:
+            policy = RetryPolicy(max_attempts=retries or policy.max_attempts,
+                                 base=retry_wait if retry_wait is not None else policy.base,
+                                 cap=policy.cap, retries_per_class=policy.retries_per_class)
+        return await policy.run(task_func, *args)
+
+    async def _vt_get(self, path: str) -> bytes:
+        """GET a VT UI path from the best healthy end point of vt_end_points, hedged if enabled."""
+        impersonate, headers = random_vt_ua_headers()
+        token = current_relationship.set(vt_relationship(path))
+        try:
+            return await self._aget_end_point(self.vt_end_points, path, hedge=self.hedge_policy,
+                                              impersonate=impersonate, headers=headers)
+        finally:
+            current_relationship.reset(token)
+
+    async def _fan_out(self, fetchers, input_str, relationships=None) -> bool:
+        """Run the selected relationship fetchers of a report concurrently, each with retries.
+
+        Returns whether every fetcher finished; a 404 counts as finished (the relationship is empty).
+        """
+        selected = select_relationships(fetchers, relationships)
+        tasks = [self.run_task_with_retries(fetch, input_str) for fetch in selected.values()]
+        # 只有analyse排在第一位时，它的NotFound才说明对象不存在
+        fail_fast = primary_not_found if next(iter(selected), None) == 'analyse' else None
+        results = await gather_until_deadline(*tasks, fail_fast=fail_fast)
+        return not any(isinstance(r, BaseException) and not isinstance(r, NotFoundException) for r in results)
+
+    async def _domain_api(self, domain: str, relationships=None):
+        report = VTReport({'id': domain,
+                           'dtype': 'domain'
+                           })
 
         async def _analyse(dm) -> None:
-            url = f'{self.vt_end_point}ui/domains/{dm}'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/domains/{dm}')
             res_json = orjson.loads(res)
             # 获取分析结果，如果键不存在则返回一个空字典
             last_analysis_results = res_json.get("data", {}).get("attributes", {}).get("last_analysis_results", {})
@@ -92,15 +238,11 @@ class VT(Client):
             report['analyse'] = res_json
 
         async def _resolutions(dm) -> None:
-            url = f'{self.vt_end_point}ui/domains/{dm}/resolutions'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/domains/{dm}/resolutions')
             report['resolutions'] = orjson.loads(res)
 
         async def _referrer_files(dm) -> None:
-            url = f'{self.vt_end_point}ui/domains/{dm}/referrer_files'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/domains/{dm}/referrer_files')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -114,9 +256,7 @@ class VT(Client):
             report['referrer_files'] = res_json
 
         async def _communicating_files(dm) -> None:
-            url = f'{self.vt_end_point}ui/domains/{dm}/communicating_files'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/domains/{dm}/communicating_files')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -131,9 +271,7 @@ class VT(Client):
             report['communicating_files'] = res_json
 
         async def _subdomains(dm) -> None:
-            url = f'{self.vt_end_point}ui/domains/{dm}/subdomains?relationships=resolutions'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/domains/{dm}/subdomains?relationships=resolutions')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -146,9 +284,7 @@ class VT(Client):
             report['subdomains'] = res_json
 
         async def _siblings(dm) -> None:
-            url = f'{self.vt_end_point}ui/domains/{dm}/siblings?relationships=resolutions'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/domains/{dm}/siblings?relationships=resolutions')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -161,36 +297,32 @@ class VT(Client):
             report['siblings'] = res_json
 
         async def _comments(dm) -> None:
-            url = f'{self.vt_end_point}ui/domains/{dm}/comments?relationships=item%2Cauthor'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/domains/{dm}/comments?relationships=item%2Cauthor')
             res_json = orjson.loads(res)
             report['comments'] = res_json
 
-        tasks = [
-            self.run_task_with_retries(_analyse, domain),
-            self.run_task_with_retries(_resolutions, domain),
-            self.run_task_with_retries(_referrer_files, domain),
-            self.run_task_with_retries(_communicating_files, domain),
-            self.run_task_with_retries(_subdomains, domain),
-            self.run_task_with_retries(_siblings, domain),
-            self.run_task_with_retries(_comments, domain)
-        ]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        fetchers = {
+            'analyse': _analyse,
+            'resolutions': _resolutions,
+            'referrer_files': _referrer_files,
+            'communicating_files': _communicating_files,
+            'subdomains': _subdomains,
+            'siblings': _siblings,
+            'comments': _comments,
+        }
+        report.complete = await self._fan_out(fetchers, domain, relationships)
         return report
 
-    async def _ip_api(self, ip: str):
-        report = {'id': ip,
-                  'dtype': 'ip'
-                  }
+    async def _ip_api(self, ip: str, relationships=None):
+        report = VTReport({'id': ip,
+                           'dtype': 'ip'
+                           })
 
         async def _analyse(_ip) -> None:
-            url = f'{self.vt_end_point}ui/ip_addresses/{_ip}'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/ip_addresses/{_ip}')
             res_json = orjson.loads(res)
             # 获取分析结果，如果键不存在则返回一个空字典
-            print(res_json)
+            log_payload(f"VT ip analyse {_ip}", res_json)
             last_analysis_results = res_json.get("data", {}).get("attributes", {}).get("last_analysis_results", {})
             # 过滤结果
             filtered_results = {key: value for key, value in last_analysis_results.items() if
@@ -204,15 +336,11 @@ class VT(Client):
             report['analyse'] = res_json
 
         async def _resolutions(_ip) -> None:
-            url = f'{self.vt_end_point}ui/ip_addresses/{_ip}/resolutions'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/ip_addresses/{_ip}/resolutions')
             report['resolutions'] = orjson.loads(res)
 
         async def _referrer_files(_ip) -> None:
-            url = f'{self.vt_end_point}ui/ip_addresses/{_ip}/referrer_files'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/ip_addresses/{_ip}/referrer_files')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -227,9 +355,7 @@ class VT(Client):
             report['referrer_files'] = res_json
 
         async def _communicating_files(_ip) -> None:
-            url = f'{self.vt_end_point}ui/ip_addresses/{_ip}/communicating_files'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/ip_addresses/{_ip}/communicating_files')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -244,31 +370,27 @@ class VT(Client):
             report['communicating_files'] = res_json
 
         async def _comments(_ip) -> None:
-            url = f'{self.vt_end_point}ui/ip_addresses/{_ip}/comments?relationships=item%2Cauthor'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/ip_addresses/{_ip}/comments?relationships=item%2Cauthor')
             res_json = orjson.loads(res)
             report['comments'] = res_json
 
-        tasks = [
-            self.run_task_with_retries(_analyse, ip),
-            self.run_task_with_retries(_resolutions, ip),
-            self.run_task_with_retries(_referrer_files, ip),
-            self.run_task_with_retries(_communicating_files, ip),
-            self.run_task_with_retries(_comments, ip)
-        ]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        fetchers = {
+            'analyse': _analyse,
+            'resolutions': _resolutions,
+            'referrer_files': _referrer_files,
+            'communicating_files': _communicating_files,
+            'comments': _comments,
+        }
+        report.complete = await self._fan_out(fetchers, ip, relationships)
         return report
 
-    async def _file_api(self, file: str):
-        report = {'id': file,
-                  'dtype': 'files'
-                  }
+    async def _file_api(self, file: str, relationships=None):
+        report = VTReport({'id': file,
+                           'dtype': 'files'
+                           })
 
         async def _analyse(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}')
             res_json = orjson.loads(res)
             # 获取分析结果，如果键不存在则返回一个空字典
             last_analysis_results = res_json.get("data", {}).get("attributes", {}).get("last_analysis_results", {})
@@ -285,9 +407,7 @@ class VT(Client):
             report['analyse'] = res_json
 
         async def _contacted_urls(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/contacted_urls'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/contacted_urls')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -302,9 +422,7 @@ class VT(Client):
             report['contacted_urls'] = res_json
 
         async def _contacted_domains(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/contacted_domains'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/contacted_domains')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -319,9 +437,7 @@ class VT(Client):
             report['contacted_domains'] = res_json
 
         async def _contacted_ips(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/contacted_ips'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/contacted_ips')
             res_json = orjson.loads(res)
             for data in res_json.get("data", []):
                 # 确保 "attributes" 键存在，如果不存在，则跳过这个数据项
@@ -336,23 +452,17 @@ class VT(Client):
             report['contacted_ips'] = res_json
 
         async def _comments(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/comments?relationships=item%2Cauthor'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/comments?relationships=item%2Cauthor')
             res_json = orjson.loads(res)
             report['comments'] = res_json
 
         async def _behaviour(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/behaviour_mitre_trees'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/behaviour_mitre_trees')
             res_json = orjson.loads(res)
             report['behaviour'] = res_json
 
         async def _file_behaviour(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/behaviours?limit=40'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/behaviours?limit=40')
             res_json = orjson.loads(res)
             ip_traffic_list = []
             dns_lookups_list = []
@@ -370,64 +480,52 @@ class VT(Client):
             report['dns_lookups'] = dns_lookups_list
 
         async def _behaviour_mbc_trees(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/behaviours_mbc_trees'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/behaviours_mbc_trees')
             res_json = orjson.loads(res)
             report['behaviour_mbc_trees'] = res_json
 
         async def _execution_parents(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/execution_parents'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/execution_parents')
             res_json = orjson.loads(res)
             report['execution_parents'] = res_json
 
         async def _pe_resource_parents(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/pe_resource_parents'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/pe_resource_parents')
             res_json = orjson.loads(res)
             report['pe_resource_parents'] = res_json
 
         async def _bundled_files(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/bundled_files'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/bundled_files')
             res_json = orjson.loads(res)
             report['bundled_files'] = res_json
 
         async def _pe_resource_children(_file) -> None:
-            url = f'{self.vt_end_point}ui/files/{_file}/pe_resource_children'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/files/{_file}/pe_resource_children')
             res_json = orjson.loads(res)
             report['pe_resource_children'] = res_json
 
-        tasks = [
-            self.run_task_with_retries(_analyse, file),
-            self.run_task_with_retries(_contacted_urls, file),
-            self.run_task_with_retries(_contacted_domains, file),
-            self.run_task_with_retries(_contacted_ips, file),
-            self.run_task_with_retries(_comments, file),
-            self.run_task_with_retries(_behaviour, file),
-            self.run_task_with_retries(_file_behaviour, file),
-            self.run_task_with_retries(_behaviour_mbc_trees, file),
-            self.run_task_with_retries(_execution_parents, file),
-            self.run_task_with_retries(_pe_resource_parents, file),
-            self.run_task_with_retries(_bundled_files, file),
-            self.run_task_with_retries(_pe_resource_children, file),
-        ]
-
-        await asyncio.gather(*tasks, return_exceptions=True)
-        print(report.keys())
+        # file_behaviour 写入 report 的 ip_traffic 和 dns_lookups
+        fetchers = {
+            'analyse': _analyse,
+            'contacted_urls': _contacted_urls,
+            'contacted_domains': _contacted_domains,
+            'contacted_ips': _contacted_ips,
+            'comments': _comments,
+            'behaviour': _behaviour,
+            'file_behaviour': _file_behaviour,
+            'behaviour_mbc_trees': _behaviour_mbc_trees,
+            'execution_parents': _execution_parents,
+            'pe_resource_parents': _pe_resource_parents,
+            'bundled_files': _bundled_files,
+            'pe_resource_children': _pe_resource_children,
+        }
+        report.complete = await self._fan_out(fetchers, file, relationships)
+        logger.debug("VT file report %s: %s", file, list(report.keys()))
         return report
 
     async def _search_api(self, query: str):
         async def _search(_q):
-            url = f'{self.vt_end_point}ui/search?limit=20&relationships%5Bcomment%5D=author%2Citem&query={query}'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/search?limit=20&relationships%5Bcomment%5D=author%2Citem&query={query}')
             res_json = orjson.loads(res)
             return res_json.get("data", [])
         result = await self.run_task_with_retries(_search, query)
@@ -435,9 +533,7 @@ class VT(Client):
 
     async def _user_api(self, user: str):
         async def _get_user(_q):
-            url = f'{self.vt_end_point}ui/users/{_q}/comments?relationships=author%2Citem'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/users/{_q}/comments?relationships=author%2Citem')
             res_json = orjson.loads(res)
             return res_json.get("data", [])
 
@@ -446,65 +542,27 @@ class VT(Client):
 
     async def _comments_api(self):
         async def _get_comments():
-            url = f'{self.vt_end_point}ui/comments?relationships=author%2Citem&filter=tag%3A%22_%3Aweb%22&limit=5'
-            impersonate, headers = random_vt_ua_headers()
-            res = await self._aget_url("GET", url, impersonate=impersonate, headers=headers)
+            res = await self._vt_get(f'ui/comments?relationships=author%2Citem&filter=tag%3A%22_%3Aweb%22&limit=5')
             res_json = orjson.loads(res)
             return res_json.get("data", [])
 
         result = await self.run_task_with_retries(_get_comments, )
         return result
 
-    async def _cf_api(self, input_str: str, dtype=None, cursor=None):
-        apiEndpoints = {}
-        if is_ip_address(input_str):
-            apiEndpoints = {
-                "analyse": f"/ui/ip_addresses/{input_str}",
-                "resolutions": f"/ui/ip_addresses/{input_str}/resolutions",
-                "referrer_files": f"/ui/ip_addresses/{input_str}/referrer_files",
-                "communicating_files": f"/ui/ip_addresses/{input_str}/communicating_files",
-                "comments": f"/ui/ip_addresses/{input_str}/comments?relationships=item%2Cauthor",
-            }
-        elif is_domain(input_str):
-            apiEndpoints = {
-                "analyse": f"/ui/domains/{input_str}",
-                "resolutions": f"/ui/domains/{input_str}/resolutions",
-                "referrer_files": f"/ui/domains/{input_str}/referrer_files",
-                "communicating_files": f"/ui/domains/{input_str}/communicating_files",
-                "subdomains": f"/ui/domains/{input_str}/subdomains?relationships=resolutions",
-                "comments": f"/ui/domains/{input_str}/comments?relationships=item%2Cauthor",
-            }
-        else:
-            hash_type = identify_hash(input_str)
-            if hash_type in ('MD5', 'SHA-1'):
-                apiEndpoints = {
-                    "search_result": f"/ui/search?limit=20&relationships%5Bcomment%5D=author%2Citem&query={input_str}"
-                }
-            elif hash_type == 'SHA-256':
-                apiEndpoints = {
-                    "analyse": f"/ui/files/{input_str}",
-                    "contacted_urls": f"/ui/files/{input_str}/contacted_urls",
-                    "contacted_domains": f"/ui/files/{input_str}/contacted_domains",
-                    "contacted_ips": f"/ui/files/{input_str}/contacted_ips",
-                    "behaviour": f"/ui/files/{input_str}/behaviour_mitre_trees",
-                    "file_behaviour": f"/ui/files/{input_str}/behaviours?limit=40",
-                    "comments": f"/ui/files/{input_str}/comments?relationships=item%2Cauthor",
-                    "behaviour_mbc_trees": f"/ui/files/{input_str}/behaviours_mbc_trees",
-                    "execution_parents": f"/ui/files/{input_str}/execution_parents",
-                    "pe_resource_parents": f"/ui/files/{input_str}/pe_resource_parents",
-                    "bundled_files": f"/ui/files/{input_str}/bundled_files",
-                    "pe_resource_children": f"/ui/files/{input_str}/pe_resource_children",
-                }
+    async def _cf_api(self, input_str: str, dtype=None, cursor=None, relationships=None, page_size=None):
+        apiEndpoints = cf_api_endpoints(input_str)
 
         if dtype is None:
             payload = {
                 "q": input_str,
-                "apiEndpoints": apiEndpoints
+                "apiEndpoints": select_relationships(apiEndpoints, relationships)
             }
         else:
             apiEndpoint = apiEndpoints.get(dtype)
-            apiEndpoint = add_cursor_to_endpoints(apiEndpoint, cursor) if cursor is not None else apiEndpoint
-            print(apiEndpoint)
+            params = {"cursor": cursor, "limit": page_size}
+            params = {k: v for k, v in params.items() if v is not None}
+            apiEndpoint = add_query_to_endpoint(apiEndpoint, **params) if params else apiEndpoint
+            logger.debug("VT cf_api %s %s", dtype, apiEndpoint)
             payload = {
                 "q": input_str,
                 "apiEndpoints": {
@@ -513,25 +571,137 @@ class VT(Client):
         }
 
         impersonate, headers = random_vt_ua_headers()
-        res= await self._aget_url("POST", self.cf_end_point, impersonate=impersonate, headers=headers,
-                                  data=orjson.dumps(payload))
-        if isinstance(res, bytes):
-            res = res.decode("utf-8", errors="replace")  # 替换错误字符
-            print(res)
-        res_json = orjson.loads(res)
-        return res_json
+        token = current_relationship.set(dtype or 'report')
+        try:
+            res= await self._aget_url("POST", self.cf_end_point, impersonate=impersonate, headers=headers,
+                                      data=orjson.dumps(payload), coalesce=True)
+        finally:
+            current_relationship.reset(token)
+        # 直接从bytes解析，不先解码成str；只有含非法UTF-8时才替换错误字符后重新解析
+        log_payload(f"VT cf_api {input_str}", res)
+        try:
+            return orjson.loads(res)
+        except orjson.JSONDecodeError:
+            if not isinstance(res, bytes):
+                raise
+            return orjson.loads(res.decode("utf-8", errors="replace"))
+
+
+def cf_api_endpoints(input_str):
+    """UI paths the CF worker fetches for an IOC, keyed by relationship name; empty for unsupported input."""
+    if is_ip_address(input_str):
+        return {
+            "analyse": f"/ui/ip_addresses/{input_str}",
+            "resolutions": f"/ui/ip_addresses/{input_str}/resolutions",
+            "referrer_files": f"/ui/ip_addresses/{input_str}/referrer_files",
+            "communicating_files": f"/ui/ip_addresses/{input_str}/communicating_files",
+            "comments": f"/ui/ip_addresses/{input_str}/comments?relationships=item%2Cauthor",
+        }
+    elif is_domain(input_str):
+        return {
+            "analyse": f"/ui/domains/{input_str}",
+            "resolutions": f"/ui/domains/{input_str}/resolutions",
+            "referrer_files": f"/ui/domains/{input_str}/referrer_files",
+            "communicating_files": f"/ui/domains/{input_str}/communicating_files",
+            "subdomains": f"/ui/domains/{input_str}/subdomains?relationships=resolutions",
+            "comments": f"/ui/domains/{input_str}/comments?relationships=item%2Cauthor",
+        }
+    else:
+        hash_type = identify_hash(input_str)
+        if hash_type in ('MD5', 'SHA-1'):
+            return {
+                "search_result": f"/ui/search?limit=20&relationships%5Bcomment%5D=author%2Citem&query={input_str}"
+            }
+        elif hash_type == 'SHA-256':
+            return {
+                "analyse": f"/ui/files/{input_str}",
+                "contacted_urls": f"/ui/files/{input_str}/contacted_urls",
+                "contacted_domains": f"/ui/files/{input_str}/contacted_domains",
+                "contacted_ips": f"/ui/files/{input_str}/contacted_ips",
+                "behaviour": f"/ui/files/{input_str}/behaviour_mitre_trees",
+                "file_behaviour": f"/ui/files/{input_str}/behaviours?limit=40",
+                "comments": f"/ui/files/{input_str}/comments?relationships=item%2Cauthor",
+                "behaviour_mbc_trees": f"/ui/files/{input_str}/behaviours_mbc_trees",
+                "execution_parents": f"/ui/files/{input_str}/execution_parents",
+                "pe_resource_parents": f"/ui/files/{input_str}/pe_resource_parents",
+                "bundled_files": f"/ui/files/{input_str}/bundled_files",
+                "pe_resource_children": f"/ui/files/{input_str}/pe_resource_children",
+            }
+    return {}
+
+
+def normalize_ioc(input_str):
+    """Canonical form of an IOC: trimmed, hashes and domains lower-cased, IPs in standard notation."""
+    input_str = input_str.strip()
+    if input_str == "comments" or input_str.startswith('user/'):
+        return input_str
+    if identify_hash(input_str):
+        return input_str.lower()
+    if is_ip_address(input_str):
+        return str(ipaddress.ip_address(input_str))
+    if is_domain(input_str):
+        return input_str.lower().rstrip('.')
+    return input_str
+
+
+def _non_blank(iocs):
+    return (ioc for ioc in iocs if ioc and ioc.strip())
+
+
+def relationship_key(relationships):
+    """Normalise a relationship selection ("a,b", an iterable or None) to a sorted tuple, or None for all."""
+    if relationships is None:
+        return None
+    if isinstance(relationships, str):
+        relationships = relationships.split(',')
+    return tuple(sorted({r.strip() for r in relationships if r and r.strip()}))
+
+
+def select_relationships(available, relationships=None):
+    """Keep the entries of `available` named in `relationships`; names that do not apply to this IOC type are ignored."""
+    if relationships is None:
+        return available
+    wanted = set(relationship_key(relationships))
+    return {name: value for name, value in available.items() if name in wanted}
 
 
 def add_cursor_to_endpoints(url, cursor):
+    return add_query_to_endpoint(url, cursor=cursor)
+
+
+def add_query_to_endpoint(url, **params):
+    """Set query parameters on a UI path, keeping the existing ones (decoded and re-encoded once)."""
     parsed_url = urlparse(url)
-    query_dict = dict()
-    if parsed_url.query:
-        query_dict = dict(q.split('=') for q in parsed_url.query.split('&'))
-    query_dict['cursor'] = cursor
+    query_dict = dict(parse_qsl(parsed_url.query, keep_blank_values=True))
+    query_dict.update({k: str(v) for k, v in params.items()})
     new_query = urlencode(query_dict)
     return urlunparse(parsed_url._replace(query=new_query))
 
 
+def relationship_page(res, what):
+    """One page of a relationship from the CF worker, raising the error the worker reported instead of data."""
+    if "error" in res and "data" not in res:
+        if res.get("status") == 404:
+            raise NotFoundException(f"{what}: {res['error']}")
+        raise ClientSearchException(f"{what}: {res['error']}")
+    return res
+
+
+def primary_not_found(index, ex):
+    """Fan-out fail-fast rule: the object itself (task 0, analyse) does not exist, so its relationships cannot either."""
+    return index == 0 and isinstance(ex, NotFoundException)
+
+
+def vt_relationship(path):
+    """Metrics label of a VT UI path: ui/files/<id>/contacted_urls -> contacted_urls, ui/files/<id> -> analyse."""
+    parts = path.split('?', 1)[0].strip('/').split('/')
+    if len(parts) >= 4:
+        return parts[3]
+    if len(parts) == 3:
+        return 'analyse'
+    return parts[-1]
+
+
 def is_ip_address(input_str):
     try:
         ipaddress.ip_address(input_str)
@@ -566,15 +736,13 @@ def categorize_input(input_str):
 
 
 def random_vt_ua_headers():
-    impersonate, ua_headers = random_impersonate()
+    profile = fingerprint_pool.acquire()
+    ua_headers = profile.headers()
     ua_headers["X-VT-Anti-Abuse-Header"] = get_vt_anti()
     ua_headers["X-App-Version"] = 'v1x282x3'
     ua_headers["X-Tool"] = 'vt-ui-main'
-    fake_ip = generate_random_public_ip()
-    ua_headers["X-Forwarded-For"] = fake_ip
-    ua_headers["X-Real-IP"] = fake_ip
     ua_headers["X-Forwarded-Host"] = "www.virustotal.com"
-    return impersonate, ua_headers
+    return profile.impersonate, ua_headers
 
 
 def get_vt_anti():
@@ -599,5 +767,5 @@ def get_vt_anti():
 
 # 调用函数并打印结果
 # print(get_vt_anti())
-print(categorize_input('baidu.com'))
-print(add_cursor_to_endpoints("/sdsd/dsds?x=1", "dsdsdu=="))
+# print(categorize_input('baidu.com'))
+# print(add_cursor_to_endpoints("/sdsd/dsds?x=1", "dsdsdu=="))
@@ -0,0 +1,458 @@
+import asyncio
+import glob
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager, suppress
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import orjson
+
+from .cache import CACHE_DEFAULT_TTL, CACHE_EVENTS, CACHE_MAX_BYTES, CACHE_SWEEP_INTERVAL, CACHE_TTLS
+
+try:
+    import fcntl
+except ImportError:  # Windows：只在进程内互斥，不要让多个进程写同一个目录
+    fcntl = None
+
+logger = logging.getLogger("engines.segment_store")
+
+SEGMENT_DIR = os.getenv("ENGINES_SEGMENT_DIR", "./cache/segments")
+# 单个段文件写满后换新段；已封存的段中有效数据低于这个比例时压缩
+SEGMENT_MAX_BYTES = int(os.getenv("ENGINES_SEGMENT_MAX_BYTES", str(64 * 1024 ** 2)))
+SEGMENT_COMPACT_RATIO = float(os.getenv("ENGINES_SEGMENT_COMPACT_RATIO", "0.5"))
+
+# 索引文件：64字节头 + 开放寻址的槽位数组，每个槽位 (key哈希, 段号, 偏移, 记录长度)
+_INDEX_MAGIC = b"VTIDX001"
+_INDEX_HEADER = struct.Struct("<8sQQQ")  # magic, capacity, used slots, retired
+_INDEX_HEADER_SIZE = 64
+_SLOT = struct.Struct("<QIQI")
+_INITIAL_CAPACITY = 1 << 16
+_MAX_LOAD = 0.7
+_TOMBSTONE = 0xFFFFFFFF
+# 段内记录：crc32, 写入时间, key长度, value长度, key, value（gzip压缩的JSON）
+_RECORD = struct.Struct("<IdHI")
+
+
+def _key_hash(key: bytes) -> int:
+    # 0 表示空槽位
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+class SegmentStore:
+    """Append-only segment files with a memory-mapped hash index, shared by every worker process.
+
+    Values (gzip-compressed JSON, as in FileCache) are appended to the active segment and the
+    index slot of the key is pointed at the new record, so a lookup is one probe of the mmap'd
+    index plus one contiguous read. Any number of processes read concurrently without locks;
+    writes are serialised across processes by an flock on <directory>/write.lock. Records carry
+    a CRC, so a reader that races a slot update simply retries.
+
+    Sealed segments whose live data drops below SEGMENT_COMPACT_RATIO are compacted in the
+    background (live records are copied forward, expired ones dropped), and the oldest segments
+    are dropped while the store exceeds max_bytes. TTLs work as in FileCache, measured from the
+    write time stored in each record. Implements the disk-tier interface of TieredCache.
+    """
+
+    def __init__(
+        self,
+        directory: str = SEGMENT_DIR,
+        kind_of: Optional[Callable[[str], str]] = None,
+        ttls: Mapping[str, float] = CACHE_TTLS,
+        default_ttl: float = CACHE_DEFAULT_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+        segment_bytes: int = SEGMENT_MAX_BYTES,
+        name: str = "segments",
+    ) -> None:
+        self.directory = directory
+        self.kind_of = kind_of
+        self.ttls = dict(ttls)
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, "index.bin")
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._index_file = None
+        self._index: Optional[mmap.mmap] = None
+        self._capacity = 0
+        self._fds: Dict[int, int] = {}
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_pid: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.writes = 0
+        self.evictions = 0
+        self.compactions = 0
+        self.errors = 0
+        with self._locked():
+            if not os.path.exists(self._index_path):
+                self._create_index(self._index_path, _INITIAL_CAPACITY)
+        self._open_index()
+
+    # ---- 索引 ----
+
+    @staticmethod
+    def _create_index(path: str, capacity: int) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(_INDEX_HEADER_SIZE + capacity * _SLOT.size)
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, capacity, 0, 0))
+        os.replace(tmp, path)
+
+    def _open_index(self) -> None:
+        with self._lock:
+            if self._index is not None and not self._retired():
+                return
+            f = open(self._index_path, "r+b")
+            index = mmap.mmap(f.fileno(), 0)
+            magic, capacity, _, _ = _INDEX_HEADER.unpack_from(index, 0)
+            if magic != _INDEX_MAGIC:
+                raise ValueError(f"{self._index_path} is not a segment store index")
+            # 旧的映射不关闭：其他线程可能正在读它，交给垃圾回收
+            self._index_file, self._index, self._capacity = f, index, capacity
+
+    def _retired(self) -> bool:
+        return _INDEX_HEADER.unpack_from(self._index, 0)[3] != 0
+
+    def _check_index(self) -> mmap.mmap:
+        if self._index is None or self._retired():
+            self._open_index()
+        return self._index
+
+    @staticmethod
+    def _slots(h: int, index: mmap.mmap) -> Iterator[Tuple[int, int, int, int, int]]:
+        """Probe sequence of hash `h`: (slot, hash, segment, offset, length) until an empty slot."""
+        capacity = _INDEX_HEADER.unpack_from(index, 0)[1]
+        slot = h % capacity
+        for _ in range(capacity):
+            slot_h, seq, offset, length = _SLOT.unpack_from(index, _INDEX_HEADER_SIZE + slot * _SLOT.size)
+            if slot_h == 0:
+                return
+            yield slot, slot_h, seq, offset, length
+            slot = (slot + 1) % capacity
+
+    # ---- 读取 ----
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"seg-{seq:08d}.dat")
+
+    def _segments(self) -> List[int]:
+        return sorted(int(os.path.basename(p)[4:12]) for p in glob.glob(os.path.join(self.directory, "seg-*.dat")))
+
+    def _read_at(self, seq: int, offset: int, length: int) -> bytes:
+        if not hasattr(os, "pread"):
+            with open(self._segment_path(seq), "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+        fd = self._fds.get(seq)
+        if fd is None:
+            fd = os.open(self._segment_path(seq), os.O_RDONLY)
+            with self._lock:
+                if seq in self._fds:
+                    os.close(fd)
+                    fd = self._fds[seq]
+                else:
+                    self._fds[seq] = fd
+        return os.pread(fd, length, offset)
+
+    @staticmethod
+    def _parse(record: bytes) -> Optional[Tuple[float, bytes, bytes]]:
+        """(written_at, key, value) of a record, or None if it is torn or corrupt."""
+        if len(record) < _RECORD.size:
+            return None
+        crc, written_at, key_len, value_len = _RECORD.unpack_from(record, 0)
+        if len(record) != _RECORD.size + key_len + value_len or zlib.crc32(record[4:]) != crc:
+            return None
+        key_end = _RECORD.size + key_len
+        return written_at, record[_RECORD.size:key_end], record[key_end:]
+
+    def _lookup(self, key: bytes) -> Optional[Tuple[float, bytes]]:
+        h = _key_hash(key)
+        # 与写入方竞争时槽位或段文件可能正在变化，记录校验失败就重新探测
+        for _ in range(3):
+            index = self._check_index()
+            try:
+                for _, slot_h, seq, offset, length in self._slots(h, index):
+                    if slot_h != h or seq == _TOMBSTONE:
+                        continue
+                    parsed = self._parse(self._read_at(seq, offset, length))
+                    if parsed is None:
+                        raise _Torn()
+                    written_at, record_key, value = parsed
+                    if record_key == key:
+                        return written_at, value
+                return None
+            except (_Torn, OSError):
+                self._close_fds()
+                continue
+        self._count("errors")
+        return None
+
+    def ttl(self, key: str) -> float:
+        if self.kind_of is None:
+            return self.default_ttl
+        try:
+            kind = self.kind_of(key)
+        except Exception:
+            return self.default_ttl
+        return self.ttls.get(kind, self.default_ttl)
+
+    def _count(self, event: str) -> None:
+        with self._lock:
+            setattr(self, event, getattr(self, event) + 1)
+        CACHE_EVENTS.inc(self.name, event)
+
+    def get_raw_sync(self, key: str) -> Optional[bytes]:
+        """The stored gzip bytes of `key`, or None when missing or expired."""
+        found = self._lookup(key.encode())
+        if found is None:
+            self._count("misses")
+            return None
+        written_at, value = found
+        ttl = self.ttl(key)
+        if ttl and time.time() - written_at > ttl:
+            self._count("expired")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return value
+
+    def load_sync(self, key: str) -> Tuple[Optional[Any], int]:
+        raw = self.get_raw_sync(key)
+        if raw is None:
+            return None, 0
+        data = gzip.decompress(raw)
+        return orjson.loads(data), len(data)
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        return self.load_sync(key)[0]
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get_sync, key)
+
+    # ---- 写入 ----
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive writer lock, across threads and (with fcntl) processes."""
+        with self._write_lock, open(os.path.join(self.directory, "write.lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def set_sync(self, key: str, value: Any) -> int:
+        data = orjson.dumps(value)
+        self.put_raw(key, gzip.compress(data))
+        return len(data)
+
+    async def set(self, key: str, value: Any) -> int:
+        return await asyncio.to_thread(self.set_sync, key, value)
+
+    def put_raw(self, key: str, raw: bytes, written_at: Optional[float] = None) -> None:
+        """Store already gzip-compressed JSON bytes under `key`."""
+        with self._locked():
+            self._check_index()
+            seq, offset, length = self._append(key.encode(), raw, written_at or time.time())
+            self._publish(key.encode(), seq, offset, length)
+        self._count("writes")
+
+    def _append(self, key: bytes, value: bytes, written_at: float) -> Tuple[int, int, int]:
+        """Append a record to the active segment. Caller holds the writer lock."""
+        segments = self._segments()
+        seq = segments[-1] if segments else 1
+        path = self._segment_path(seq)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+            seq += 1
+            path = self._segment_path(seq)
+        body = struct.pack("<dHI", written_at, len(key), len(value)) + key + value
+        record = struct.pack("<I", zlib.crc32(body)) + body
+        with open(path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(record)
+        return seq, offset, len(record)
+
+    def _publish(self, key: bytes, seq: int, offset: int, length: int) -> None:
+        """Point the index slot of `key` at a record. Caller holds the writer lock."""
+        h = _key_hash(key)
+        index, capacity = self._index, self._capacity
+        free = None
+        for slot, slot_h, old_seq, old_offset, old_length in self._slots(h, index):
+            if slot_h != h:
+                continue
+            if old_seq == _TOMBSTONE:
+                free = slot if free is None else free
+                continue
+            parsed = self._parse(self._read_at(old_seq, old_offset, old_length))
+            if parsed is None or parsed[1] == key:
+                self._write_slot(slot, h, seq, offset, length)
+                return
+        if free is not None:
+            self._write_slot(free, h, seq, offset, length)
+            return
+        slot = h % capacity
+        while _SLOT.unpack_from(index, _INDEX_HEADER_SIZE + slot * _SLOT.size)[0] != 0:
+            slot = (slot + 1) % capacity
+        # 先写位置，最后写哈希，读者看到哈希时位置已经就绪
+        struct.pack_into("<IQI", index, _INDEX_HEADER_SIZE + slot * _SLOT.size + 8, seq, offset, length)
+        struct.pack_into("<Q", index, _INDEX_HEADER_SIZE + slot * _SLOT.size, h)
+        used = _INDEX_HEADER.unpack_from(index, 0)[2] + 1
+        struct.pack_into("<Q", index, 16, used)
+        if used > capacity * _MAX_LOAD:
+            self._grow()
+
+    def _write_slot(self, slot: int, h: int, seq: int, offset: int, length: int) -> None:
+        _SLOT.pack_into(self._index, _INDEX_HEADER_SIZE + slot * _SLOT.size, h, seq, offset, length)
+
+    def _live_slots(self) -> Iterator[Tuple[int, int, int, int, int]]:
+        index = self._index
+        for slot in range(self._capacity):
+            slot_h, seq, offset, length = _SLOT.unpack_from(index, _INDEX_HEADER_SIZE + slot * _SLOT.size)
+            if slot_h and seq != _TOMBSTONE:
+                yield slot, slot_h, seq, offset, length
+
+    def _grow(self) -> None:
+        """Rebuild the index at twice the capacity (dropping tombstones) and retire the old one."""
+        live = list(self._live_slots())
+        capacity = self._capacity
+        while len(live) > capacity * _MAX_LOAD / 2:
+            capacity *= 2
+        tmp = f"{self._index_path}.{os.getpid()}.grow"
+        with open(tmp, "w+b") as f:
+            f.truncate(_INDEX_HEADER_SIZE + capacity * _SLOT.size)
+            index = mmap.mmap(f.fileno(), 0)
+            _INDEX_HEADER.pack_into(index, 0, _INDEX_MAGIC, capacity, len(live), 0)
+            for _, h, seq, offset, length in live:
+                slot = h % capacity
+                while _SLOT.unpack_from(index, _INDEX_HEADER_SIZE + slot * _SLOT.size)[0] != 0:
+                    slot = (slot + 1) % capacity
+                _SLOT.pack_into(index, _INDEX_HEADER_SIZE + slot * _SLOT.size, h, seq, offset, length)
+            index.flush()
+            index.close()
+        os.replace(tmp, self._index_path)
+        # 通知其他进程重新映射新索引
+        struct.pack_into("<Q", self._index, 24, 1)
+        self._open_index()
+        logger.info(f"Segment store index of {self.directory} grown to {capacity} slots")
+
+    def delete(self, key: str) -> None:
+        key_bytes = key.encode()
+        h = _key_hash(key_bytes)
+        with self._locked():
+            self._check_index()
+            for slot, slot_h, seq, offset, length in self._slots(h, self._index):
+                if slot_h != h or seq == _TOMBSTONE:
+                    continue
+                parsed = self._parse(self._read_at(seq, offset, length))
+                if parsed is not None and parsed[1] == key_bytes:
+                    self._write_slot(slot, h, _TOMBSTONE, 0, 0)
+                    return
+
+    # ---- 压缩与淘汰 ----
+
+    def start(self, interval: float = CACHE_SWEEP_INTERVAL) -> None:
+        """Start the background compactor of this process (safe to call again after fork)."""
+        if self._sweeper is not None and self._sweeper_pid == os.getpid():
+            return
+        self._sweeper_pid = os.getpid()
+        self._fds = {}
+        self._sweeper = threading.Thread(target=self._sweep_loop, args=(interval,),
+                                         name=f"engines-cache-{self.name}", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.compact()
+            except Exception as ex:
+                logger.warning(f"Compaction of {self.directory} failed: {type(ex).__name__}: {ex}")
+
+    def compact(self) -> Dict[str, int]:
+        """Drop the oldest segments while over max_bytes, then rewrite sparse sealed segments."""
+        with self._locked():
+            self._check_index()
+            segments = self._segments()
+            sizes = {seq: os.path.getsize(self._segment_path(seq)) for seq in segments}
+            slots_of: Dict[int, List[Tuple[int, int, int, int, int]]] = {seq: [] for seq in segments}
+            for entry in self._live_slots():
+                slots_of.setdefault(entry[2], []).append(entry)
+            sealed = segments[:-1]
+            evicted = dropped = rewritten = 0
+            total = sum(sizes.values())
+            # 超出容量：整段丢弃最旧的段
+            while total > self.max_bytes and sealed:
+                seq = sealed.pop(0)
+                for slot, h, *_ in slots_of.pop(seq, []):
+                    self._write_slot(slot, h, _TOMBSTONE, 0, 0)
+                    evicted += 1
+                total -= sizes[seq]
+                self._remove_segment(seq)
+            now = time.time()
+            for seq in sealed:
+                live = slots_of.get(seq, [])
+                if sum(entry[4] for entry in live) >= sizes[seq] * SEGMENT_COMPACT_RATIO:
+                    continue
+                for slot, h, _, offset, length in live:
+                    parsed = self._parse(self._read_at(seq, offset, length))
+                    if parsed is None:
+                        self._write_slot(slot, h, _TOMBSTONE, 0, 0)
+                        continue
+                    written_at, key, value = parsed
+                    ttl = self.ttl(key.decode())
+                    if ttl and now - written_at > ttl:
+                        self._write_slot(slot, h, _TOMBSTONE, 0, 0)
+                        dropped += 1
+                        continue
+                    new_seq, new_offset, new_length = self._append(key, value, written_at)
+                    self._write_slot(slot, h, new_seq, new_offset, new_length)
+                    rewritten += 1
+                self._remove_segment(seq)
+                self.compactions += 1
+                CACHE_EVENTS.inc(self.name, "compactions")
+        with self._lock:
+            self.evictions += evicted
+            self.expired += dropped
+        CACHE_EVENTS.inc(self.name, "evictions", amount=evicted)
+        CACHE_EVENTS.inc(self.name, "expired", amount=dropped)
+        if evicted or dropped or rewritten:
+            logger.info(f"Compacted {self.directory}: {evicted} evicted, {dropped} expired, {rewritten} moved")
+        return {"evicted": evicted, "expired": dropped, "moved": rewritten}
+
+    def _remove_segment(self, seq: int) -> None:
+        # 其他进程已打开的文件描述符仍可读，新的查找已指向别处
+        with suppress(FileNotFoundError):
+            os.remove(self._segment_path(seq))
+        with self._lock:
+            fd = self._fds.pop(seq, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _close_fds(self) -> None:
+        with self._lock:
+            fds, self._fds = self._fds, {}
+        for fd in fds.values():
+            with suppress(OSError):
+                os.close(fd)
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self._segments()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "expired": self.expired, "writes": self.writes,
+                    "evictions": self.evictions, "compactions": self.compactions, "errors": self.errors,
+                    "segments": len(segments), "index_slots": self._capacity,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else None}
+
+
+class _Torn(Exception):
+    """A record read while its slot was being rewritten."""
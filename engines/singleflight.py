@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from .deadline import current_deadline, remaining, wait_within_deadline
+from .exceptions import DeadlineExceededException
+
+T = TypeVar("T")
+
+
+class _LeaderCancelled(Exception):
+    """The caller running a shared call was cancelled; followers elect a new leader."""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the call, every caller that arrives while it is in flight
+    awaits the same result (or exception). Works across event loops and threads, so callers on
+    different loops of the sync bridge share one upstream request too.
+
+    Set partial_results=True when `func` may return a partial result under a deadline instead
+    of raising (e.g. a report fan-out): calls made under a deadline then run on their own, so
+    a caller with a tight deadline never hands a truncated result to the others.
+    """
+
+    def __init__(self, partial_results: bool = False) -> None:
+        self.partial_results = partial_results
+        self._calls: Dict[Hashable, "Future[Any]"] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.bypassed = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """Run `func`, or share the result of an identical call already in flight.
+
+        A follower whose leader failed only because of the leader's tighter deadline runs the
+        call again. Partial results are not shared: with partial_results=True, calls under a
+        deadline are never coalesced.
+        """
+        if self.partial_results and current_deadline.get() is not None:
+            with self._lock:
+                self.bypassed += 1
+            return await func()
+        while True:
+            with self._lock:
+                fut = self._calls.get(key)
+                leader = fut is None
+                if leader:
+                    fut = self._calls[key] = Future()
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+            if not leader:
+                try:
+                    # shield: a cancelled follower must not cancel the shared future
+                    return await wait_within_deadline(asyncio.shield(asyncio.wrap_future(fut)))
+                except _LeaderCancelled:
+                    continue
+                except DeadlineExceededException:
+                    # 失败的是leader更紧的截止时间，自己还有时间就重新发起
+                    left = remaining()
+                    if left is None or left > 0:
+                        continue
+                    raise
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                self._finish(key, fut, exc=_LeaderCancelled())
+                raise
+            except BaseException as ex:
+                self._finish(key, fut, exc=ex)
+                raise
+            self._finish(key, fut, result=result)
+            return result
+
+    def _finish(self, key: Hashable, fut: "Future[Any]", result: Any = None, exc: BaseException = None) -> None:
+        with self._lock:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "followers": self.followers,
+                "bypassed": self.bypassed}
+
+
+def freeze(obj: Any) -> Hashable:
+    """Turn request params/bodies into a hashable single-flight key component."""
+    if isinstance(obj, dict):
+        return tuple(sorted((str(k), freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    if isinstance(obj, bytearray):
+        return bytes(obj)
+    return obj
@@ -1,25 +1,133 @@
 from fastapi import FastAPI, HTTPException, Response, APIRouter, Depends,  Request, status
+from fastapi.responses import JSONResponse
 import gzip
 import json
 import orjson
-from engines import BING, GITHUB, VT, URLRead, DDGS_V2 as DDGS
+from engines import BING, GITHUB, VT, URLRead, DDGS_V2 as DDGS, session_pool
+from engines.search.vt import VTReport, categorize_input, cf_api_endpoints, relationship_key
+from engines.cache import DerivedView, FileCache, MemoryCache, TieredCache
+from engines.segment_store import SegmentStore
 from typing import Optional
+import asyncio
 import os
 import random
 import logging
 import re
-from engines.utils import write_json_gzip_async, load_json_gzip_async
+from engines.singleflight import SingleFlight
+from engines.metrics import ROUTE_SECONDS, registry as metrics_registry
+from engines.log import setup_logging
+from engines.deadline import current_deadline, deadline
 import ipaddress
 import tldextract
 import hashlib
+import time
 
 DEFAULT_API_KEY = os.getenv("DEFAULT_API_KEY", None)
 DEFAULT_CF_END_POINT = os.getenv("DEFAULT_CF_END_POINT", 'https://vt.451964719.xyz/')
+# 各接口实际用到的VT关系，只回源这些
+FILE_VT_RELATIONSHIPS = ("analyse", "behaviour", "file_behaviour")
+TIP_FILE_INFO_RELATIONSHIPS = ("analyse", "contacted_domains", "contacted_ips", "contacted_urls")
+# 启动时预热：解析DNS、建立到各上游的TLS连接并加载公共后缀列表，避免重启后的首个请求变慢
+WARMUP = os.getenv("ENGINES_WARMUP", "0") == "1"
+WARMUP_URLS = [u for u in os.getenv("ENGINES_WARMUP_URLS", "").split(",") if u.strip()]
 app = FastAPI()
+# engines 的日志经队列由后台线程输出，不阻塞请求处理
+setup_logging()
+logger = logging.getLogger("engines.main")
+# 缓存未命中时，相同IOC的并发请求只回源一次；带截止时间的请求单独执行，不把截断的报告分给别人
+cache_flights = SingleFlight(partial_results=True)
+# /search/vt/ 压缩好的响应体在进程内保留的秒数，期间重复查询直接返回，不再序列化、压缩；设为0关闭
+SEARCH_VT_CACHE_TTL = float(os.getenv("ENGINES_SEARCH_VT_CACHE_TTL", "600"))
+search_vt_bodies = MemoryCache(ttl=SEARCH_VT_CACHE_TTL, name="search_vt_memory")
 
 
-def gzip_compress(data: bytes) -> bytes:
-    return gzip.compress(data)
+def cache_kind(key: str) -> str:
+    # 派生视图的键为 "<ioc>#<视图>@v<版本>"，有效期跟随IOC类型
+    return categorize_input(key.split('#', 1)[0])
+
+
+# VT报告的磁盘缓存：按哈希前缀分目录，文件报告和域名/IP报告有不同的有效期；
+# ENGINES_CACHE_BACKEND=segments 改用各worker共享的段文件存储（先用 tasks/migrate_cache_to_segments.py 迁移）。
+# 前面一层进程内缓存保存解码后的热点报告，命中时不读盘、不解压
+if os.getenv('ENGINES_CACHE_BACKEND', 'files') == 'segments':
+    report_store = SegmentStore(kind_of=cache_kind)
+else:
+    report_store = FileCache(os.getenv('CACHE_DIR', './cache'), kind_of=cache_kind)
+report_cache = TieredCache(MemoryCache(name="reports_memory"), report_store)
+
+
+@app.on_event("startup")
+async def start_metrics():
+    # 每个gunicorn worker定期写出自己的指标快照，供 /metrics 汇总
+    metrics_registry.start()
+
+
+@app.on_event("startup")
+async def start_cache_sweeper():
+    # 后台按有效期和容量上限清理缓存目录，多个worker之间同一时刻只有一个在清理
+    report_cache.start()
+
+
+@app.on_event("startup")
+async def warm_up():
+    if not WARMUP:
+        return
+    start = time.monotonic()
+    proxy_url = os.getenv('PROXY_URL', None)
+    # 会话按事件循环缓存，这里建立的连接正是之后各路由在同一循环上复用的连接
+    async with VT(proxies=proxy_url, cf_end_point=DEFAULT_CF_END_POINT) as vt:
+        urls = WARMUP_URLS or [*vt.vt_end_points.urls, vt.cf_end_point, "https://ddgs.catflix.cn/",
+                               "https://ddgslink.catflix.cn/", "https://www.bing.com/", "https://github.com/"]
+        _, results = await asyncio.gather(asyncio.to_thread(tldextract.extract, "www.virustotal.com"),
+                                          vt.warm_up(urls))
+    failed = sum(not isinstance(result, int) for result in results.values())
+    logger.info(f"Warm-up finished in {time.monotonic() - start:.2f}s, {len(results) - failed}/{len(results)} probes ok")
+
+
+@app.middleware("http")
+async def record_route_metrics(request: Request, call_next):
+    start = time.monotonic()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        ROUTE_SECONDS.observe(time.monotonic() - start, getattr(route, "path", "unmatched"), request.method,
+                              str(status_code))
+
+
+@app.middleware("http")
+async def apply_deadline(request: Request, call_next):
+    # 调用方可通过 X-Deadline-Ms 头或 deadline_ms 参数给出总耗时上限，超时的子请求被取消并返回部分结果
+    value = request.headers.get("X-Deadline-Ms") or request.query_params.get("deadline_ms")
+    if not value:
+        return await call_next(request)
+    try:
+        seconds = float(value) / 1000
+    except ValueError:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content={"detail": f"Invalid deadline: {value}"})
+    with deadline(seconds):
+        return await call_next(request)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics summed over every worker process."""
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("shutdown")
+async def close_sessions():
+    # 关闭当前事件循环上复用的curl_cffi会话
+    await session_pool.aclose()
+
+
+def gzip_json(obj) -> bytes:
+    # 压缩级别6：比默认的9快得多，大报告的压缩率几乎一样
+    return gzip.compress(orjson.dumps(obj), compresslevel=6)
 
 
 # 定义API Key验证逻辑
@@ -43,8 +151,8 @@ auth_router = APIRouter(dependencies=[Depends(verify_api_key)])
 async def search_bing(q: str, l: Optional[str] = 'cn-zh', m: Optional[int] = 10):
     proxy_url = os.getenv('PROXY_URL', None)  # 默认值是你原来硬编码的代理路径
     try:
-        with BING(proxies=proxy_url) as bing:
-            res = bing.text(keywords=q)
+        async with BING(proxies=proxy_url) as bing:
+            res = await bing.atext(keywords=q)
             return res
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -54,11 +162,11 @@ async def search_bing(q: str, l: Optional[str] = 'cn-zh', m: Optional[int] = 10)
 async def search_ddgs(q: str, l: Optional[str] = 'cn-zh', m: Optional[int] = 10):
     proxy_url = os.getenv('PROXY_URL', None)  # 默认值是你原来硬编码的代理路径
     try:
-        with DDGS(proxies=proxy_url,
+        async with DDGS(proxies=proxy_url,
                   ddgs_end_point='https://ddgs.catflix.cn',
                   ddgslink_end_point='https://ddgslink.catflix.cn',
                     timeout=20) as ddgs:
-            res = ddgs.text(q, max_results=m , region=l,)
+            res = await ddgs.atext(q, max_results=m , region=l,)
             return res
     except Exception as e:
         raise HTTPException(
@@ -71,9 +179,9 @@ async def search_ddgs(q: str, l: Optional[str] = 'cn-zh', m: Optional[int] = 10)
 async def search_github(q: str, l: Optional[str] = 'cn-zh', m: Optional[int] = 10):
     proxy_url = os.getenv('PROXY_URL', None)  # 默认值是你原来硬编码的代理路径
     try:
-        with GITHUB(proxies=proxy_url,
+        async with GITHUB(proxies=proxy_url,
                     timeout=20) as github:
-            res = github.text(keywords=q,)
+            res = await github.atext(keywords=q,)
             return res
     except Exception as e:
         raise HTTPException(
@@ -84,18 +192,14 @@ async def search_github(q: str, l: Optional[str] = 'cn-zh', m: Optional[int] = 1
 
 @auth_router.get("/search/vt/")
 async def search_vt(q: str):
-    proxy_url = os.getenv('PROXY_URL', None)  # 默认值是你原来硬编码的代理路径
-    print(proxy_url)
     try:
-        with VT(proxies=proxy_url, timeout=30) as vt:
-            res = vt.api(q)
-            # 将 JSON 数据转换为字符串
-            json_data = orjson.dumps(res)
-            # 压缩序列化后的 JSON 字节数据
-            compressed_data = gzip_compress(json_data)
-            # 返回压缩后的数据，并设置 Content-Encoding 头
-            return Response(content=compressed_data, media_type="application/json",
-                            headers={"Content-Encoding": "gzip"})
+        body = search_vt_bodies.get(q)
+        if body is None:
+            # 相同IOC的并发请求共享一次查询和一次压缩
+            body = await cache_flights.do(("search_vt", q), lambda: search_vt_body(q))
+        # 返回压缩后的数据，并设置 Content-Encoding 头
+        return Response(content=body, media_type="application/json",
+                        headers={"Content-Encoding": "gzip"})
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -103,16 +207,29 @@ async def search_vt(q: str):
         )
 
 
+async def search_vt_body(q: str) -> bytes:
+    proxy_url = os.getenv('PROXY_URL', None)  # 默认值是你原来硬编码的代理路径
+    async with VT(proxies=proxy_url, timeout=30, hedge=True) as vt:
+        res = await vt.aapi(q)
+    # 大报告的序列化和压缩很耗CPU，放到线程里做，不阻塞事件循环
+    body = await asyncio.to_thread(gzip_json, res)
+    # 只缓存完整的报告：有子请求失败，或受调用方截止时间限制而被截断的报告下次重新查询；
+    # 评论和用户列表这类结果不带完整性标记，不缓存
+    if SEARCH_VT_CACHE_TTL > 0 and isinstance(res, VTReport) and res.complete and current_deadline.get() is None:
+        search_vt_bodies.set(q, body, size=len(body))
+    return body
+
+
 @auth_router.get("/tip/search/")
 async def search_ddgs(q: str, l: Optional[str] = 'cn-zh', m: Optional[int] = 10):
     proxy_url = os.getenv('PROXY_URL', None)  # 默认值是你原来硬编码的代理路径
     try:
-        with DDGS(proxies=proxy_url,
+        async with DDGS(proxies=proxy_url,
                     ddgs_end_point='https://ddgs.catflix.cn',
                     ddgslink_end_point='https://ddgslink.catflix.cn',
                     timeout=20) as ddgs:
             q = f'"{q}"'
-            res = ddgs.text(q, max_results=m , region=l,)
+            res = await ddgs.atext(q, max_results=m , region=l,)
         
         # with URLRead(proxies=proxy_url, timeout=3) as url_read:
         #     urls = [item.get("href") for item in res]
@@ -261,35 +378,41 @@ def handle_contacted_urls(data: dict) -> dict:
     }
 
 
-async def read_from_cf_api(_f):
+async def read_from_cf_api(_f, cache_errors: bool = True, relationships: Optional[tuple] = None):
+    # 相同IOC、相同关系集合的并发请求共享一次缓存读取/回源
+    relationships = relationship_key(relationships)
+    return await cache_flights.do((_f, relationships), lambda: _read_from_cf_api(_f, cache_errors, relationships))
+
+
+async def _read_from_cf_api(_f, cache_errors: bool = True, relationships: Optional[tuple] = None):
     proxy_url = os.getenv('PROXY_URL', None)
-    cache_dir = os.getenv('CACHE_DIR', './cache')
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-    
-    cache_file = os.path.join(cache_dir, f"{_f}.gz")
-    if os.path.exists(cache_file):
-        logging.info(f"Loading cache file: {cache_file}")
-        _res = await load_json_gzip_async(cache_file)
-    else:
-        with VT(
+    # 缓存的报告以关系名为键，已有哪些关系就是它的键；只回源缺少的关系并合并进缓存
+    wanted = relationships or tuple(cf_api_endpoints(_f))
+    _res = await report_cache.get(_f) or {}
+    missing = [r for r in wanted if r not in _res]
+    if missing or not _res:
+        async with VT(
             proxies=proxy_url,
             timeout=10,
             cf_end_point=DEFAULT_CF_END_POINT
         ) as vt:
-            _res = vt.cf_api(input_str=_f)
-        await write_json_gzip_async(cache_file, _res)
-        logging.info(f"Writing cache file: {cache_file}")
+            fetched = await vt.acf_api(input_str=_f, relationships=missing if _res else relationships)
+        _res = {**_res, **(fetched or {})}
+        if cache_errors or (_res and not _res.get("analyse", {}).get("error", None)):
+            await report_cache.set(_f, _res)
+            # 原始报告变了，由它计算出的视图作废
+            for view in REPORT_VIEWS:
+                await report_cache.delete(view.key(_f))
     return _res
 
     
 async def tip_fetch_file_cursor(q: str, dtype: str, cursor: str):
     proxy_url = os.getenv('PROXY_URL', None)  # 默认值是你原来硬编码的代理路径
     try:
-        with VT(proxies=proxy_url,
+        async with VT(proxies=proxy_url,
                 timeout=10,
                 cf_end_point=DEFAULT_CF_END_POINT) as vt:
-            res = vt.cf_api(input_str=q, dtype=dtype, cursor=cursor)
+            res = await vt.acf_api(input_str=q, dtype=dtype, cursor=cursor)
             if dtype == 'communicating_files':
                 info = res.get("communicating_files", {})
                 return handle_communicating_files(info)
@@ -314,32 +437,139 @@ async def tip_fetch_file_cursor(q: str, dtype: str, cursor: str):
         )
 
 
+def file_info_view(res: dict) -> dict:
+    """/tip/vt/ 文件查询的响应：基本信息和contacted_*关系"""
+    # 若存在返回结果，进行返回结果处理
+    final_res = {}
+    analyse_data = res.get("analyse", {}).get("data", {}).get("attributes", {})
+    contacted_domains = res.get("contacted_domains", {})
+    contacted_ips = res.get("contacted_ips", {})
+    contacted_urls = res.get("contacted_urls", {})
+    final_res["meaningful_name"] = analyse_data.get("meaningful_name", None)
+    final_res["type_description"] = analyse_data.get("type_description", None)
+    final_res["type_tags"] = analyse_data.get("type_tags", [])
+    final_res["type_extension"] = analyse_data.get("type_extension", None)
+    final_res["md5"] = analyse_data.get("md5", None)
+    final_res["sha1"] = analyse_data.get("sha1", None)
+    final_res["sha256"] = analyse_data.get("sha256", None)
+    final_res["imphash"] = analyse_data.get("pe_info", {}).get("imphash", None)
+    final_res["ssdeep"] = analyse_data.get("ssdeep", None)
+    final_res["size"] = analyse_data.get("size", None)
+    final_res["last_submission_date"] = analyse_data.get("last_submission_date", None)
+    final_res["first_submission_date"] = analyse_data.get("first_submission_date", None)
+    final_res["contacted_domains"] = handle_contacted_domains(contacted_domains)
+    final_res["contacted_ips"] = handle_contacted_ips(contacted_ips)
+    final_res["contacted_urls"] = handle_contacted_urls(contacted_urls)
+    return final_res
+
+
+def file_vt_view(res: dict) -> dict:
+    """/tip/vt/file/{sha256} 的响应：威胁分类、MITRE行为树和网络通信摘要"""
+    # Extract data from nested structure
+    analyse_data = res.get("analyse", {}).get("data", {}).get("attributes", {})
+    behaviour_data = res.get("behaviour", {}).get("data", {})
+    file_behaviour_data = res.get("file_behaviour", {}).get("data", [])
+    last_analysis_results = analyse_data.get("last_analysis_results", {})
+    # 复制一份，合并请求的调用方共享同一个报告对象，不能原地修改
+    popular_threat_category = list(analyse_data.get("popular_threat_classification", {}).get("popular_threat_category", []))
+    if not popular_threat_category:
+        # 先找kaspersky
+        kaspersky_category = last_analysis_results.get("Kaspersky", {}).get("category", None)
+        kaspersky_result = last_analysis_results.get("Kaspersky", {}).get("result", None)
+        if kaspersky_category == "malicious" and kaspersky_result and kaspersky_result != "detected" and kaspersky_result != "":
+            popular_threat_category.append({"value": kaspersky_result, "source": "Kaspersky", "count": 1})
+        else:
+            # 再找其他av
+            for k in last_analysis_results.keys():
+                av_category = last_analysis_results.get(k, {}).get("category", None)
+                av_result = last_analysis_results.get(k, {}).get("result", None)
+                if av_category == "malicious" and av_result and av_result != "detected" and av_result != "":
+                    popular_threat_category.append({"value":av_result, "source": k, "count": 1})
+                    break
+    # 处理behaviour_mitre_trees
+    behaviour_mitre_trees_atts = {}
+    for key in behaviour_data.keys():
+        key_data = behaviour_data[key]
+        behaviour_mitre_trees_atts[key] = {"tactics": []}
+
+        # 处理每个 tactic
+        for tactic in key_data.get("tactics", []):
+            simplified_tactic = {
+                "id": tactic.get("id", ""),
+                "name": tactic.get("name", ""),
+                "techniques": []
+            }
+
+            # 处理每个 technique
+            for technique in tactic.get("techniques", []):
+                simplified_technique = {
+                    "id": technique.get("id", ""),
+                    "name": technique.get("name", ""),
+                    "signatures": technique.get("signatures", [])
+                }
+                simplified_tactic["techniques"].append(simplified_technique)
+
+            behaviour_mitre_trees_atts[key]["tactics"].append(simplified_tactic)
+
+    # 处理network_communication
+    network_communication_atts = []
+    for file_behaviour in file_behaviour_data:
+        att = {}
+        file_behaviour_attributes = file_behaviour.get("attributes", {})
+        att["sandbox_name"] = file_behaviour_attributes.get("sandbox_name", "")
+        att["http_conversations"] = file_behaviour_attributes.get("http_conversations", [])
+        att["memory_pattern_domains"] = file_behaviour_attributes.get("memory_pattern_domains", [])
+        att["memory_pattern_urls"] = file_behaviour_attributes.get("memory_pattern_urls", [])
+        att["ip_traffic"] = file_behaviour_attributes.get("ip_traffic", [])
+        att["ja3_digests"] = file_behaviour_attributes.get("ja3_digests", [])
+        att["dns_lookups"] = file_behaviour_attributes.get("dns_lookups", [])
+        att["tls"] = file_behaviour_attributes.get("tls", [])
+        network_communication_atts.append(att)
+
+    clean_res = {
+        "vt_hit": True,
+        "meaningful_name": analyse_data.get("meaningful_name"),
+        "type_tag": analyse_data.get("type_tag"),
+        "size": analyse_data.get("size"),
+        "sha256": analyse_data.get("sha256"),
+        "sha1": analyse_data.get("sha1"),
+        "md5": analyse_data.get("md5"),
+        "creation_date": analyse_data.get("creation_date"),
+        "last_submission_date": analyse_data.get("last_submission_date"),
+        "first_submission_date": analyse_data.get("first_submission_date"),
+        "behaviour_mitre_trees": behaviour_mitre_trees_atts,
+        "popular_threat_category": popular_threat_category,
+        "network_communication": network_communication_atts
+    }
+    return clean_res
+
+
+# 派生视图与原始报告缓存在一起；修改视图的转换逻辑时递增版本号，旧版本的缓存不再被读取
+FILE_INFO_VIEW = DerivedView("file_info", 1, file_info_view)
+FILE_VT_VIEW = DerivedView("file_vt", 1, file_vt_view)
+REPORT_VIEWS = (FILE_INFO_VIEW, FILE_VT_VIEW)
+
+
+async def read_view(view: DerivedView, _f: str, load):
+    # 视图未缓存时才读取原始报告，计算一次后缓存；命中时不再遍历原始报告
+    key = view.key(_f)
+    return await cache_flights.do(("view", key), lambda: _read_view(view, key, load))
+
+
+async def _read_view(view: DerivedView, key: str, load):
+    value = await report_cache.get(key)
+    if value is None:
+        value = view.transform(await load())
+        await report_cache.set(key, value)
+    return value
+
+
 async def tip_fetch_file_info(fileid: str): 
+    async def load():
+        return await read_from_cf_api(fileid, relationships=TIP_FILE_INFO_RELATIONSHIPS)
+
     try:
-        res = await read_from_cf_api(fileid)
-        
-        # 若存在返回结果，进行返回结果处理
-        final_res = {}
-        analyse_data = res.get("analyse", {}).get("data", {}).get("attributes", {})
-        contacted_domains = res.get("contacted_domains", {})
-        contacted_ips = res.get("contacted_ips", {})
-        contacted_urls = res.get("contacted_urls", {})
-        final_res["meaningful_name"] = analyse_data.get("meaningful_name", None)
-        final_res["type_description"] = analyse_data.get("type_description", None)
-        final_res["type_tags"] = analyse_data.get("type_tags", [])
-        final_res["type_extension"] = analyse_data.get("type_extension", None)
-        final_res["md5"] = analyse_data.get("md5", None)
-        final_res["sha1"] = analyse_data.get("sha1", None)
-        final_res["sha256"] = analyse_data.get("sha256", None)
-        final_res["imphash"] = analyse_data.get("pe_info", {}).get("imphash", None)
-        final_res["ssdeep"] = analyse_data.get("ssdeep", None)
-        final_res["size"] = analyse_data.get("size", None)
-        final_res["last_submission_date"] = analyse_data.get("last_submission_date", None)
-        final_res["first_submission_date"] = analyse_data.get("first_submission_date", None)
-        final_res["contacted_domains"] = handle_contacted_domains(contacted_domains)
-        final_res["contacted_ips"] = handle_contacted_ips(contacted_ips)
-        final_res["contacted_urls"] = handle_contacted_urls(contacted_urls)
-        return final_res
+        return await read_view(FILE_INFO_VIEW, fileid, load)
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -353,119 +583,31 @@ async def tip_fetch_file_info(fileid: str):
 @auth_router.get("/tip/vt/file/{sha256}")
 async def search_file_vt(sha256: str):
     logging.info(f"api: /tip/vt/file/: {sha256}")
-    proxy_url = os.getenv('PROXY_URL', None)
-    cache_dir = os.getenv('CACHE_DIR', './cache')
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-    cache_file = os.path.join(cache_dir, f"{sha256}.gz")
-            
     if not sha256 or len(sha256) != 64:
         raise HTTPException(
             status_code=400,
             detail={"error": "Invalid SHA256 hash - must be 64 characters", "status": "failed"}
         )
+    async def load():
+        res = await read_from_cf_api(sha256, cache_errors=False, relationships=FILE_VT_RELATIONSHIPS)
+        if not res:
+            raise HTTPException(
+                status_code=404,
+                detail={"error": "File not found", "status": "failed"}
+            )
+        if res.get("analyse", {}).get("error", None):
+            # 返回原始错误码
+            error_detail = res["analyse"].get("error", "Unknown error")
+            error_status = res["analyse"].get("status", 500)
+            raise HTTPException(
+                status_code=error_status,
+                detail={"error": error_detail, "status": error_status}
+            )
+
+        return res
+
     try:
-        if os.path.exists(cache_file):
-            logging.info(f"Loading cache file: {cache_file}")
-            res = await load_json_gzip_async(cache_file)
-        else:
-            with VT(proxies=proxy_url,
-                    timeout=10,
-                    cf_end_point=DEFAULT_CF_END_POINT) as vt:
-                res = vt.cf_api(input_str=sha256)
-                if not res:
-                    raise HTTPException(
-                        status_code=404,
-                        detail={"error": "File not found", "status": "failed"}
-                    )
-                if res.get("analyse", {}).get("error", None):
-                    # 返回原始错误码
-                    error_detail = res["analyse"].get("error", "Unknown error")
-                    error_status = res["analyse"].get("status", 500)
-                    raise HTTPException(
-                        status_code=error_status,
-                        detail={"error": error_detail, "status": error_status}
-                    )
-                    
-                await write_json_gzip_async(cache_file, res)
-                logging.info(f"Writing cache file: {cache_file}")
-        
-        # Extract data from nested structure
-        analyse_data = res.get("analyse", {}).get("data", {}).get("attributes", {})
-        behaviour_data = res.get("behaviour", {}).get("data", {})
-        file_behaviour_data = res.get("file_behaviour", {}).get("data", [])
-        last_analysis_results = analyse_data.get("last_analysis_results", {})
-        popular_threat_category = analyse_data.get("popular_threat_classification", {}).get("popular_threat_category", [])
-        if not popular_threat_category:
-            # 先找kaspersky
-            kaspersky_category = last_analysis_results.get("Kaspersky", {}).get("category", None)
-            kaspersky_result = last_analysis_results.get("Kaspersky", {}).get("result", None)
-            if kaspersky_category == "malicious" and kaspersky_result and kaspersky_result != "detected" and kaspersky_result != "":
-                popular_threat_category.append({"value": kaspersky_result, "source": "Kaspersky", "count": 1})
-            else:
-                # 再找其他av
-                for k in last_analysis_results.keys():
-                    av_category = last_analysis_results.get(k, {}).get("category", None)
-                    av_result = last_analysis_results.get(k, {}).get("result", None)
-                    if av_category == "malicious" and av_result and av_result != "detected" and av_result != "":
-                        popular_threat_category.append({"value":av_result, "source": k, "count": 1})
-                        break
-        # 处理behaviour_mitre_trees
-        behaviour_mitre_trees_atts = {}
-        for key in behaviour_data.keys():
-            key_data = behaviour_data[key]
-            behaviour_mitre_trees_atts[key] = {"tactics": []}
-            
-            # 处理每个 tactic
-            for tactic in key_data.get("tactics", []):
-                simplified_tactic = {
-                    "id": tactic.get("id", ""),
-                    "name": tactic.get("name", ""),
-                    "techniques": []
-                }
-                
-                # 处理每个 technique
-                for technique in tactic.get("techniques", []):
-                    simplified_technique = {
-                        "id": technique.get("id", ""),
-                        "name": technique.get("name", ""),
-                        "signatures": technique.get("signatures", [])
-                    }
-                    simplified_tactic["techniques"].append(simplified_technique)
-                    
-                behaviour_mitre_trees_atts[key]["tactics"].append(simplified_tactic)
-
-        # 处理network_communication
-        network_communication_atts = []
-        for file_behaviour in file_behaviour_data:
-            att = {}
-            file_behaviour_attributes = file_behaviour.get("attributes", {})
-            att["sandbox_name"] = file_behaviour_attributes.get("sandbox_name", "")
-            att["http_conversations"] = file_behaviour_attributes.get("http_conversations", [])
-            att["memory_pattern_domains"] = file_behaviour_attributes.get("memory_pattern_domains", [])
-            att["memory_pattern_urls"] = file_behaviour_attributes.get("memory_pattern_urls", [])
-            att["ip_traffic"] = file_behaviour_attributes.get("ip_traffic", [])
-            att["ja3_digests"] = file_behaviour_attributes.get("ja3_digests", [])
-            att["dns_lookups"] = file_behaviour_attributes.get("dns_lookups", [])
-            att["tls"] = file_behaviour_attributes.get("tls", [])
-            network_communication_atts.append(att)
-
-        clean_res = {
-            "vt_hit": True,
-            "meaningful_name": analyse_data.get("meaningful_name"),
-            "type_tag": analyse_data.get("type_tag"),
-            "size": analyse_data.get("size"),
-            "sha256": analyse_data.get("sha256"),
-            "sha1": analyse_data.get("sha1"),
-            "md5": analyse_data.get("md5"),
-            "creation_date": analyse_data.get("creation_date"),
-            "last_submission_date": analyse_data.get("last_submission_date"),
-            "first_submission_date": analyse_data.get("first_submission_date"),
-            "behaviour_mitre_trees": behaviour_mitre_trees_atts,
-            "popular_threat_category": popular_threat_category,
-            "network_communication": network_communication_atts
-        }
-        return clean_res
+        return await read_view(FILE_VT_VIEW, sha256, load)
     except HTTPException as he:
         raise he
     except Exception as e:
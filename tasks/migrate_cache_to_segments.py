@@ -0,0 +1,57 @@
+"""把 CACHE_DIR 下的 gzip 报告缓存（旧的平铺 <ioc>.gz 和分片目录两种布局）导入段文件存储。
+
+    python -m tasks.migrate_cache_to_segments --cache-dir ./cache --segment-dir ./cache/segments
+    python -m tasks.migrate_cache_to_segments --delete   # 导入后删除原文件
+
+可以在服务运行时执行：写入与各worker一样经过段存储的写锁。已在段存储中的IOC会被覆盖为文件中的内容。
+"""
+import argparse
+import gzip
+import logging
+import os
+from urllib.parse import unquote
+
+from engines.cache import CACHE_DIR
+from engines.segment_store import SEGMENT_DIR, SegmentStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def iter_cache_files(cache_dir, skip_dir):
+    for root, dirs, files in os.walk(cache_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != os.path.abspath(skip_dir)]
+        for name in files:
+            if name.endswith(".gz"):
+                yield os.path.join(root, name), unquote(name[:-len(".gz")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the gzip report cache into a segment store")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--segment-dir", default=SEGMENT_DIR)
+    parser.add_argument("--delete", action="store_true", help="delete each file once imported")
+    args = parser.parse_args()
+
+    store = SegmentStore(args.segment_dir)
+    imported = skipped = 0
+    for path, key in iter_cache_files(args.cache_dir, args.segment_dir):
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            # 只导入完整的gzip文件，旧布局非原子写入可能留下截断的文件
+            gzip.decompress(raw)
+            store.put_raw(key, raw, written_at=os.path.getmtime(path))
+        except Exception as e:
+            logging.warning(f"跳过 {path}: {type(e).__name__}: {e}")
+            skipped += 1
+            continue
+        imported += 1
+        if args.delete:
+            os.remove(path)
+        if imported % 10000 == 0:
+            logging.info(f"已导入 {imported} 个")
+    logging.info(f"迁移完成: 导入 {imported} 个，跳过 {skipped} 个，{store.stats()}")
+
+
+if __name__ == "__main__":
+    main()
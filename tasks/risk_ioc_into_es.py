@@ -27,6 +27,7 @@ IOC_API_URL = f"{IOC_ENDPOINT}/api/threat"
 VT_PROXIES = os.getenv('VT_PROXIES', 'socks5://127.0.0.1:10808')
 VT_TIMEOUT = int(os.getenv('VT_TIMEOUT', '10'))
 VT_CF_END_POINT = os.getenv('VT_CF_END_POINT', 'https://xxxx/')
+VT_CONCURRENCY = int(os.getenv('VT_CONCURRENCY', '8'))
 
 es_client = _get_es_client()
 
@@ -130,7 +131,11 @@ def process_ioc(sample_ioc: Dict[str, Any]) -> bool:
  
     # 查询VT
     vt_result = query_vt_for_ioc(ioc_value)
+    return save_vt_result(ioc_value, vt_result)
 
+
+def save_vt_result(ioc_value: str, vt_result: Dict[str, Any]) -> bool:
+    """解析VT结果并写入ES"""
     if not vt_result:
         logging.warning(f"VT查询结果为空: {ioc_value[:20]}...")
         return False
@@ -164,15 +169,24 @@ def main(page: int = 1):
         success_count = 0
         fail_count = 0
         
-        for sample_ioc in sample_iocs:
-            try:
-                if process_ioc(sample_ioc):
-                    success_count += 1
-                else:
+        with VT(
+            proxies=VT_PROXIES,
+            timeout=VT_TIMEOUT,
+            cf_end_point=VT_CF_END_POINT
+        ) as vt:
+            iocs = [sample_ioc['ioc_value'] for sample_ioc in sample_iocs]
+            for ioc_value, vt_result in vt.cf_api_many(iocs, concurrency=VT_CONCURRENCY):
+                try:
+                    if isinstance(vt_result, Exception):
+                        logging.error(f"查询VT失败 {ioc_value[:20]}...: {vt_result}")
+                        fail_count += 1
+                    elif save_vt_result(ioc_value, vt_result):
+                        success_count += 1
+                    else:
+                        fail_count += 1
+                except Exception as e:
+                    logging.error(f"处理IOC失败: {e}")
                     fail_count += 1
-            except Exception as e:
-                logging.error(f"处理IOC失败: {e}")
-                fail_count += 1
         
         logging.info(f"处理完成: 成功 {success_count} 个，失败 {fail_count} 个")
         
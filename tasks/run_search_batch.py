@@ -1,5 +1,4 @@
-from engines import DDGS
-import random
+from engines import DDGS, EndpointPool
 from urllib.parse import quote
 from concurrent.futures import ThreadPoolExecutor
 import concurrent.futures
@@ -7,29 +6,21 @@ import pandas as pd
 import sys
 
 
-def get_rand_ddgs_end_point():
-    end_points = ["https://duckduckgo.com",
-                     "https://ddgs.catflix.cn",
-                     ]
-    weights = [0, 0.5]
-    end_point = random.choices(end_points, weights=weights, k=1)[0]
-    return end_point
+# 镜像按实时延迟和错误率自动分配流量，权重只作为初始先验；权重为0的不参与
+ddgs_end_points = EndpointPool({"https://duckduckgo.com": 0,
+                                "https://ddgs.catflix.cn": 0.5,
+                                })
 
-
-def get_rand_ddgslink_end_point():
-    end_points = ["https://links.duckduckgo.com",
-                     "https://ddgslink.catflix.cn",
-                     ]
-    weights = [0, 0.5]
-    end_point = random.choices(end_points, weights=weights, k=1)[0]
-    return end_point
+ddgslink_end_points = EndpointPool({"https://links.duckduckgo.com": 0,
+                                    "https://ddgslink.catflix.cn": 0.5,
+                                    })
 
 
 def search(domain, retry=2):
     try:
         with DDGS(proxies="socks5://127.0.0.1:10808", timeout=20,
-                  ddgs_end_point=get_rand_ddgs_end_point(),
-                  ddgslink_end_point=get_rand_ddgslink_end_point()
+                  ddgs_end_point=ddgs_end_points,
+                  ddgslink_end_point=ddgslink_end_points
                   ) as ddgs:
             q = f'{quote(str(domain))}'
             r = ddgs.text(q, max_results=10, region='cn-zh')
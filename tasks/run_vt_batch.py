@@ -1,16 +1,13 @@
 from datetime import datetime
 import json
-from engines import VT
+from engines import VT, EndpointPool, rate_limits
 from dotenv import load_dotenv
 import os
-import random
 import psycopg2
 from psycopg2 import pool
 import logging
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor
-import concurrent.futures
 
 
 logging.basicConfig(filename='task.log', level=logging.INFO, encoding="utf-8")
@@ -35,14 +32,16 @@ connection_pool = psycopg2.pool.ThreadedConnectionPool(1, 50,
                                                        port=port)
 
 
-def get_rand_vt_end_point():
-    vt_end_points = ["https://www.virustotal.com/",
-                     "https://vtfastlycdn.451964719.xyz/",
-                     "https://vtcdn.darkqiank.work/",
-                     ]
-    weights = [0.0, 0.3, 0.3]
-    vt_end_point = random.choices(vt_end_points, weights=weights, k=1)[0]
-    return vt_end_point
+# 每个镜像的并发窗口由AIMD根据限流反馈自动调节，线程数只需保证能填满窗口
+for vt_host in ["www.virustotal.com", "vtfastlycdn.451964719.xyz", "vtcdn.darkqiank.work"]:
+    rate_limits.configure(vt_host, max_in_flight=8, max_limit=64)
+
+
+# 镜像按实时延迟和错误率自动分配流量，权重只作为初始先验；权重为0的不参与
+vt_end_points = EndpointPool({"https://www.virustotal.com/": 0.0,
+                              "https://vtfastlycdn.451964719.xyz/": 0.3,
+                              "https://vtcdn.darkqiank.work/": 0.3,
+                              })
 
 
 with open("D:\\data\\nrd\\1115_50w.txt", "r", encoding='utf-8') as f:
@@ -50,38 +49,33 @@ with open("D:\\data\\nrd\\1115_50w.txt", "r", encoding='utf-8') as f:
     src_ids = [line.strip() for line in lines]
 
 
-def process_src_id(src_id):
+def existing_ids(ids):
+    """已入库的 src_id 集合，一次查询整批"""
+    conn = connection_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM vt_reports WHERE id = ANY(%s)", (list(ids),))
+        return {row[0] for row in cur.fetchall()}
+    finally:
+        connection_pool.putconn(conn)
+
+
+def save_report(src_id, res):
     conn = connection_pool.getconn()
-    success = False
-    # print(src_id)
     try:
         cur = conn.cursor()
-        # 检查是否已存在 src_id 数据
-        cur.execute("SELECT 1 FROM vt_reports WHERE id = %s LIMIT 1", (src_id,))
-        exists = cur.fetchone()
-
-        if exists:
-            pass
-            # print(f"src_id {src_id} 已存在，跳过")
-        else:
-            with VT(proxies="socks5://127.0.0.1:10808", timeout=10, vt_end_point=get_rand_vt_end_point()) as vt:
-                res = vt.api(input_str=src_id)
-                cur.execute(
-                    """
-                    INSERT INTO vt_reports (id, data, create_time)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (id) DO NOTHING
-                    """,
-                    (src_id, json.dumps(res, ensure_ascii=False), datetime.now())
-                )
-            conn.commit()
-            print("保存成功")
-            success = True
-    except Exception as e:
-        print("保存失败", e)
+        cur.execute(
+            """
+            INSERT INTO vt_reports (id, data, create_time)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (id) DO NOTHING
+            """,
+            (src_id, json.dumps(res, ensure_ascii=False), datetime.now())
+        )
+        conn.commit()
     finally:
         connection_pool.putconn(conn)
-        return success
+
 
 def chunks(lst, n):
     for i in range(0, len(lst), n):
@@ -89,14 +83,19 @@ def chunks(lst, n):
 
 success_num = 0
 
-with ThreadPoolExecutor(max_workers=10) as executor:
+# 一个VT实例复用会话，api_many 控制并发并在每个查询完成时返回结果
+with VT(proxies="socks5://127.0.0.1:10808", timeout=10, vt_end_point=vt_end_points) as vt:
     batch_size = 500
     for batch in chunks(src_ids, batch_size):
-        futures = [executor.submit(process_src_id, src_id) for src_id in batch]
-
-        for future in concurrent.futures.as_completed(futures):
-            response = future.result()
-            if response:
+        existing = existing_ids(batch)
+        todo = [src_id for src_id in batch if src_id not in existing]
+        for src_id, res in vt.api_many(todo, concurrency=32):
+            if isinstance(res, Exception):
+                print("保存失败", src_id, res)
+                continue
+            try:
+                save_report(src_id, res)
                 success_num += 1
+            except Exception as e:
+                print("保存失败", src_id, e)
         print(f"成功处理数量：{success_num}")
-
@@ -1,16 +1,13 @@
 from datetime import datetime
 import json
-from engines import VT
+from engines import VT, EndpointPool, rate_limits
 from dotenv import load_dotenv
 import os
-import random
 import psycopg2
 from psycopg2 import pool
 import logging
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor
-import concurrent.futures
 
 
 logging.basicConfig(filename='task.log', level=logging.INFO, encoding="utf-8")
@@ -48,14 +45,16 @@ connection_pool = psycopg2.pool.ThreadedConnectionPool(1, 20,
 # lock = threading.Lock()
 
 
-def get_rand_vt_end_point():
-    vt_end_points = ["https://www.virustotal.com/",
-                     "https://vtfastlycdn.451964719.xyz/",
-                     "https://vtgcorecdn.451964719.xyz/"
-                     ]
-    weights = [0.5, 0.5, 0.0]
-    vt_end_point = random.choices(vt_end_points, weights=weights, k=1)[0]
-    return vt_end_point
+# 每个镜像的并发窗口由AIMD根据限流反馈自动调节，线程数只需保证能填满窗口
+for vt_host in ["www.virustotal.com", "vtfastlycdn.451964719.xyz", "vtgcorecdn.451964719.xyz"]:
+    rate_limits.configure(vt_host, max_in_flight=8, max_limit=64)
+
+
+# 镜像按实时延迟和错误率自动分配流量，权重只作为初始先验；权重为0的不参与
+vt_end_points = EndpointPool({"https://www.virustotal.com/": 0.5,
+                              "https://vtfastlycdn.451964719.xyz/": 0.5,
+                              "https://vtgcorecdn.451964719.xyz/": 0.0,
+                              })
 
 
 src_ids = []
@@ -71,12 +70,12 @@ try:
     cur = conn.cursor()
     res = []
     with VT(proxies=proxy, timeout=20, vt_end_point="https://www.virustotal.com/") as vt:
-        res.extend(vt.api(input_str="comments"))
-
-    for user in users:
-        print(user)
-        with VT(proxies=proxy, timeout=20, vt_end_point="https://www.virustotal.com/") as vt:
-            res.extend(vt.api(input_str=user))
+        for user, comments in vt.api_many(["comments", *users], concurrency=4, ordered=True):
+            print(user)
+            if isinstance(comments, Exception):
+                print(user, comments)
+                continue
+            res.extend(comments)
 
     for record in res:
         id_value = record.get('id')
@@ -129,50 +128,50 @@ print("评论数据保存成功！")
 
 logging.info('Task started at {} 保存成功{}条评论'.format(time.strftime('%Y-%m-%d %H:%M:%S'), len(src_ids)))
 
-def process_src_id(src_id):
+def existing_ids(ids):
+    """已入库的 src_id 集合，一次查询整批"""
     conn = connection_pool.getconn()
-    success = False
-    print(src_id)
     try:
         cur = conn.cursor()
-        # 检查是否已存在 src_id 数据
-        cur.execute("SELECT 1 FROM vt_reports WHERE id = %s LIMIT 1", (src_id,))
-        exists = cur.fetchone()
-
-        if exists:
-            print(f"src_id {src_id} 已存在，跳过")
-        else:
-            with VT(proxies=proxy, timeout=10, vt_end_point=get_rand_vt_end_point()) as vt:
-                res = vt.api(input_str=src_id)
-                cur.execute(
-                    """
-                    INSERT INTO vt_reports (id, data, create_time)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (id) DO NOTHING
-                    """,
-                    (src_id, json.dumps(res, ensure_ascii=False), create_time)
-                )
-            conn.commit()
-            print("保存成功")
-            success = True
-    except Exception as e:
-        print("保存失败", e)
+        cur.execute("SELECT id FROM vt_reports WHERE id = ANY(%s)", (list(ids),))
+        return {row[0] for row in cur.fetchall()}
     finally:
         connection_pool.putconn(conn)
-        return success
 
-success_num = 0
 
-with ThreadPoolExecutor(max_workers=10) as executor:
-    futures = []
-    for src_id in src_ids:
-        future = executor.submit(process_src_id, src_id)
-        futures.append(future)
+def save_report(src_id, res):
+    conn = connection_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO vt_reports (id, data, create_time)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (id) DO NOTHING
+            """,
+            (src_id, json.dumps(res, ensure_ascii=False), create_time)
+        )
+        conn.commit()
+    finally:
+        connection_pool.putconn(conn)
+
+success_num = 0
 
-    for future in concurrent.futures.as_completed(futures):
-        response = future.result()
-        if response:
+existing = existing_ids([src_id for src_id in src_ids if src_id])
+todo = [src_id for src_id in src_ids if src_id and src_id not in existing]
+print(f"{len(src_ids) - len(todo)} 个 src_id 已存在，跳过")
+
+with VT(proxies=proxy, timeout=10, vt_end_point=vt_end_points) as vt:
+    for src_id, res in vt.api_many(todo, concurrency=20):
+        if isinstance(res, Exception):
+            print("保存失败", src_id, res)
+            continue
+        try:
+            save_report(src_id, res)
+            print("保存成功", src_id)
             success_num += 1
+        except Exception as e:
+            print("保存失败", src_id, e)
 
 print("报告数据保存成功！")
 
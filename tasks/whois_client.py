@@ -15,6 +15,7 @@ import time
 import threading
 from dotenv import load_dotenv
 import os
+from engines.ratelimit import TokenBucket
 
 
 # 加载 .env 文件
@@ -44,6 +45,7 @@ turns = 3
 
 # 设置每秒的请求次数上限
 tps = 60
+whois_bucket = TokenBucket(rate=tps)
 
 # whois的请求接口
 whois_end_point = "http://127.0.0.1:5007/"
@@ -212,6 +214,8 @@ def fetch_data(domain, end_point=whois_end_point, ref=1, retry=1):
     else:
         api = f"{end_point}{domain}"
     try:
+        # 所有线程共享的令牌桶，平滑地限制每秒请求数
+        whois_bucket.acquire_sync()
         response = requests.get(url=api, verify=False, timeout=30)
         # response.raise_for_status()  # 确保响应状态码是200
         res = response.json()
@@ -316,8 +320,6 @@ def process_domains_in_batches(domains):
                         # results.append(response)
                         success_num += 1
             print(f"whois successed/roll_in_num/processed/all {success_num}/{roll_in_num}/{processed_num}/{dm_num}")
-            # 限制每秒的请求次数
-            # time.sleep(max(0.0, start_time + 1 - time.time()))
 
     return success_num
 
@@ -0,0 +1,74 @@
+import asyncio
+
+from engines.bulk import bounded_map
+from engines.exceptions import ClientSearchException
+
+
+def _collect(agen):
+    async def main():
+        return [item async for item in agen]
+
+    return asyncio.run(main())
+
+
+def test_bounded_map_caps_concurrency_and_dedupes():
+    running = peak = 0
+
+    async def lookup(x):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return x * 2
+
+    results = _collect(bounded_map(lookup, [" a ", "b", "A", "c", "b"], concurrency=2,
+                                   normalize=lambda s: s.strip().lower()))
+    assert sorted(results) == [("a", "aa"), ("b", "bb"), ("c", "cc")]
+    assert peak == 2
+
+
+def test_bounded_map_ordered():
+    async def lookup(x):
+        await asyncio.sleep(0.01 * (5 - x))
+        return x
+
+    results = _collect(bounded_map(lookup, range(5), concurrency=5, ordered=True))
+    assert [item for item, _ in results] == [0, 1, 2, 3, 4]
+
+
+def test_bounded_map_yields_failures_and_cancellations():
+    async def lookup(x):
+        if x == 1:
+            raise ValueError("bad")
+        if x == 2:
+            asyncio.current_task().cancel()
+            await asyncio.sleep(1)
+        return x
+
+    results = dict(_collect(bounded_map(lookup, [0, 1, 2, 3])))
+    assert results[0] == 0 and results[3] == 3
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], ClientSearchException)
+
+
+def test_bounded_map_close_cancels_in_flight():
+    cancelled = []
+
+    async def lookup(x):
+        try:
+            await asyncio.sleep(0 if x == 0 else 1)
+        except asyncio.CancelledError:
+            cancelled.append(x)
+            raise
+        return x
+
+    async def main():
+        agen = bounded_map(lookup, range(4), concurrency=4)
+        first = await agen.__anext__()
+        await agen.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    assert asyncio.run(main()) == (0, 0)
+    assert sorted(cancelled) == [1, 2, 3]
@@ -0,0 +1,195 @@
+import asyncio
+import gzip
+import os
+import time
+
+import orjson
+
+from engines.cache import DerivedView, FileCache, MemoryCache, TieredCache
+
+
+def _kind(key):
+    return "file" if len(key) == 64 else "domain"
+
+
+def _age(path, seconds):
+    """Make an entry look written (and last read) `seconds` ago."""
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_file_cache_round_trip_and_sharding(tmp_path):
+    cache = FileCache(str(tmp_path), kind_of=_kind)
+    size = cache.set_sync("example.com", {"a": [1, 2]})
+    assert cache.get_sync("example.com") == {"a": [1, 2]}
+    assert size == len(orjson.dumps({"a": [1, 2]}))
+    path = cache.path("example.com")
+    assert os.path.isfile(path)
+    # <dir>/<h[0:2]>/<h[2:4]>/<key>.gz
+    assert os.path.relpath(path, tmp_path).count(os.sep) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["writes"] == 1
+
+
+def test_file_cache_async_api(tmp_path):
+    cache = FileCache(str(tmp_path))
+
+    async def main():
+        await cache.set("k", [1])
+        return await cache.get("k"), await cache.get("missing")
+
+    assert asyncio.run(main()) == ([1], None)
+
+
+def test_file_cache_ttl_per_kind(tmp_path):
+    cache = FileCache(str(tmp_path), kind_of=_kind, ttls={"file": 100, "domain": 10})
+    sha256 = "a" * 64
+    cache.set_sync(sha256, 1)
+    cache.set_sync("example.com", 2)
+    _age(cache.path(sha256), 50)
+    _age(cache.path("example.com"), 50)
+    assert cache.get_sync(sha256) == 1
+    assert cache.get_sync("example.com") is None
+    assert not os.path.exists(cache.path("example.com"))
+    assert cache.stats()["expired"] == 1
+
+
+def test_file_cache_hit_keeps_write_time(tmp_path):
+    cache = FileCache(str(tmp_path), default_ttl=100)
+    cache.set_sync("k", 1)
+    _age(cache.path("k"), 50)
+    cache.get_sync("k")
+    stat = os.stat(cache.path("k"))
+    # 命中只更新访问时间，过期仍从写入时间算起
+    assert time.time() - stat.st_atime < 5
+    assert time.time() - stat.st_mtime > 40
+
+
+def test_file_cache_drops_unreadable_entry(tmp_path):
+    cache = FileCache(str(tmp_path))
+    cache.set_sync("k", 1)
+    with open(cache.path("k"), "wb") as f:
+        f.write(b"not gzip")
+    assert cache.get_sync("k") is None
+    assert not os.path.exists(cache.path("k"))
+    assert cache.stats()["errors"] == 1
+
+
+def test_file_cache_migrates_legacy_layout(tmp_path):
+    with open(tmp_path / "example.com.gz", "wb") as f:
+        f.write(gzip.compress(orjson.dumps({"legacy": True})))
+    cache = FileCache(str(tmp_path))
+    assert cache.get_sync("example.com") == {"legacy": True}
+    assert not (tmp_path / "example.com.gz").exists()
+    assert os.path.isfile(cache.path("example.com"))
+
+
+def test_file_cache_sweep_expires_and_evicts_lru(tmp_path):
+    cache = FileCache(str(tmp_path), default_ttl=100, max_bytes=10 ** 9)
+    for i in range(6):
+        cache.set_sync(f"k{i}", "x" * 1000)
+    _age(cache.path("k0"), 200)
+    result = cache.sweep()
+    assert result["expired"] == 1 and result["evicted"] == 0
+    assert not os.path.exists(cache.path("k0"))
+
+    entry_size = os.path.getsize(cache.path("k1"))
+    cache.max_bytes = entry_size * 4
+    for i, key in enumerate(["k1", "k2", "k3", "k4", "k5"]):
+        # k1 最久没被读过，k5 最近被读过
+        _age(cache.path(key), 50 - i)
+    result = cache.sweep()
+    # 淘汰到上限的 90% 以下：5 个条目只剩 3 个
+    assert result["evicted"] == 2
+    assert [cache.get_sync(k) is not None for k in ["k1", "k2", "k3", "k4", "k5"]] == \
+        [False, False, True, True, True]
+
+
+def test_file_cache_sweep_removes_stale_temp_files(tmp_path):
+    cache = FileCache(str(tmp_path))
+    cache.set_sync("k", 1)
+    tmp = cache.path("k") + ".123.abcd.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"partial")
+    _age(tmp, 7200)
+    cache.sweep()
+    assert not os.path.exists(tmp)
+    assert cache.get_sync("k") == 1
+
+
+def test_memory_cache_hit_and_ttl():
+    cache = MemoryCache(max_bytes=1000, ttl=0.05)
+    assert cache.set("k", {"a": 1})
+    assert cache.get("k") == {"a": 1}
+    assert cache.bytes == len(orjson.dumps({"a": 1}))
+    time.sleep(0.06)
+    assert cache.get("k") is None
+    assert cache.bytes == 0
+
+
+def test_memory_cache_rejects_cold_key_over_hot_set():
+    cache = MemoryCache(max_bytes=300, ttl=60)
+    for key in ("a", "b", "c"):
+        cache.set(key, key, size=100)
+        for _ in range(3):
+            cache.get(key)
+    # 从没被请求过的新键挤不掉常用的键
+    assert not cache.set("cold", "x", size=100)
+    assert cache.get("cold") is None
+    assert all(cache.get(key) == key for key in ("a", "b", "c"))
+    assert cache.stats()["rejections"] == 1
+
+
+def test_memory_cache_admits_popular_key_and_evicts_lru():
+    cache = MemoryCache(max_bytes=300, ttl=60)
+    for key in ("a", "b", "c"):
+        cache.set(key, key, size=100)
+    cache.get("b")
+    cache.get("c")
+    for _ in range(5):
+        cache.get("hot")
+    assert cache.set("hot", "h", size=100)
+    # 淘汰的是最久未用的 a
+    assert cache.get("a") is None
+    assert cache.get("hot") == "h"
+    assert cache.stats()["evictions"] == 1 and cache.bytes == 300
+
+
+def test_memory_cache_update_and_oversized_value():
+    cache = MemoryCache(max_bytes=100, ttl=60)
+    cache.set("k", 1, size=40)
+    assert cache.set("k", 2, size=60)
+    assert cache.get("k") == 2 and cache.bytes == 60
+    assert not cache.set("big", 1, size=101)
+    cache.delete("k")
+    assert cache.bytes == 0 and cache.get("k") is None
+
+
+def test_tiered_cache_fills_memory_from_disk(tmp_path):
+    disk = FileCache(str(tmp_path))
+    disk.set_sync("k", {"a": 1})
+    tiered = TieredCache(MemoryCache(max_bytes=1000, ttl=60), disk)
+
+    async def main():
+        first = await tiered.get("k")
+        second = await tiered.get("k")
+        await tiered.set("j", [1])
+        await tiered.delete("k")
+        return first, second, await tiered.get("k"), await tiered.get("j")
+
+    first, second, deleted, written = asyncio.run(main())
+    assert first == second == {"a": 1}
+    # 第二次由内存层返回，不再读盘
+    assert disk.stats()["hits"] == 1
+    assert deleted is None and written == [1]
+
+
+def test_derived_view_keys_are_versioned(tmp_path):
+    view = DerivedView("summary", 2, lambda report: {"n": len(report)})
+    assert view.key("example.com") == "example.com#summary@v2"
+    assert DerivedView("summary", 3, view.transform).key("example.com") != view.key("example.com")
+    # 视图与原始报告存在同一个缓存里，互不覆盖
+    cache = FileCache(str(tmp_path))
+    cache.set_sync("example.com", {"a": 1, "b": 2})
+    cache.set_sync(view.key("example.com"), view.transform(cache.get_sync("example.com")))
+    assert cache.get_sync(view.key("example.com")) == {"n": 2}
+    assert cache.get_sync("example.com") == {"a": 1, "b": 2}
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from engines.deadline import current_deadline, deadline, gather_until_deadline, remaining, wait_within_deadline
+from engines.exceptions import DeadlineExceededException, NotFoundException
+
+
+async def _value(value, delay=0.0):
+    await asyncio.sleep(delay)
+    return value
+
+
+async def _fail(exc, delay=0.0):
+    await asyncio.sleep(delay)
+    raise exc
+
+
+def test_nested_deadline_only_tightens():
+    with deadline(10):
+        outer = current_deadline.get()
+        with deadline(20):
+            assert current_deadline.get() == outer
+        with deadline(1):
+            assert remaining() <= 1
+        assert current_deadline.get() == outer
+    assert current_deadline.get() is None
+
+
+def test_wait_within_deadline_raises():
+    async def main():
+        with deadline(0.02):
+            await wait_within_deadline(asyncio.sleep(1), "sleep")
+
+    with pytest.raises(DeadlineExceededException):
+        asyncio.run(main())
+
+
+def test_gather_without_deadline_collects_everything():
+    async def main():
+        return await gather_until_deadline(_value(1, 0.01), _fail(ValueError("x")), _value(3))
+
+    results = asyncio.run(main())
+    assert results[0] == 1 and results[2] == 3
+    assert isinstance(results[1], ValueError)
+
+
+def test_gather_cancels_stragglers_at_deadline():
+    async def main():
+        with deadline(0.05):
+            start = time.monotonic()
+            results = await gather_until_deadline(_value(1), _value(2, 1.0))
+            return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(main())
+    assert results[0] == 1
+    assert isinstance(results[1], DeadlineExceededException)
+    assert elapsed < 0.5
+
+
+def test_gather_fail_fast_cancels_siblings():
+    def primary_not_found(index, exc):
+        return index == 0 and isinstance(exc, NotFoundException)
+
+    async def main():
+        start = time.monotonic()
+        results = await gather_until_deadline(_fail(NotFoundException("404"), 0.01), _value(2, 1.0),
+                                              fail_fast=primary_not_found)
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(main())
+    assert isinstance(results[0], NotFoundException)
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert elapsed < 0.5
+
+
+def test_gather_fail_fast_ignores_other_failures():
+    async def main():
+        return await gather_until_deadline(_value(1, 0.05), _fail(NotFoundException("404")),
+                                           fail_fast=lambda index, exc: index == 0)
+
+    results = asyncio.run(main())
+    # 只有第0个子任务的失败触发快速失败，其他失败不影响兄弟任务
+    assert results[0] == 1
+    assert isinstance(results[1], NotFoundException)
+
+
+def test_gather_cancelled_caller_cancels_subtasks():
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(1)
+        finished.append(1)
+
+    async def main():
+        task = asyncio.ensure_future(gather_until_deadline(slow(), slow()))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert finished == []
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from engines import endpoint_pool
+from engines.endpoint_pool import EndpointPool, endpoint_stats
+
+A = "https://a.example/"
+B = "https://b.example/"
+C = "https://c.example/"
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    # 统计在进程内共享，每个测试从空统计开始
+    monkeypatch.setattr(endpoint_pool, "_stats", {})
+
+
+def _fail(pool, url, times):
+    for _ in range(times):
+        pool.record(url, ok=False)
+
+
+def test_coerce_accepts_url_list_and_mapping():
+    assert EndpointPool.coerce(A).urls == [A]
+    assert EndpointPool.coerce({A: 1, B: 0}).urls == [A]
+    pool = EndpointPool([A, B], backups=[C, A])
+    assert EndpointPool.coerce(pool) is pool
+    assert pool.urls == [A, B, C] and pool.primary == A
+    with pytest.raises(ValueError):
+        EndpointPool({A: 0})
+
+
+def test_record_tracks_latency_and_errors():
+    pool = EndpointPool([A])
+    pool.record(A, 1.0)
+    pool.record(A, 2.0)
+    stats = endpoint_stats(A)
+    # 延迟取指数加权平均
+    assert stats.latency == pytest.approx(1.2)
+    pool.record(A, ok=False)
+    assert stats.error_rate == pytest.approx(1 / 3, rel=0.01)
+    assert stats.consecutive_failures == 1
+    pool.record(A, 1.0)
+    assert stats.consecutive_failures == 0
+
+
+def test_prefers_faster_end_point():
+    pool = EndpointPool([A, B])
+    pool.record(A, 0.01)
+    pool.record(B, 2.0)
+    # 两次加权随机抽样中只要有一次抽到A，A就是首选，约占3/4
+    firsts = [pool.candidates()[0] for _ in range(400)]
+    assert 250 < firsts.count(A) < 350
+
+
+def test_ejects_after_consecutive_failures():
+    pool = EndpointPool([A, B], eject_after=3, eject_for=30)
+    _fail(pool, A, 2)
+    assert A in pool.candidates()
+    pool.record(A, ok=False)
+    assert pool.candidates() == [B]
+    assert pool.stats()[A]["ejected"] and pool.stats()[A]["probing"]
+
+
+def test_probe_after_ejection_expires():
+    pool = EndpointPool([A, B], eject_after=1, eject_for=0.01)
+    pool.record(A, ok=False)
+    time.sleep(0.02)
+    # 剔除期结束后，只放行一个试探请求
+    assert pool.candidates()[0] == A
+    assert pool.candidates() == [B]
+    pool.record(A, 0.1)
+    stats = endpoint_stats(A)
+    assert not stats.probing and stats.ejections == 0
+    assert A in pool.candidates()
+
+
+def test_failed_probe_doubles_ejection():
+    pool = EndpointPool([A, B], eject_after=1, eject_for=10, max_eject_for=15)
+    pool.record(A, ok=False)
+    first = endpoint_stats(A).ejected_until - time.monotonic()
+    pool.record(A, ok=False)
+    second = endpoint_stats(A).ejected_until - time.monotonic()
+    assert 9 < first <= 10
+    # 翻倍后受 max_eject_for 限制
+    assert 14 < second <= 15
+
+
+def test_backups_only_when_primaries_ejected():
+    pool = EndpointPool([A], backups=[B], eject_after=1)
+    assert pool.candidates() == [A, B]
+    pool.record(A, ok=False)
+    assert pool.candidates() == [B]
+    pool.record(B, ok=False)
+    assert pool.candidates() == []
+    # 全部被剔除时，选最早恢复的一个
+    assert pool.choose() == A
+
+
+def test_stats_are_shared_between_pools():
+    first = EndpointPool([A, B], eject_after=2)
+    second = EndpointPool([A, C], eject_after=2)
+    _fail(first, A, 2)
+    assert second.candidates() == [C]
+    assert second.stats()[A]["ejections"] == 1
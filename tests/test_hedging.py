@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+from engines.exceptions import ClientSearchException, NotFoundException
+from engines.hedging import HedgeBudget, HedgePolicy, path_kind
+
+
+def _policy(delay=0.02, ratio=1.0, **kwargs):
+    return HedgePolicy(initial_delay=delay, budget=HedgeBudget(ratio=ratio, burst=kwargs.pop("burst", 10.0)),
+                       **kwargs)
+
+
+def _request(value, delay, log=None, name=None, error=None):
+    """A request coroutine factory that logs its start time, cancellation and finish."""
+    async def request():
+        if log is not None:
+            log.append((name, "start", time.monotonic()))
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append((name, "cancelled", time.monotonic()))
+            raise
+        if error is not None:
+            raise error
+        return value
+
+    return request
+
+
+def test_fast_primary_is_not_hedged():
+    policy = _policy(delay=0.2)
+    log = []
+
+    async def main():
+        return await policy.run(_request("primary", 0.01), _request("hedge", 0, log, "hedge"))
+
+    assert asyncio.run(main()) == "primary"
+    assert log == []
+    assert policy.budget.hedges == 0 and policy.budget.requests == 1
+
+
+def test_hedge_fires_after_delay_and_loser_is_cancelled():
+    policy = _policy(delay=0.05)
+    log = []
+
+    async def main():
+        start = time.monotonic()
+        result = await policy.run(_request("primary", 1.0, log, "primary"), _request("hedge", 0.01, log, "hedge"))
+        # 让被取消的任务运行到取消点
+        await asyncio.sleep(0.01)
+        return start, result
+
+    start, result = asyncio.run(main())
+    assert result == "hedge"
+    events = {(name, event): at for name, event, at in log}
+    assert events[("hedge", "start")] - start >= 0.05
+    assert ("primary", "cancelled") in events
+    assert policy.budget.hedges == 1 and policy.budget.wins == 1
+
+
+def test_budget_limits_hedges_to_ratio():
+    policy = _policy(delay=0.005, ratio=0.25, burst=1.0)
+
+    async def main():
+        for _ in range(20):
+            await policy.run(_request("primary", 0.02), _request("hedge", 0))
+
+    asyncio.run(main())
+    # 每个主请求存入0.25个令牌，20个请求最多对冲5次
+    assert policy.budget.hedges == 5
+    assert policy.budget.denied == 15
+    assert policy.budget.requests == 20
+
+
+def test_not_found_is_an_answer():
+    policy = _policy(delay=0.01)
+
+    async def main():
+        return await policy.run(_request("primary", 1.0), _request(None, 0, error=NotFoundException("404")))
+
+    with pytest.raises(NotFoundException):
+        asyncio.run(main())
+
+
+def test_error_waits_for_other_side():
+    policy = _policy(delay=0.01)
+
+    async def main():
+        return await policy.run(_request("primary", 0.05), _request(None, 0, error=ClientSearchException("502")))
+
+    # 对冲请求失败后继续等主请求
+    assert asyncio.run(main()) == "primary"
+    assert policy.budget.wins == 0
+
+
+def test_delay_follows_percentile_per_key():
+    policy = _policy(delay=1.0, percentile=0.9, min_samples=10, min_delay=0.05)
+    tracker = policy._tracker("ui/files/*")
+    for i in range(10):
+        tracker.add(i / 10)
+    assert policy.delay("ui/files/*") == pytest.approx(0.9)
+    # 样本不足时用初始延迟
+    assert policy.delay("ui/domains/*") == 1.0
+    for _ in range(10):
+        policy._tracker("fast").add(0.001)
+    assert policy.delay("fast") == 0.05
+
+
+def test_path_kind_buckets_by_relationship():
+    assert path_kind("ui/files/abc/behaviours?limit=40") == "ui/files/*/behaviours"
+    assert path_kind("/ui/domains/example.com/") == "ui/domains/*"
+    assert path_kind("ui/search") == "ui/search"
@@ -0,0 +1,96 @@
+import pytest
+
+from engines import endpoint_pool, proxy_pool
+from engines.proxy_pool import ProxyPool
+
+P1 = "socks5://10.0.0.1:1080"
+P2 = "socks5://10.0.0.2:1080"
+
+
+class _Timer:
+    """Records scheduled re-tests instead of starting a thread."""
+
+    scheduled = []
+
+    def __init__(self, delay, func, args):
+        self.delay, self.func, self.args = delay, func, args
+        self.daemon = False
+
+    def start(self):
+        _Timer.scheduled.append(self)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(endpoint_pool, "_stats", {})
+    monkeypatch.setattr(proxy_pool, "_pools", {})
+    monkeypatch.setattr(proxy_pool.threading, "Timer", _Timer)
+    _Timer.scheduled = []
+
+
+def test_failed_request_schedules_retest():
+    pool = ProxyPool([P1, P2], eject_after=2, eject_for=30)
+    pool.record(P1, ok=False)
+    assert _Timer.scheduled == []
+    pool.record(P1, ok=False)
+    assert pool.candidates() == [P2]
+    assert len(_Timer.scheduled) == 1
+    timer = _Timer.scheduled[0]
+    assert timer.daemon and timer.args == (P1,) and 29 < timer.delay <= 30
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_quarantined_proxy_gets_no_live_probe():
+    pool = ProxyPool([P1, P2], eject_after=1, eject_for=0)
+    pool.record(P1, ok=False)
+    # 隔离期已过，但只有后台测试通过才放回轮转
+    assert pool.candidates() == [P2]
+
+
+def test_passing_retest_restores_proxy(monkeypatch):
+    calls = []
+
+    def get(url, proxies=None, **kwargs):
+        calls.append((url, proxies))
+        return _Response(204)
+
+    monkeypatch.setattr(proxy_pool.requests, "get", get)
+    pool = ProxyPool([P1, P2], eject_after=1, test_url="https://probe.example/")
+    pool.record(P1, ok=False)
+    _Timer.scheduled[0].func(*_Timer.scheduled[0].args)
+    assert calls == [("https://probe.example/", {"all": P1})]
+    assert sorted(pool.candidates()) == [P1, P2]
+    assert not pool.stats()[P1]["probing"]
+
+
+def test_failing_retest_doubles_quarantine(monkeypatch):
+    def get(url, **kwargs):
+        raise ConnectionError("refused")
+
+    monkeypatch.setattr(proxy_pool.requests, "get", get)
+    pool = ProxyPool([P1, P2], eject_after=1, eject_for=10)
+    pool.record(P1, ok=False)
+    _Timer.scheduled[0].func(*_Timer.scheduled[0].args)
+    # 再次失败加倍隔离时间，并重新安排测试
+    assert len(_Timer.scheduled) == 2
+    assert 19 < _Timer.scheduled[1].delay <= 20
+    assert pool.candidates() == [P2]
+
+
+def test_retest_is_scheduled_once():
+    pool = ProxyPool([P1, P2], eject_after=1)
+    for _ in range(3):
+        pool.record(P1, ok=False)
+    assert len(_Timer.scheduled) == 1
+
+
+def test_registry_reuses_pool_per_proxy_list():
+    pool = proxy_pool.proxy_pool(f"{P1}, {P2}")
+    assert proxy_pool.proxy_pool([P1, P2]) is pool
+    assert proxy_pool.proxy_pool(pool) is pool
+    assert proxy_pool.proxy_pool([P2, P1]) is not pool
+    assert pool.urls == [P1, P2]
@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+from engines.metrics import HOST_IN_FLIGHT_LIMIT
+from engines.ratelimit import HostLimiter, InFlightLimiter, RateLimiterRegistry, TokenBucket
+
+
+def test_token_bucket_burst_is_free():
+    bucket = TokenBucket(rate=10, burst=5)
+    waits = [bucket._reserve() for _ in range(5)]
+    assert waits == [0.0] * 5
+
+
+def test_token_bucket_paces_after_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    waits = [bucket._reserve() for _ in range(6)]
+    assert waits[:2] == [0.0, 0.0]
+    # 每个超出突发量的调用者多等 1/rate 秒，均匀排开而不是一起重试
+    for previous, wait in zip(waits[2:], waits[3:]):
+        assert abs(wait - previous - 0.1) < 0.01
+
+
+def test_token_bucket_acquire_sleeps():
+    bucket = TokenBucket(rate=20, burst=1)
+
+    async def main():
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(5)))
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(main())
+    assert 0.17 <= elapsed < 0.5
+
+
+def test_in_flight_limiter_caps_concurrency():
+    limiter = InFlightLimiter(2)
+    peak = 0
+
+    async def worker():
+        nonlocal peak
+        await limiter.acquire()
+        try:
+            peak = max(peak, limiter.active)
+            await asyncio.sleep(0.01)
+        finally:
+            limiter.release()
+
+    async def main():
+        await asyncio.gather(*(worker() for _ in range(10)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.active == 0
+    assert limiter.waiting == 0
+
+
+def test_in_flight_limiter_cancelled_waiter_frees_slot():
+    limiter = InFlightLimiter(1)
+
+    async def main():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), 1)
+        limiter.release()
+
+    asyncio.run(main())
+    assert limiter.active == 0
+
+
+def test_registry_groups_and_default():
+    registry = RateLimiterRegistry()
+    registry.load_env("a.example,b.example=5/10/8;*=50")
+    group = registry.get("https://a.example/path")
+    assert group is registry.get("b.example")
+    assert group.bucket.rate == 5 and group.in_flight.limit == 8
+    other = registry.get("c.example")
+    assert other is not group and other.bucket.rate == 50
+    assert registry.get("c.example") is other
+
+
+def test_host_limiter_releases_slot_on_exit():
+    limiter = HostLimiter(rate=1000, max_in_flight=1)
+
+    async def main():
+        async with limiter:
+            assert limiter.in_flight.active == 1
+        assert limiter.in_flight.active == 0
+
+    asyncio.run(main())
+
+
+def _adaptive(start=8, max_limit=32):
+    limiter = HostLimiter(max_in_flight=start, max_limit=max_limit, name="test.example")
+    return limiter, limiter.adaptive
+
+
+def test_aimd_additive_increase():
+    limiter, adaptive = _adaptive(start=4)
+    # 每个成功响应加 1/window，一个窗口的响应约加一
+    for _ in range(4 + 5):
+        limiter.record(200, 0.1)
+    assert 5.5 < adaptive.window < 6
+    assert limiter.in_flight.limit == 5
+
+
+def test_aimd_increase_stops_at_max_limit():
+    limiter, adaptive = _adaptive(start=4, max_limit=6)
+    for _ in range(200):
+        limiter.record(200, 0.1)
+    assert adaptive.window == 6
+    assert limiter.in_flight.limit == 6
+
+
+def test_aimd_multiplicative_decrease_once_per_rtt():
+    limiter, adaptive = _adaptive(start=16)
+    limiter.record(200, 0.5)
+    window = adaptive.window
+    limiter.record(429, 0.5)
+    assert adaptive.window == window / 2
+    assert limiter.in_flight.limit == int(window / 2)
+    # 同一阵429只算一次
+    limiter.record(429, 0.5)
+    limiter.record(403, 0.5)
+    assert adaptive.decreases == 1
+
+
+def test_aimd_latency_spike_and_timeout_decrease():
+    limiter, adaptive = _adaptive(start=16)
+    limiter.record(200, 0.01)
+    limiter.record(200, 1.0)
+    assert adaptive.decreases == 1
+    adaptive._last_decrease = 0.0
+    limiter.record_error(Exception("Operation timed out"))
+    assert adaptive.decreases == 2
+    limiter.record_error(Exception("connection refused"))
+    assert adaptive.decreases == 2
+
+
+def test_aimd_never_below_min_limit():
+    limiter = HostLimiter(max_in_flight=2, max_limit=8, min_in_flight=2)
+    for _ in range(5):
+        limiter.adaptive._last_decrease = 0.0
+        limiter.record(429, 0.1)
+    assert limiter.in_flight.limit == 2
+
+
+def test_aimd_window_exported_as_gauge():
+    limiter, adaptive = _adaptive(start=8)
+    limiter.record(429, 0.1)
+    values = dict((tuple(k), v) for k, v in HOST_IN_FLIGHT_LIMIT.snapshot()["values"])
+    assert values[("test.example",)] == 4
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from engines.deadline import deadline
+from engines.exceptions import (ClientSearchException, NotFoundException, RatelimitException, TimeoutException)
+from engines.retry import CircuitBreaker, RetryPolicy
+
+
+def _flaky(*errors, result="ok"):
+    """A task that raises `errors` one per call, then returns `result`."""
+    calls = []
+
+    async def task():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return task, calls
+
+
+def _policy(**kwargs):
+    # 不真的等待退避时间
+    return RetryPolicy(base=0, **kwargs)
+
+
+def test_retries_until_success():
+    task, calls = _flaky(ClientSearchException("a"), ClientSearchException("b"))
+    assert asyncio.run(_policy(max_attempts=3).run(task)) == "ok"
+    assert len(calls) == 3
+
+
+def test_not_found_is_not_retried():
+    task, calls = _flaky(NotFoundException("404"))
+    with pytest.raises(NotFoundException):
+        asyncio.run(_policy(max_attempts=5).run(task))
+    assert len(calls) == 1
+
+
+def test_budget_is_per_error_class():
+    # 超时只允许重试一次，第二次超时直接失败，即使总次数还没用完
+    task, calls = _flaky(TimeoutException("t1"), TimeoutException("t2"))
+    with pytest.raises(TimeoutException):
+        asyncio.run(_policy(max_attempts=5).run(task))
+    assert len(calls) == 2
+
+
+def test_budgets_of_different_classes_add_up():
+    task, calls = _flaky(TimeoutException("t"), RatelimitException("429"), RatelimitException("429"))
+    assert asyncio.run(_policy(max_attempts=5).run(task)) == "ok"
+    assert len(calls) == 4
+
+
+def test_max_attempts_caps_all_classes():
+    task, calls = _flaky(TimeoutException("t"), RatelimitException("429"), RatelimitException("429"))
+    with pytest.raises(RatelimitException):
+        asyncio.run(_policy(max_attempts=3).run(task))
+    assert len(calls) == 3
+
+
+def test_most_specific_class_wins():
+    policy = _policy(retries_per_class={ClientSearchException: 3, RatelimitException: 0})
+    assert policy.retries_for(RatelimitException()) == 0
+    assert policy.retries_for(TimeoutException()) == 3
+    assert policy.retries_for(ValueError()) == 0
+
+
+def test_no_retry_when_backoff_passes_deadline(monkeypatch):
+    policy = RetryPolicy(max_attempts=5)
+    monkeypatch.setattr(policy, "backoff", lambda attempt: 1.0)
+    task, calls = _flaky(ClientSearchException("a"))
+
+    async def main():
+        with deadline(0.05):
+            return await policy.run(task)
+
+    with pytest.raises(ClientSearchException):
+        asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(base=1, cap=2)
+    assert all(0 <= policy.backoff(attempt) <= 2 for attempt in range(1, 10))
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.01)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    time.sleep(0.02)
+    # 冷却后只放行一个试探请求
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
@@ -0,0 +1,60 @@
+import asyncio
+import gzip
+import importlib
+
+import orjson
+import pytest
+
+from engines.search.vt import VTReport
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+    module = importlib.import_module("main")
+    monkeypatch.setattr(module, "search_vt_bodies", module.MemoryCache(ttl=60, name="search_vt_test"))
+    return module
+
+
+def _fake_vt(result):
+    class FakeVT:
+        calls = 0
+
+        def __init__(self, **kwargs):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def aapi(self, q):
+            FakeVT.calls += 1
+            return result
+
+    return FakeVT
+
+
+def test_complete_report_body_is_cached(main, monkeypatch):
+    report = VTReport({"data": {"id": "example.com"}})
+    monkeypatch.setattr(main, "VT", _fake_vt(report))
+    body = asyncio.run(main.search_vt_body("example.com"))
+    assert orjson.loads(gzip.decompress(body)) == report
+    assert main.search_vt_bodies.get("example.com") == body
+
+
+def test_incomplete_report_is_not_cached(main, monkeypatch):
+    report = VTReport({"data": {}})
+    report.complete = False
+    monkeypatch.setattr(main, "VT", _fake_vt(report))
+    asyncio.run(main.search_vt_body("example.com"))
+    assert main.search_vt_bodies.get("example.com") is None
+
+
+def test_list_result_is_not_cached(main, monkeypatch):
+    # 评论列表没有完整性标记，每次都重新查询
+    monkeypatch.setattr(main, "VT", _fake_vt([{"id": "c1"}, {"id": "c2"}]))
+    body = asyncio.run(main.search_vt_body("comments"))
+    assert orjson.loads(gzip.decompress(body)) == [{"id": "c1"}, {"id": "c2"}]
+    assert main.search_vt_bodies.get("comments") is None
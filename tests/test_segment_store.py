@@ -0,0 +1,134 @@
+import asyncio
+import gzip
+import os
+import time
+
+import orjson
+
+from engines import segment_store
+from engines.segment_store import SegmentStore
+
+
+def _store(path, **kwargs):
+    kwargs.setdefault("max_bytes", 10 ** 9)
+    return SegmentStore(str(path), **kwargs)
+
+
+def test_round_trip_and_overwrite(tmp_path):
+    store = _store(tmp_path)
+    size = store.set_sync("example.com", {"a": 1})
+    assert size == len(orjson.dumps({"a": 1}))
+    assert store.get_sync("example.com") == {"a": 1}
+    store.set_sync("example.com", {"a": 2})
+    assert store.get_sync("example.com") == {"a": 2}
+    assert store.get_sync("missing") is None
+    assert gzip.decompress(store.get_raw_sync("example.com")) == orjson.dumps({"a": 2})
+    assert store.stats()["writes"] == 2
+
+
+def test_async_api(tmp_path):
+    store = _store(tmp_path)
+
+    async def main():
+        await store.set("k", [1, 2])
+        return await store.get("k")
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_reopen_sees_existing_entries(tmp_path):
+    store = _store(tmp_path)
+    for i in range(50):
+        store.set_sync(f"k{i}", i)
+    reopened = _store(tmp_path)
+    assert [reopened.get_sync(f"k{i}") for i in range(50)] == list(range(50))
+    # 另一个实例（另一个worker）的写入立即可见
+    reopened.set_sync("new", "x")
+    assert store.get_sync("new") == "x"
+
+
+def test_delete_leaves_tombstone(tmp_path):
+    store = _store(tmp_path)
+    store.set_sync("a", 1)
+    store.set_sync("b", 2)
+    store.delete("a")
+    assert store.get_sync("a") is None
+    assert store.get_sync("b") == 2
+    store.set_sync("a", 3)
+    assert store.get_sync("a") == 3
+
+
+def test_ttl_from_record_write_time(tmp_path):
+    store = _store(tmp_path, kind_of=lambda key: "domain", ttls={"domain": 100})
+    store.put_raw("old", gzip.compress(b"1"), written_at=time.time() - 200)
+    store.put_raw("new", gzip.compress(b"2"), written_at=time.time() - 50)
+    assert store.get_sync("old") is None
+    assert store.get_sync("new") == 2
+    assert store.stats()["expired"] == 1
+
+
+def test_corrupt_record_is_a_miss(tmp_path):
+    store = _store(tmp_path)
+    store.set_sync("k", "value")
+    segment = store._segment_path(store._segments()[-1])
+    with open(segment, "r+b") as f:
+        f.seek(-3, os.SEEK_END)
+        f.write(b"xxx")
+    assert store.get_sync("k") is None
+    assert store.stats()["errors"] == 1
+
+
+def test_compaction_moves_live_records(tmp_path):
+    store = _store(tmp_path, segment_bytes=2000)
+    for i in range(40):
+        store.set_sync(f"k{i}", "x" * 100)
+    # 覆盖大部分键，旧段里只剩少量有效记录
+    for i in range(35):
+        store.set_sync(f"k{i}", "y" * 100)
+    before = store._segments()
+    result = store.compact()
+    after = store._segments()
+    assert result["moved"] > 0
+    assert before[0] not in after
+    assert [store.get_sync(f"k{i}") for i in range(40)] == ["y" * 100] * 35 + ["x" * 100] * 5
+
+
+def test_compaction_drops_expired_records(tmp_path):
+    store = _store(tmp_path, segment_bytes=500, default_ttl=100)
+    store.put_raw("old", gzip.compress(b'"o"'), written_at=time.time() - 200)
+    for _ in range(2):
+        for i in range(20):
+            store.set_sync(f"k{i}", "x" * 50)
+    result = store.compact()
+    # 过期记录所在的段被压缩时，过期记录不再搬到新段
+    assert result["expired"] == 1
+    assert store.get_sync("old") is None
+    assert store.get_sync("k19") == "x" * 50
+
+
+def test_eviction_drops_oldest_segments(tmp_path):
+    store = _store(tmp_path, segment_bytes=1000)
+    for i in range(60):
+        store.set_sync(f"k{i}", os.urandom(100).hex())
+    segments = store._segments()
+    assert len(segments) > 3
+    store.max_bytes = 2500
+    result = store.compact()
+    assert result["evicted"] > 0
+    assert store._segments()[0] > segments[0]
+    # 最早写入的键随最旧的段一起被淘汰，最新的还在
+    assert store.get_sync("k0") is None
+    assert store.get_sync("k59") is not None
+
+
+def test_index_grows_and_old_mapping_is_retired(tmp_path, monkeypatch):
+    monkeypatch.setattr(segment_store, "_INITIAL_CAPACITY", 16)
+    store = _store(tmp_path)
+    other = _store(tmp_path)
+    for i in range(100):
+        store.set_sync(f"k{i}", i)
+    assert store.stats()["index_slots"] >= 128
+    assert [store.get_sync(f"k{i}") for i in range(100)] == list(range(100))
+    # 另一个实例发现旧索引已退役，重新映射新索引
+    assert [other.get_sync(f"k{i}") for i in range(100)] == list(range(100))
+    assert other.stats()["index_slots"] == store.stats()["index_slots"]
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from engines.deadline import deadline, wait_within_deadline
+from engines.exceptions import DeadlineExceededException
+from engines.singleflight import SingleFlight, freeze
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return {"calls": calls}
+
+    async def main():
+        return await asyncio.gather(*(flights.do("k", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert all(r is results[0] for r in results)
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "followers": 4, "bypassed": 0}
+
+
+def test_exception_is_shared():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(flights.do("k", fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_key_is_released_after_call():
+    flights = SingleFlight()
+
+    async def fetch():
+        return 1
+
+    async def main():
+        await flights.do("k", fetch)
+        await flights.do("k", fetch)
+
+    asyncio.run(main())
+    assert flights.leaders == 2
+    assert len(flights) == 0
+
+
+def test_cancelled_leader_hands_over_to_follower():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("k", fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.do("k", fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    # 跟随者重新当选leader，自己发起调用，而不是收到leader的取消
+    assert asyncio.run(main()) == 2
+
+
+def test_cancelled_follower_does_not_cancel_leader():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.03)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("k", fetch))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+        return await leader
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_follower_retries_after_leader_deadline():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await wait_within_deadline(asyncio.sleep(0.05))
+        return calls
+
+    async def tight():
+        with deadline(0.01):
+            return await flights.do("k", fetch)
+
+    async def main():
+        leader = asyncio.ensure_future(tight())
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("k", fetch))
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader, follower = asyncio.run(main())
+    # leader 超时失败；跟随者没有截止时间，重新发起调用
+    assert isinstance(leader, DeadlineExceededException)
+    assert follower == 2
+
+
+def test_partial_results_not_shared_under_deadline():
+    flights = SingleFlight(partial_results=True)
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return calls
+
+    async def with_deadline():
+        with deadline(1):
+            return await flights.do("k", fetch)
+
+    async def main():
+        return await asyncio.gather(flights.do("k", fetch), flights.do("k", fetch), with_deadline())
+
+    results = asyncio.run(main())
+    assert calls == 2
+    assert results[0] == results[1]
+    assert flights.stats()["bypassed"] == 1
+
+
+def test_freeze_is_hashable_and_order_independent():
+    a = freeze({"b": [1, {"c": 2}], "a": bytearray(b"x")})
+    b = freeze({"a": b"x", "b": (1, {"c": 2})})
+    assert hash(a) == hash(b) and a == b